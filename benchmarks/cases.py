@@ -0,0 +1,193 @@
+# brief: 基准测试的用例
+import itertools
+from datetime import datetime
+from mysqlstream.field_type import StringType, IntegerType, TextType, DatetimeType
+from mysqlstream.models import Model
+from mysqlstream.mysql_db_pool import MySqlDBPool
+from mysqlstream.mysql_executor import MysqlExecutor
+
+WIDE_COLUMNS = 40  # 宽表的列数(不包括主键)
+CREATE_TS = datetime(2020, 9, 23, 16, 48, 33).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Context:
+    """
+    用例共享的配置和model类
+    """
+
+    def __init__(self, database, rows, batch_size):
+        """
+        :param database  基准测试使用的库名，其中的表会被删除重建
+        :param rows  预先写入的行数
+        :param batch_size  批量插入和宽表解码每次的行数
+        """
+        self.database = database
+        self.rows = rows
+        self.batch_size = batch_size
+        self.user_class = _define_user(f'{database}.bench_user')
+        self.insert_class = _define_user(f'{database}.bench_insert')
+        self.wide_class = _define_wide(f'{database}.bench_wide')
+
+
+def _define_user(table):
+    class BenchUser(Model):
+        __table__ = table
+
+        id = IntegerType('id', primary_key=True)
+        name = StringType('name', default='')
+        age = IntegerType('age')
+        urls = TextType()
+        create_ts = DatetimeType()
+
+    return BenchUser
+
+
+def _define_wide(table):
+    attrs = {'__table__': table, 'id': IntegerType('id', primary_key=True)}
+    for i in range(WIDE_COLUMNS):
+        if i % 4 == 3:
+            attrs[f'c{i}'] = TextType()
+        else:
+            attrs[f'c{i}'] = IntegerType() if i % 2 else StringType()
+    return type('BenchWide', (Model,), attrs)
+
+
+def prepare(ctx):
+    """
+    创建基准测试的表，并写入ctx.rows行数据
+    """
+    MysqlExecutor.execute(f'create database if not exists {ctx.database}', None)
+    for table in ('bench_user', 'bench_insert'):
+        MysqlExecutor.execute(f'drop table if exists {ctx.database}.{table}', None)
+        MysqlExecutor.execute(f"""create table {ctx.database}.{table} (
+                                      id int(11) not null auto_increment,
+                                      name varchar(32) not null,
+                                      age int(3) not null,
+                                      urls text,
+                                      create_ts timestamp not null default current_timestamp,
+                                      primary key (id)
+                                  ) engine=InnoDB default charset=utf8mb4""", None)
+    user_class = ctx.user_class
+    users = [user_class(id=i, name=f'name{i}', age=i % 100, urls={'i': i}, create_ts=CREATE_TS)
+             for i in range(1, ctx.rows + 1)]
+    user_class().save_many(users)
+
+
+def cleanup(ctx):
+    """
+    删除基准测试的表
+    """
+    for table in ('bench_user', 'bench_insert'):
+        MysqlExecutor.execute(f'drop table if exists {ctx.database}.{table}', None)
+
+
+def case_get(ctx):
+    """
+    按主键获取单行(Model.get)
+    """
+    ids = itertools.cycle(range(1, ctx.rows + 1))
+    user = ctx.user_class()
+    return lambda: user.get(next(ids)), 1
+
+
+def case_large_fetch(ctx):
+    """
+    读取整张表并转成model对象(Model.query_all)，ops为行数
+    """
+    user = ctx.user_class()
+    return lambda: user.query_all(), ctx.rows
+
+
+def case_large_fetch_raw(ctx):
+    """
+    读取整张表的dict行(MysqlExecutor.query_multi_rows)，ops为行数
+    """
+    sql = f'select id,name,age,urls,create_ts from {ctx.database}.bench_user'
+    return lambda: MysqlExecutor.query_multi_rows(sql, None), ctx.rows
+
+
+def case_bulk_insert(ctx):
+    """
+    批量插入(Model.save_many)，ops为行数
+    """
+    ids = itertools.count(1)
+    insert_class = ctx.insert_class
+
+    def run():
+        users = [insert_class(id=next(ids), name='name', age=1, urls={}, create_ts=CREATE_TS)
+                 for _ in range(ctx.batch_size)]
+        insert_class().save_many(users)
+
+    return run, ctx.batch_size
+
+
+def case_transaction(ctx):
+    """
+    两条update语句的事务(MysqlExecutor.transaction_execute)，和--threads一起测试并发的吞吐量
+    """
+    ids = itertools.cycle(range(1, ctx.rows, 2))
+    sql = f'update {ctx.database}.bench_user set age=age+1 where id=%s'
+
+    def run():
+        i = next(ids)
+        MysqlExecutor.transaction_execute([sql, sql], [[i], [i + 1]])
+
+    return run, 1
+
+
+def case_wide_hydration(ctx):
+    """
+    宽表的行解码成model对象(不访问数据库)，ops为行数
+    """
+    wide_class = ctx.wide_class
+    row = [1]
+    for i in range(WIDE_COLUMNS):
+        if i % 4 == 3:
+            row.append('{"k": [1, 2, 3]}')
+        else:
+            row.append(i if i % 2 else f'value{i}')
+    rows = [tuple([n] + row[1:]) for n in range(ctx.batch_size)]
+    wide = wide_class()
+    return lambda: [wide._row2obj(r) for r in rows], ctx.batch_size
+
+
+def case_sql_assembly(ctx):
+    """
+    构造query_all()的sql(不访问数据库)
+    """
+    user = ctx.user_class()
+    kwargs = dict(order_by='id desc', limit=(10, 20))
+    return lambda: user._query_all_sql('age>%s and name like %s', [10, 'name%'], kwargs), 1
+
+
+def case_encode(ctx):
+    """
+    编码model对象的insert参数(不访问数据库)
+    """
+    user = ctx.user_class(id=1, name='name1', age=10, urls={'a': [1, 2, 3]}, create_ts=CREATE_TS)
+    return user._insert_args, 1
+
+
+def case_pool_checkout(ctx):
+    """
+    从连接池获取并归还连接
+    """
+    def run():
+        with MySqlDBPool():
+            pass
+
+    return run, 1
+
+
+# 用例名称和(用例函数, 迭代次数的比例, 是否使用--threads并发)的映射，读写整张表的用例迭代次数更少，不访问数据库的用例更多
+CASES = {
+    'get': (case_get, 1, False),
+    'large_fetch': (case_large_fetch, 0.05, False),
+    'large_fetch_raw': (case_large_fetch_raw, 0.05, False),
+    'bulk_insert': (case_bulk_insert, 0.05, False),
+    'transaction': (case_transaction, 1, True),
+    'pool_checkout': (case_pool_checkout, 1, True),
+    'wide_hydration': (case_wide_hydration, 0.05, False),
+    'sql_assembly': (case_sql_assembly, 100, False),
+    'encode': (case_encode, 100, False),
+}
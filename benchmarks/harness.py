@@ -0,0 +1,115 @@
+# brief: 基准测试的计时、统计和对比工具
+import math
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def peak_rss_kb():
+    """
+    进程的内存峰值(KB)，不支持的平台返回None
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOS的单位是字节
+
+
+def percentile(samples, p):
+    """
+    排好序的样本的百分位数(最近秩法)
+    """
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(p * len(samples)) - 1)]
+
+
+def run_case(fn, iterations, warmup=0, threads=1, ops_per_call=1):
+    """
+    执行基准测试
+    :param fn: 无参数的被测函数，多线程时每个线程各自调用
+    :param iterations: 每个线程调用fn的次数
+    :param warmup: 每个线程预热调用的次数(不计入结果)
+    :param threads: 并发的线程数
+    :param ops_per_call: 每次调用包含的操作数(例如批量插入的行数)，用于计算ops_per_sec
+    :return: ops_per_sec, 每次调用的延迟百分位数(秒), 内存峰值
+    :rtype: dict
+    """
+    latencies = []
+    lock = threading.Lock()
+    started = []  # 所有线程预热结束的时间
+    barrier = threading.Barrier(threads, action=lambda: started.append(time.perf_counter()))
+
+    def worker():
+        for _ in range(warmup):
+            fn()
+        barrier.wait()
+        local = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads - 1)]
+    for w in workers:
+        w.start()
+    worker()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started[0]
+
+    latencies.sort()
+    calls = len(latencies)
+    return dict(iterations=calls,
+                threads=threads,
+                ops_per_sec=calls * ops_per_call / elapsed if elapsed else 0.0,
+                p50=percentile(latencies, 0.5),
+                p95=percentile(latencies, 0.95),
+                p99=percentile(latencies, 0.99),
+                peak_rss_kb=peak_rss_kb())
+
+
+def median_run(runs):
+    """
+    多次执行中ops_per_sec为中位数的结果
+    """
+    runs = sorted(runs, key=lambda r: r['ops_per_sec'])
+    return runs[len(runs) // 2]
+
+
+def environment():
+    """
+    运行环境的信息，写入结果文件
+    """
+    import mysqlstream
+    return dict(python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                mysqlstream=mysqlstream.__version__,
+                time=datetime.now().isoformat(timespec='seconds'))
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    和保存的基线结果对比
+    :param results: 本次的结果，case名称和run_case()返回值的映射
+    :param baseline: 基线的结果，格式相同
+    :param tolerance: 允许的ops_per_sec下降比例
+    :return: 对比的行(case, 基线ops/s, 本次ops/s, 变化比例, 是否退化)的list
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base['ops_per_sec']:
+            continue
+        change = result['ops_per_sec'] / base['ops_per_sec'] - 1
+        rows.append((name, base['ops_per_sec'], result['ops_per_sec'], change, change < -tolerance))
+    return rows
@@ -0,0 +1,120 @@
+# brief: 基准测试的入口
+"""
+执行基准测试，结果以JSON格式输出，可以和保存的基线结果对比
+
+例如：
+    # 在本地的MySQL上执行所有用例，结果保存为baseline.json
+    python benchmarks/run.py --host 127.0.0.1 --port 3306 --username chong --output baseline.json
+
+    # 修改代码后再次执行，和基线对比，ops/sec下降超过10%时返回码为1
+    python benchmarks/run.py --username chong --compare baseline.json --tolerance 0.1
+
+    # 只执行部分用例，事务用例使用8个线程
+    python benchmarks/run.py --username chong --cases get,transaction --threads 8
+
+    # 没有MySQL时使用进程内的模拟服务器，每个命令注入0.5ms的延迟
+    python benchmarks/run.py --fake --latency 0.0005
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mysqlstream.mysql_db_pool import MySqlDBPool  # noqa: E402
+from mysqlstream.fake_mysql_server import FakeMysqlServer  # noqa: E402
+from benchmarks.cases import CASES, Context, prepare, cleanup  # noqa: E402
+from benchmarks.harness import run_case, median_run, environment, compare  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='mysqlstream benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--username', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--fake', action='store_true', help='使用进程内的模拟服务器，忽略连接参数')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟服务器每个命令注入的延迟(秒)')
+    parser.add_argument('--bandwidth', type=int, help='模拟服务器的带宽上限(字节/秒)')
+    parser.add_argument('--database', default='mysqlstream_bench', help='基准测试使用的库，其中的表会被删除重建')
+    parser.add_argument('--cases', default=','.join(CASES), help='逗号分隔的用例名称')
+    parser.add_argument('--iterations', type=int, default=200, help='每个用例的基准迭代次数')
+    parser.add_argument('--warmup', type=int, default=10, help='每个线程预热的次数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例重复执行的次数，取ops/sec的中位数')
+    parser.add_argument('--threads', type=int, default=4, help='并发用例的线程数')
+    parser.add_argument('--rows', type=int, default=10000, help='预先写入的行数')
+    parser.add_argument('--batch-size', type=int, default=1000, help='批量插入和宽表解码每次的行数')
+    parser.add_argument('--output', help='结果写入的JSON文件，默认输出到stdout')
+    parser.add_argument('--compare', help='对比的基线JSON文件')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='对比时允许的ops/sec下降比例')
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """
+    执行选中的用例
+    :return: 用例名称和结果的映射
+    """
+    names = [n for n in args.cases.split(',') if n]
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        raise ValueError(f'cases:{unknown} is incorrect !')
+
+    server = None
+    if args.fake:
+        server = FakeMysqlServer(latency=args.latency, bandwidth=args.bandwidth, seed=0).start()
+        cfg = server.pool_config()
+    else:
+        cfg = dict(host=args.host, port=args.port, username=args.username, password=args.password)
+    MySqlDBPool.init_pool(1, max(args.threads, 1) + 1, **cfg, blocking=True)
+    ctx = Context(args.database, args.rows, args.batch_size)
+    results = {}
+    try:
+        prepare(ctx)
+        for name in names:
+            factory, scale, threaded = CASES[name]
+            fn, ops_per_call = factory(ctx)
+            iterations = max(1, int(args.iterations * scale))
+            runs = [run_case(fn, iterations, warmup=args.warmup,
+                             threads=args.threads if threaded else 1,
+                             ops_per_call=ops_per_call) for _ in range(max(args.repeat, 1))]
+            results[name] = median_run(runs)
+            print(f"{name:<16} {results[name]['ops_per_sec']:>14,.1f} ops/s  "
+                  f"p50 {results[name]['p50'] * 1000:.3f}ms  p99 {results[name]['p99'] * 1000:.3f}ms",
+                  file=sys.stderr)
+    finally:
+        cleanup(ctx)
+        MySqlDBPool.close_pool('default')
+        if server is not None:
+            server.stop()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    report = dict(environment=dict(environment(), server='fake' if args.fake else f'{args.host}:{args.port}'),
+                  results=results)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)['results']
+    regressed = False
+    print(f"{'case':<16} {'baseline':>14} {'current':>14} {'change':>8}", file=sys.stderr)
+    for name, base, current, change, is_regression in compare(results, baseline, args.tolerance):
+        regressed = regressed or is_regression
+        flag = '  REGRESSION' if is_regression else ''
+        print(f'{name:<16} {base:>14,.1f} {current:>14,.1f} {change:>+8.1%}{flag}', file=sys.stderr)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,9 @@
 # brief:
 
 __all__ = [
-    'field_type', 'en_decoder', 'models', 'mysql_db_pool', 'mysql_executor'
+    'field_type', 'en_decoder', 'models', 'mysql_db_pool', 'mysql_executor',
+    'async_mysql_db_pool', 'async_mysql_executor', 'columnar', 'cache', 'coalescer', 'query_cache',
+    'instrumentation', 'fake_mysql_server', 'session', 'escaper'
 ]
 
 __version__ = '0.1'
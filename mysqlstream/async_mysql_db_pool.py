@@ -0,0 +1,97 @@
+# brief: 基于asyncio的DB连接池
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+class AsyncMySqlDBPool:
+    _pool = None  # 连接池对象
+    _cursor_class = None  # 初始化时指定的cursor类型
+
+    @classmethod
+    async def init_pool(cls, min_idle_connections, max_connections,
+                        host, port, username, password, charset='utf8mb4',
+                        cursor_class=None):
+        """
+        初始化连接池，app全局调用一次就够了！参数和MySqlDBPool.init_pool()相同
+        :param min_idle_connections   最小的空闲链接数
+        :param max_connections  最大的链接数
+        :param host  MySQL的地址
+        :param port  MySQL的端口号
+        :param username  MySQL的用户名
+        :param password  MySQL的密码
+        :param charset  MySQL的字符集
+        :param cursor_class  使用的cursor类型，默认为aiomysql.DictCursor
+        """
+        if aiomysql is None:
+            raise Exception("The package aiomysql must be installed at first!")
+
+        if cursor_class is None:
+            cursor_class = aiomysql.DictCursor
+        # 开启autocommit，否则归还的连接处于事务中时会被aiomysql直接关闭，无法复用
+        cls._pool = await aiomysql.create_pool(minsize=min_idle_connections,
+                                               maxsize=max_connections,
+                                               host=host,
+                                               user=username,
+                                               password=password,
+                                               port=port,
+                                               charset=charset,
+                                               cursorclass=cursor_class,
+                                               autocommit=True)
+        cls._cursor_class = cursor_class
+
+    @classmethod
+    async def close_pool(cls):
+        """
+        关闭连接池
+        """
+        if not cls._pool:
+            return
+        cls._pool.close()
+        await cls._pool.wait_closed()
+        cls._pool = None
+
+    @classmethod
+    def tuple_cursor_class(cls):
+        """
+        获取返回元组行的cursor类型，不受初始化时指定的cursor_class的影响
+        """
+        return aiomysql.Cursor
+
+    @classmethod
+    def unbuffered_cursor_class(cls, cursor_class=None):
+        """
+        获取和cursor_class对应的无缓冲(服务端)cursor类型，用于流式读取结果集
+        :param cursor_class  为None时使用初始化时指定的cursor_class
+        """
+        if issubclass(cursor_class or cls._cursor_class, aiomysql.DictCursor):
+            return aiomysql.SSDictCursor
+        return aiomysql.SSCursor
+
+    def __init__(self):
+        self._connection = None
+
+    async def get_connection(self):
+        """
+        获取连接
+        """
+        if not self._pool:
+            raise Exception("The class method init_pool() must be invoke at first!")
+
+        self._connection = await self._pool.acquire()
+        return self._connection
+
+    def recycle_connection(self):
+        """
+        回收连接
+        """
+        if self._connection is not None:
+            self._pool.release(self._connection)
+            self._connection = None
+
+    async def __aenter__(self):
+        return await self.get_connection()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.recycle_connection()
@@ -0,0 +1,244 @@
+# brief: 基于asyncio连接池的mysql执行器
+from .async_mysql_db_pool import AsyncMySqlDBPool
+from .mysql_executor import MysqlExecutor, _PACKET_HEADROOM
+from .escaper import format_sql
+
+
+class AsyncMysqlExecutor:
+    """
+    MysqlExecutor的asyncio版本，方法的参数和返回值都和MysqlExecutor相同，需要await调用
+    查询不使用MysqlExecutor的查询缓存，写操作会让相关的查询缓存失效
+    """
+    _max_allowed_packet = None  # 服务端的max_allowed_packet，第一次批量执行时查询
+
+    def __init__(self):
+        self._db_pool = AsyncMySqlDBPool()
+        self._connection = None
+        self._executed_sql_list = []
+
+    @classmethod
+    async def _execute_query(cls, sql, args, fetchone=False, cursor_class=None):
+        async with AsyncMySqlDBPool() as connection:
+            cursor = await (connection.cursor(cursor_class) if cursor_class else connection.cursor())
+            try:
+                await cursor.execute(sql, args)
+                if fetchone:
+                    rows = await cursor.fetchone()
+                else:
+                    rows = await cursor.fetchall()
+                return rows
+            finally:
+                await cursor.close()
+
+    @classmethod
+    async def query_one_row(cls, sql, args, cursor_class=None):
+        """
+        查询单行结果，规则和MysqlExecutor.query_one_row()相同
+        """
+        return await cls._execute_query(sql, args, True, cursor_class)
+
+    @classmethod
+    async def query_multi_rows(cls, sql, args, cursor_class=None):
+        """
+        查询多行结果，规则和MysqlExecutor.query_multi_rows()相同
+        """
+        return await cls._execute_query(sql, args, cursor_class=cursor_class)
+
+    @classmethod
+    async def query_stream(cls, sql, args, batch_size=None, cursor_class=None):
+        """
+        流式查询结果，规则和MysqlExecutor.query_stream()相同
+        :return: 结果的异步生成器
+
+        提前break时，连接在生成器被回收时才归还，需要立即归还时在finally中调用aclose()
+
+        例如：
+            async for row in AsyncMysqlExecutor.query_stream("select * from user", None):
+                print(row)
+
+            stream = AsyncMysqlExecutor.query_stream("select * from user", None)
+            try:
+                async for row in stream:
+                    break
+            finally:
+                await stream.aclose()
+        """
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError(f'batch_size:{batch_size} is incorrect !')
+
+        async with AsyncMySqlDBPool() as connection:
+            cursor = await connection.cursor(AsyncMySqlDBPool.unbuffered_cursor_class(cursor_class))
+            finished = False
+            try:
+                await cursor.execute(sql, args)
+                while True:
+                    if batch_size is None:
+                        row = await cursor.fetchone()
+                        if row is None:
+                            break
+                        yield row
+                    else:
+                        rows = await cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield rows
+                finished = True
+            finally:
+                if finished:
+                    await cursor.close()
+                else:
+                    connection.close()  # 提前结束时关闭连接，不读取剩余的结果，连接池会丢弃关闭的连接
+
+    @classmethod
+    async def execute(cls, sql, args):
+        """
+        执行指定的sql，规则和MysqlExecutor.execute()相同
+        :return: 受影响的行数和本次insert操作的数据的ID
+        :rtype: int, int
+        """
+        if not sql:
+            raise ValueError('sql is empty!')
+
+        async with AsyncMySqlDBPool() as connection:
+            cursor = await connection.cursor()
+            try:
+                affected = await cursor.execute(sql, args)
+                await connection.commit()
+                return affected, cursor.lastrowid
+            finally:
+                await cursor.close()
+                MysqlExecutor._invalidate_query_cache(sql)
+
+    @classmethod
+    async def execute_many(cls, sql, rows):
+        """
+        批量执行同一条sql，规则和MysqlExecutor.execute_many()相同
+        :return: 每个分块受影响的行数和第一条insert数据的ID
+        :rtype: list of int, int
+        """
+        if not sql:
+            raise ValueError('sql is empty!')
+        if not rows:
+            return [], 0
+
+        async with AsyncMySqlDBPool() as connection:
+            cursor = await connection.cursor()
+            try:
+                max_length = await cls._max_statement_length(cursor)
+                await connection.begin()
+                try:
+                    affected_list = []
+                    first_id = 0
+                    statements = MysqlExecutor._split_statements(cursor, sql, rows, max_length,
+                                                                 connection.encoding)
+                    for statement in statements:
+                        affected_list.append(await cursor.execute(statement))
+                        if not first_id:
+                            first_id = cursor.lastrowid
+                    await connection.commit()
+                    return affected_list, first_id
+                except Exception as e:
+                    await connection.rollback()
+                    raise e
+            finally:
+                await cursor.close()
+                MysqlExecutor._invalidate_query_cache(sql)
+
+    @classmethod
+    async def _max_statement_length(cls, cursor):
+        """
+        单条语句允许的最大字节数
+        """
+        if cls._max_allowed_packet is None:
+            await cursor.execute('select @@max_allowed_packet as max_allowed_packet')
+            row = await cursor.fetchone()
+            cls._max_allowed_packet = int(row['max_allowed_packet'] if isinstance(row, dict) else row[0])
+        return cls._max_allowed_packet - _PACKET_HEADROOM
+
+    @classmethod
+    async def transaction_execute(cls, sql_list, args_list, rollback=True):
+        """
+        在一个事务中运行多条sql语句,默认失败后自动回滚，规则和MysqlExecutor.transaction_execute()相同
+        """
+        if not sql_list:
+            raise ValueError('sql_list is empty!')
+
+        async with AsyncMySqlDBPool() as connection:
+            await connection.begin()
+            try:
+                cursor = await connection.cursor()
+                try:
+                    for i, sql in enumerate(sql_list):
+                        if args_list:
+                            await cursor.execute(sql, args_list[i])
+                        else:
+                            await cursor.execute(sql)
+                finally:
+                    await cursor.close()
+                await connection.commit()
+            except Exception as e:
+                if rollback:
+                    await connection.rollback()
+                raise e
+            finally:
+                for sql in sql_list:
+                    MysqlExecutor._invalidate_query_cache(sql)
+
+    @classmethod
+    async def build_sql(cls, sql, args):
+        """
+        构造防SQL注入的语句，规则和MysqlExecutor.build_sql()相同
+        :rtype str:
+        """
+        return format_sql(sql, args)
+
+    async def start_transaction(self):
+        """
+        开始事务(此时才从连接池中获取连接，commit()或rollback()后归还)
+        """
+        if self._connection is None:
+            self._connection = await self._db_pool.get_connection()
+        await self._connection.begin()
+
+    async def no_commit_execute(self, sql, args):
+        """
+        不自动提交地执行sql（事务处理时使用）
+        :param  sql: sql的集合，规则和execute()相同
+        :param args: args的集合，规则和execute()相同
+        """
+        if not sql:
+            raise ValueError('sql is None!')
+        if self._connection is None:
+            raise Exception("The method start_transaction() must be invoke at first!")
+        cursor = await self._connection.cursor()
+        try:
+            await cursor.execute(sql, args)
+        finally:
+            await cursor.close()
+        self._executed_sql_list.append(sql)
+
+    async def commit(self):
+        """
+        提交
+        """
+        try:
+            await self._connection.commit()
+        finally:
+            self._release()
+            sql_list, self._executed_sql_list = self._executed_sql_list, []
+            for sql in sql_list:
+                MysqlExecutor._invalidate_query_cache(sql)
+
+    async def rollback(self):
+        """
+        回滚
+        """
+        self._executed_sql_list = []
+        try:
+            await self._connection.rollback()
+        finally:
+            self._release()
+
+    def _release(self):
+        self._db_pool.recycle_connection()
+        self._connection = None
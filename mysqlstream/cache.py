@@ -0,0 +1,104 @@
+# brief: 线程安全的LRU缓存
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    线程安全的LRU缓存，支持TTL过期和容量上限，并统计命中、未命中和淘汰的次数
+
+    例如：
+        class User(Model):
+            __cache__ = LRUCache(max_size=10000, ttl=60)  # 开启User().get()的缓存
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        """
+        :param max_size  最多缓存的条数
+        :param ttl  缓存的有效期(秒)，None表示不过期
+        """
+        if max_size <= 0:
+            raise ValueError(f'max_size:{max_size} is incorrect !')
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key和(过期时间, value)的映射
+        self._lock = threading.Lock()
+        self._generation = 0  # 每次删除或清空时加1，用于丢弃删除前发起的查询的结果
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self):
+        """
+        当前的版本号，查询前获取，写入时传给set()，期间有删除时不会写入旧数据
+        """
+        return self._generation
+
+    def get(self, key, default=None):
+        """
+        获取缓存的值，过期或不存在时返回default
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expire_at, value = item
+                if expire_at is None or expire_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value, generation=None):
+        """
+        写入缓存，超过容量时淘汰最久未使用的条目
+        :param generation  查询前获取的版本号，期间有删除时放弃写入
+        :return: 是否写入
+        """
+        expire_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        """
+        删除缓存
+        """
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        缓存的统计信息
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(size=len(self._data),
+                        max_size=self.max_size,
+                        hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions)
+
+    def __len__(self):
+        return len(self._data)
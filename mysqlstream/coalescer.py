@@ -0,0 +1,78 @@
+# brief: 合并多线程并发的单条查询
+import threading
+from concurrent.futures import Future
+
+
+class _Batch:
+    def __init__(self):
+        self.futures = {}  # key和Future的映射
+        self.full = threading.Event()
+
+
+class Coalescer:
+    """
+    把短时间内多个线程发起的单条查询合并成一次批量查询(dataloader模式)。
+    第一个加入批次的线程等待window秒(或批次满)后执行批量查询，其它线程等待结果。
+
+    例如：
+        class User(Model):
+            __coalescer__ = Coalescer(window=0.002, max_batch=500)  # 合并并发的User().get()
+    """
+
+    def __init__(self, window=0.002, max_batch=500):
+        """
+        :param window  等待合并的时间(秒)，会增加单次查询的延迟
+        :param max_batch  每批最多的key数量，达到后立即查询
+        """
+        if window < 0:
+            raise ValueError(f'window:{window} is incorrect !')
+        if max_batch <= 0:
+            raise ValueError(f'max_batch:{max_batch} is incorrect !')
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._batch = None  # 正在收集的批次
+        self.loads = 0  # 合并前的查询次数
+        self.batches = 0  # 实际的批量查询次数
+
+    def load(self, key, loader):
+        """
+        加入当前批次并等待结果
+        :param key  查询的key
+        :param loader  批量查询的函数，参数为key的list，返回key和结果的dict，不存在的key可以省略
+        :return: key对应的结果，不存在时返回None
+        """
+        with self._lock:
+            self.loads += 1
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            future = batch.futures.get(key)
+            if future is None:
+                future = batch.futures[key] = Future()
+            if len(batch.futures) >= self.max_batch:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+                self.batches += 1
+            self._run(batch, loader)
+        return future.result()
+
+    def _run(self, batch, loader):
+        """
+        执行批量查询，并把结果或异常分发给等待的线程
+        """
+        try:
+            results = loader(list(batch.futures))
+        except Exception as e:
+            for future in batch.futures.values():
+                future.set_exception(e)
+            raise
+        for key, future in batch.futures.items():
+            future.set_result(results.get(key))
@@ -0,0 +1,177 @@
+# brief: 按列组织的查询结果(用于分析类的查询)
+from array import array
+from datetime import date
+from pymysql.constants import FIELD_TYPE
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BACKEND_ARRAY = 'array'  # 使用标准库的array.array(整数和浮点数列)和list(其它列)
+BACKEND_NUMPY = 'numpy'  # 使用numpy.ndarray
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_DATETIME = 'datetime'
+KIND_OBJECT = 'object'
+
+_NAN = float('nan')
+
+_KINDS = {
+    FIELD_TYPE.TINY: KIND_INT,
+    FIELD_TYPE.SHORT: KIND_INT,
+    FIELD_TYPE.LONG: KIND_INT,
+    FIELD_TYPE.INT24: KIND_INT,
+    FIELD_TYPE.LONGLONG: KIND_INT,
+    FIELD_TYPE.YEAR: KIND_INT,
+    FIELD_TYPE.FLOAT: KIND_FLOAT,
+    FIELD_TYPE.DOUBLE: KIND_FLOAT,
+    FIELD_TYPE.DECIMAL: KIND_FLOAT,
+    FIELD_TYPE.NEWDECIMAL: KIND_FLOAT,
+    FIELD_TYPE.DATE: KIND_DATETIME,
+    FIELD_TYPE.NEWDATE: KIND_DATETIME,
+    FIELD_TYPE.DATETIME: KIND_DATETIME,
+    FIELD_TYPE.TIMESTAMP: KIND_DATETIME,
+}
+
+
+def column_kind(type_code):
+    """
+    根据cursor.description中的类型码获取列的类别
+    :return: 'int', 'float', 'datetime' 或 'object'
+    """
+    return _KINDS.get(type_code, KIND_OBJECT)
+
+
+def check_backend(backend):
+    """
+    检查列存储的后端是否可用
+    """
+    if backend not in (BACKEND_ARRAY, BACKEND_NUMPY):
+        raise ValueError(f'backend:{backend} is incorrect !')
+    if backend == BACKEND_NUMPY and numpy is None:
+        raise Exception("The package numpy must be installed at first!")
+
+
+def build_columns(description, rows, backend=BACKEND_ARRAY):
+    """
+    把元组行组成的结果集转成列名和列数组的映射
+    :param description: cursor.description
+    :param rows: 元组行的集合
+    :param backend: 'array' 或 'numpy'
+    :rtype: dict
+
+    array后端：整数列为array('q')，浮点数列为array('d')(NULL为nan)，其它列为list。
+              整数列中有NULL或超出int64范围时使用list。
+    numpy后端：整数列为int64(有NULL时为float64，NULL为nan)，浮点数列为float64(NULL为nan)，
+              日期时间列为datetime64[us](NULL或无效的日期为NaT)，其它列为object。
+    DECIMAL列会转成浮点数。
+    """
+    builder = ColumnsBuilder(description, backend)
+    builder.extend(rows)
+    return builder.build()
+
+
+class ColumnsBuilder:
+    """
+    逐块追加元组行，构建和build_columns()相同的按列结果。
+    每块追加后即可丢弃，整数和浮点数列直接写入array，内存中不会同时保留所有的行和列。
+
+    例如：
+        builder = ColumnsBuilder(cursor.description, 'numpy')
+        for rows in iter(lambda: cursor.fetchmany(10000), ()):
+            builder.extend(rows)
+        columns = builder.build()
+    """
+
+    def __init__(self, description, backend=BACKEND_ARRAY):
+        self._names = [d[0] for d in description]
+        self._columns = [_ColumnBuilder(column_kind(d[1]), backend) for d in description]
+
+    def extend(self, rows):
+        """
+        追加一块元组行
+        """
+        if not rows:
+            return
+        for column, values in zip(self._columns, zip(*rows)):
+            column.extend(values)
+
+    def build(self):
+        """
+        列名和列数组的映射
+        :rtype: dict
+        """
+        return {name: column.build() for name, column in zip(self._names, self._columns)}
+
+
+class _ColumnBuilder:
+    """
+    单列的构建状态：整数列从array('q')开始，遇到NULL时numpy后端转成array('d')(最终为float64)，
+    否则和超出int64范围时一样转成list，最终按build_columns()的规则转换
+    """
+    __slots__ = ('kind', 'backend', 'values')
+
+    def __init__(self, kind, backend):
+        self.kind = kind
+        self.backend = backend
+        if kind == KIND_INT:
+            self.values = array('q')
+        elif kind == KIND_FLOAT:
+            self.values = array('d')
+        else:
+            self.values = []
+
+    def extend(self, values):
+        current = self.values
+        if self.kind == KIND_FLOAT:
+            current.extend([_NAN if v is None else float(v) for v in values])
+            return
+        if not isinstance(current, array):
+            current.extend(values)
+            return
+
+        size = len(current)
+        try:
+            if current.typecode == 'q':
+                current.extend(values)
+            else:
+                current.extend([_NAN if v is None else v for v in values])
+            return
+        except (TypeError, OverflowError, ValueError):
+            del current[size:]  # 去掉出错前已经追加的值
+
+        if current.typecode == 'q' and self.backend == BACKEND_NUMPY and None in values:
+            self.values = array('d', current)
+            self.extend(values)
+        elif current.typecode == 'q':
+            self.values = current.tolist()
+            self.values.extend(values)
+        else:
+            self.values = [None if v != v else v for v in current]  # nan还原成NULL
+            self.values.extend(values)
+
+    def build(self):
+        values = self.values
+        if self.backend != BACKEND_NUMPY:
+            return values
+        if isinstance(values, array):
+            dtype = numpy.int64 if values.typecode == 'q' else numpy.float64
+            return numpy.frombuffer(values, dtype=dtype) if values else numpy.array([], dtype=dtype)
+        return _numpy_column(self.kind, values)
+
+
+def _numpy_column(kind, values):
+    if kind == KIND_INT:
+        if None in values:
+            return numpy.array([numpy.nan if v is None else v for v in values], dtype=numpy.float64)
+        try:
+            return numpy.array(values, dtype=numpy.int64)
+        except OverflowError:
+            return numpy.array(values, dtype=object)
+    if kind == KIND_FLOAT:
+        return numpy.array([numpy.nan if v is None else float(v) for v in values], dtype=numpy.float64)
+    if kind == KIND_DATETIME:
+        # 无效的日期(例如0000-00-00)会以字符串返回，转成NaT
+        return numpy.array([v if isinstance(v, date) else None for v in values], dtype='datetime64[us]')
+    return numpy.array(values, dtype=object)
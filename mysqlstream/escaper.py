@@ -0,0 +1,117 @@
+# brief: 不需要连接的sql转义和格式化
+import re
+from pymysql import converters
+from pymysql.err import ProgrammingError
+from .cache import LRUCache
+
+_PLACEHOLDER_RE = re.compile(r'%(?:\(([^)]*)\))?(.?)', re.DOTALL)
+
+_templates = LRUCache(max_size=1024)  # sql和编译后的SqlTemplate的缓存
+
+
+def escape(value, encoding='utf8', no_backslash_escapes=False):
+    """
+    把值转成sql中的字面量，规则和pymysql的Connection.escape()相同
+    :param value: 参数值
+    :param encoding: 和连接字符集对应的编码
+    :param no_backslash_escapes: 服务端是否开启了NO_BACKSLASH_ESCAPES(此时只把单引号转义成两个单引号)
+    """
+    if isinstance(value, str):
+        if no_backslash_escapes:
+            return "'" + value.replace("'", "''") + "'"
+        return "'" + converters.escape_string(value) + "'"
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{value.hex()}'"
+    return converters.escape_item(value, encoding, mapping=converters.encoders)
+
+
+class SqlTemplate:
+    """
+    解析好占位符的sql，格式化时只需要转义参数并拼接
+    """
+    __slots__ = ('parts', 'keys')
+
+    def __init__(self, sql):
+        """
+        :param sql  使用%s或%(name)s作为占位符的sql，%%表示%
+        """
+        parts = []  # 占位符之间的文本，比占位符多一个
+        keys = []  # 每个占位符的参数名，%s为None
+        buf = []
+        last = 0
+        for m in _PLACEHOLDER_RE.finditer(sql):
+            buf.append(sql[last:m.start()])
+            last = m.end()
+            name, conversion = m.group(1), m.group(2)
+            if conversion == '%' and name is None:
+                buf.append('%')
+            elif conversion == 's':
+                parts.append(''.join(buf))
+                buf = []
+                keys.append(name)
+            elif not conversion:
+                # 和mogrify()一样，sql末尾单独的%是不完整的格式
+                raise ValueError('incomplete format')
+            elif conversion == '(' and name is None:
+                raise ValueError('incomplete format key')
+            else:
+                raise ProgrammingError(f'unsupported format character at {m.start()} in sql:{sql}')
+        buf.append(sql[last:])
+        parts.append(''.join(buf))
+        if None in keys and any(k is not None for k in keys):
+            raise ProgrammingError(f'sql:{sql} mixes %s and %(name)s placeholders')
+        self.parts = parts
+        self.keys = keys
+
+    def format(self, args, encoding='utf8', no_backslash_escapes=False):
+        """
+        转义参数并替换占位符
+        :param args: 参数的集合，规则和MysqlExecutor.execute()相同
+        """
+        keys = self.keys
+        if isinstance(args, dict):
+            if keys and keys[0] is None:
+                raise ProgrammingError('format requires a sequence of args')
+            try:
+                values = [args[key] for key in keys]
+            except KeyError as e:
+                raise ProgrammingError(f'arg:{e} is not found')
+        else:
+            values = args if isinstance(args, (list, tuple)) else (args,)
+            if (keys and keys[0] is not None) or len(values) != len(keys):
+                raise ProgrammingError(f'the sql has {len(keys)} placeholders but {len(values)} args are given')
+
+        parts = self.parts
+        out = [parts[0]]
+        for i, value in enumerate(values):
+            out.append(escape(value, encoding, no_backslash_escapes))
+            out.append(parts[i + 1])
+        return ''.join(out)
+
+
+def compile_sql(sql):
+    """
+    获取sql编译后的SqlTemplate，相同的sql只解析一次
+    """
+    template = _templates.get(sql)
+    if template is None:
+        template = SqlTemplate(sql)
+        _templates.set(sql, template)
+    return template
+
+
+def format_sql(sql, args, encoding='utf8', no_backslash_escapes=False):
+    """
+    不需要连接地构造转义后的sql，结果和pymysql的cursor.mogrify()相同
+    :param sql: 需要执行的sql语句
+    :param args: 和sql中占位符对应的参数集合，为None时直接返回sql
+    :param encoding: 和连接字符集对应的编码
+    :param no_backslash_escapes: 服务端是否开启了NO_BACKSLASH_ESCAPES
+
+    例如：
+        format_sql("select * from user where name=%s and age>%s", ["a'b", 10])
+        # select * from user where name='a\\'b' and age>10
+    """
+    if args is None:
+        return sql
+    return compile_sql(sql).format(args, encoding, no_backslash_escapes)
@@ -0,0 +1,659 @@
+# brief: 进程内的MySQL协议模拟服务器(用于没有数据库的压测和延迟测试)
+import os
+import random
+import re
+import socket
+import socketserver
+import sqlite3
+import struct
+import threading
+import time
+
+# 协议常量
+_CLIENT_LONG_PASSWORD = 1
+_CLIENT_FOUND_ROWS = 1 << 1
+_CLIENT_LONG_FLAG = 1 << 2
+_CLIENT_CONNECT_WITH_DB = 1 << 3
+_CLIENT_PROTOCOL_41 = 1 << 9
+_CLIENT_TRANSACTIONS = 1 << 13
+_CLIENT_SECURE_CONNECTION = 1 << 15
+_CLIENT_MULTI_STATEMENTS = 1 << 16
+_CLIENT_MULTI_RESULTS = 1 << 17
+_CLIENT_PLUGIN_AUTH = 1 << 19
+_SERVER_CAPABILITIES = (_CLIENT_LONG_PASSWORD | _CLIENT_FOUND_ROWS | _CLIENT_LONG_FLAG |
+                        _CLIENT_CONNECT_WITH_DB | _CLIENT_PROTOCOL_41 | _CLIENT_TRANSACTIONS |
+                        _CLIENT_SECURE_CONNECTION | _CLIENT_MULTI_STATEMENTS |
+                        _CLIENT_MULTI_RESULTS | _CLIENT_PLUGIN_AUTH)
+
+_STATUS_IN_TRANS = 0x0001
+_STATUS_AUTOCOMMIT = 0x0002
+_STATUS_MORE_RESULTS = 0x0008
+
+_COM_QUIT = 0x01
+_COM_INIT_DB = 0x02
+_COM_QUERY = 0x03
+_COM_PING = 0x0e
+
+_TYPE_DOUBLE = 5
+_TYPE_NULL = 6
+_TYPE_LONGLONG = 8
+_TYPE_DATETIME = 12
+_TYPE_BLOB = 252
+_TYPE_VAR_STRING = 253
+
+_CHARSET_UTF8MB4 = 45
+_CHARSET_BINARY = 63
+
+_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+# MySQL方言中需要特殊处理的语句
+_NOOP_RE = re.compile(r'^\s*(set|use|show|lock|unlock|flush|analyze|optimize)\b', re.I)
+_BEGIN_RE = re.compile(r'^\s*(begin|start\s+transaction)\b', re.I)
+_COMMIT_RE = re.compile(r'^\s*commit\b', re.I)
+_ROLLBACK_RE = re.compile(r'^\s*rollback\b(?!\s+to\b)', re.I)  # rollback to savepoint由sqlite执行
+_CREATE_DB_RE = re.compile(r'^\s*create\s+(?:database|schema)\s+(?:if\s+not\s+exists\s+)?(\w+)', re.I)
+_DROP_DB_RE = re.compile(r'^\s*drop\s+(?:database|schema)\s+(?:if\s+exists\s+)?(\w+)', re.I)
+_CREATE_TABLE_RE = re.compile(r'^\s*create\s+table\b', re.I)
+_INSERT_RE = re.compile(r'^\s*(insert|replace)\b', re.I)
+
+_SERVER_VARIABLES = {
+    'max_allowed_packet': 4 * 1024 * 1024,
+    'version': '5.7.99-mysqlstream-fake',
+    'autocommit': 1,
+    'tx_isolation': 'REPEATABLE-READ',
+    'transaction_isolation': 'REPEATABLE-READ',
+}
+
+
+class FakeServerError(Exception):
+    """
+    模拟服务器返回给客户端的错误
+    """
+    def __init__(self, code, message, sql_state='HY000'):
+        super(FakeServerError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.sql_state = sql_state
+
+
+def _lenenc_int(n):
+    """
+    编码length-encoded integer
+    """
+    if n < 251:
+        return struct.pack('<B', n)
+    if n < (1 << 16):
+        return b'\xfc' + struct.pack('<H', n)
+    if n < (1 << 24):
+        return b'\xfd' + struct.pack('<I', n)[:3]
+    return b'\xfe' + struct.pack('<Q', n)
+
+
+def _lenenc_str(s):
+    """
+    编码length-encoded string
+    """
+    return _lenenc_int(len(s)) + s
+
+
+def _split_statements(sql):
+    """
+    按分号切分多条语句(忽略字符串中的分号)
+    """
+    statements = []
+    buf = []
+    quote = None
+    i = 0
+    while i < len(sql):
+        ch = sql[i]
+        if quote:
+            buf.append(ch)
+            if ch == '\\' and i + 1 < len(sql):
+                buf.append(sql[i + 1])
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in ('"', "'", '`'):
+            quote = ch
+            buf.append(ch)
+        elif ch == ';':
+            statements.append(''.join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+        i += 1
+    statements.append(''.join(buf))
+    return [s for s in statements if s.strip()]
+
+
+_UNESCAPES = {'0': '\0', 'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'Z': '\x1a'}
+
+
+def _translate(sql):
+    """
+    把MySQL方言翻译成sqlite可以执行的语句：
+        字符串的反斜杠转义, 反引号标识符, value(...), on duplicate key update, @@变量
+    """
+    out = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"'):
+            j = i + 1
+            chars = []
+            while j < n:
+                c = sql[j]
+                if c == '\\' and j + 1 < n:
+                    nxt = sql[j + 1]
+                    chars.append(_UNESCAPES.get(nxt, nxt))
+                    j += 2
+                    continue
+                if c == ch:
+                    if j + 1 < n and sql[j + 1] == ch:
+                        chars.append(ch)
+                        j += 2
+                        continue
+                    break
+                chars.append(c)
+                j += 1
+            out.append("'" + ''.join(chars).replace("'", "''") + "'")
+            i = j + 1
+        elif ch == '`':
+            j = sql.index('`', i + 1)
+            out.append('"' + sql[i + 1:j] + '"')
+            i = j + 1
+        elif ch == '@' and sql.startswith('@@', i):
+            m = re.match(r'@@(?:(?:global|session)\.)?(\w+)', sql[i:], re.I)
+            value = _SERVER_VARIABLES.get(m.group(1).lower())
+            if value is None:
+                out.append('NULL')
+            elif isinstance(value, int):
+                out.append(str(value))
+            else:
+                out.append("'%s'" % value)
+            i += m.end()
+        else:
+            m = re.match(r"[^'\"`@]+", sql[i:])
+            chunk = m.group(0) if m else ch
+            out.append(_translate_keywords(chunk))
+            i += len(chunk)
+    return ''.join(out)
+
+
+def _translate_keywords(chunk):
+    """
+    翻译字符串字面量之外的关键字
+    """
+    chunk = re.sub(r'\bon\s+duplicate\s+key\s+update\b', 'on conflict do update set', chunk, flags=re.I)
+    chunk = re.sub(r'\bvalue\s*\(', 'values (', chunk, flags=re.I)
+    return chunk
+
+
+def _translate_upsert(sql):
+    """
+    on duplicate key update 中的 values(col) 需要换成 excluded.col
+    """
+    m = re.search(r'\bon conflict do update set\b', sql, re.I)
+    if not m:
+        return sql
+    head, tail = sql[:m.end()], sql[m.end():]
+    tail = re.sub(r'\bvalues\s*\(\s*"?(\w+)"?\s*\)', r'excluded.\1', tail, flags=re.I)
+    return head + tail
+
+
+def _translate_create_table(sql):
+    """
+    把MySQL的建表语句转换成sqlite的建表语句
+    """
+    body_start = sql.index('(')
+    body_end = sql.rindex(')')
+    head = sql[:body_start]
+    body = sql[body_start + 1:body_end]
+
+    auto_column = None
+    columns = []
+    depth = 0
+    buf = []
+    for ch in body:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            columns.append(''.join(buf).strip())
+            buf = []
+        else:
+            buf.append(ch)
+    if buf:
+        columns.append(''.join(buf).strip())
+
+    definitions = []
+    for column in columns:
+        if re.search(r'\bauto_increment\b', column, re.I):
+            auto_column = column.split()[0]
+            definitions.append('%s INTEGER PRIMARY KEY AUTOINCREMENT' % auto_column)
+            continue
+        if re.match(r'^(unique\s+)?(key|index)\b', column, re.I):
+            continue
+        column = re.sub(r'\bon\s+update\s+current_timestamp\b', '', column, flags=re.I)
+        column = re.sub(r'\b(unsigned|zerofill)\b', '', column, flags=re.I)
+        column = re.sub(r'\b(character\s+set|charset|collate)\s+\w+', '', column, flags=re.I)
+        column = re.sub(r'\bcomment\s+\'[^\']*\'', '', column, flags=re.I)
+        definitions.append(column)
+    if auto_column:
+        definitions = [d for d in definitions if not re.match(r'^primary\s+key\b', d, re.I)]
+    return '%s(%s)' % (head, ', '.join(definitions))
+
+
+class _TableStore:
+    """
+    内存中的表存储(基于sqlite的内存数据库)，所有连接共享
+    """
+
+    def __init__(self):
+        self._db = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._databases = set()
+        self._txn_owner = None
+
+    def create_database(self, name):
+        with self._lock:
+            if name in self._databases:
+                return
+            self._db.execute("attach database ':memory:' as %s" % name)
+            self._databases.add(name)
+
+    def drop_database(self, name):
+        with self._lock:
+            if name not in self._databases:
+                return
+            self._db.execute('detach database %s' % name)
+            self._databases.discard(name)
+
+    def begin(self, owner, timeout):
+        """
+        开始事务：事务之间串行执行，等待超时时返回和MySQL相同的锁等待超时错误
+        和MySQL一致，事务中再次开始事务时隐式提交已开始的事务
+        """
+        if self._txn_owner is owner:
+            self._db.execute('commit')
+            self._db.execute('begin')
+            return
+        if not self._lock.acquire(timeout=timeout):
+            raise FakeServerError(1205, 'Lock wait timeout exceeded; try restarting transaction')
+        self._txn_owner = owner
+        self._db.execute('begin')
+
+    def end(self, owner, commit):
+        """
+        提交或回滚事务
+        """
+        if self._txn_owner is not owner:
+            return
+        try:
+            self._db.execute('commit' if commit else 'rollback')
+        finally:
+            self._txn_owner = None
+            self._lock.release()
+
+    def execute(self, sql, timeout):
+        """
+        执行单条语句
+        :return: (列名列表, 行列表, 受影响行数, 插入的ID)
+        """
+        if not self._lock.acquire(timeout=timeout):
+            raise FakeServerError(1205, 'Lock wait timeout exceeded; try restarting transaction')
+        try:
+            cursor = self._db.cursor()
+            try:
+                cursor.execute(sql)
+            except sqlite3.IntegrityError as e:
+                raise FakeServerError(1062, 'Duplicate entry: %s' % e, '23000')
+            except sqlite3.OperationalError as e:
+                if str(e).startswith('no such table'):
+                    raise FakeServerError(1146, str(e), '42S02')
+                raise FakeServerError(1064, str(e), '42000')
+            except sqlite3.Error as e:
+                raise FakeServerError(1064, str(e), '42000')
+            if cursor.description is not None:
+                columns = [d[0] for d in cursor.description]
+                return columns, cursor.fetchall(), 0, 0
+            affected = max(cursor.rowcount, 0)
+            insert_id = 0
+            if _INSERT_RE.match(sql) and cursor.lastrowid:
+                insert_id = cursor.lastrowid - max(affected, 1) + 1
+            return None, None, affected, insert_id
+        finally:
+            self._lock.release()
+
+
+class _ThrottledSocket:
+    """
+    按照带宽限制发送数据
+    """
+
+    def __init__(self, sock, bandwidth):
+        self._sock = sock
+        self._bandwidth = bandwidth
+
+    def sendall(self, data):
+        if not self._bandwidth:
+            self._sock.sendall(data)
+            return
+        step = max(1, self._bandwidth // 100)
+        for i in range(0, len(data), step):
+            piece = data[i:i + step]
+            self._sock.sendall(piece)
+            time.sleep(len(piece) / self._bandwidth)
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """
+    单个客户端连接的协议处理
+    """
+
+    def setup(self):
+        self.fake = self.server.fake
+        self.seq = 0
+        self.in_txn = False
+        self.out = _ThrottledSocket(self.request, self.fake.bandwidth)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        self.fake._on_connect()
+        try:
+            if self.fake._should_fail():
+                self._send_error(FakeServerError(1040, 'Too many connections', '08004'))
+                return
+            self._handshake()
+            while True:
+                packet = self._read_packet()
+                if packet is None:
+                    return
+                command, payload = packet[0], packet[1:]
+                if command == _COM_QUIT:
+                    return
+                self.fake._inject_latency()
+                if command == _COM_QUERY:
+                    self.fake._on_query()
+                    self._query(payload.decode('utf8'))
+                elif command in (_COM_PING, _COM_INIT_DB):
+                    self._send_ok()
+                else:
+                    self._send_error(FakeServerError(1047, 'Unknown command'))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if self.in_txn:
+                self.fake.store.end(self, commit=False)
+            self.fake._on_disconnect()
+
+    def _read_exact(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_packet(self):
+        payload = b''
+        while True:
+            header = self._read_exact(4)
+            if header is None:
+                return None
+            length = header[0] | (header[1] << 8) | (header[2] << 16)
+            self.seq = (header[3] + 1) & 0xff
+            data = self._read_exact(length) if length else b''
+            if data is None:
+                return None
+            payload += data
+            if length < 0xffffff:
+                return payload
+
+    def _packet(self, payload):
+        """
+        给负载加上包头(超过16M时拆包)
+        """
+        out = []
+        while True:
+            piece, payload = payload[:0xffffff], payload[0xffffff:]
+            out.append(struct.pack('<I', len(piece))[:3] + struct.pack('<B', self.seq) + piece)
+            self.seq = (self.seq + 1) & 0xff
+            if len(piece) < 0xffffff:
+                return b''.join(out)
+
+    def _status(self, more=False):
+        status = _STATUS_AUTOCOMMIT
+        if self.in_txn:
+            status |= _STATUS_IN_TRANS
+        if more:
+            status |= _STATUS_MORE_RESULTS
+        return status
+
+    def _ok_packet(self, affected=0, insert_id=0, more=False):
+        return self._packet(b'\x00' + _lenenc_int(affected) + _lenenc_int(insert_id) +
+                            struct.pack('<HH', self._status(more), 0))
+
+    def _send_ok(self, affected=0, insert_id=0):
+        self.out.sendall(self._ok_packet(affected, insert_id))
+
+    def _send_error(self, e):
+        payload = (b'\xff' + struct.pack('<H', e.code) + b'#' + e.sql_state.encode('ascii') +
+                   e.message.encode('utf8'))
+        self.out.sendall(self._packet(payload))
+
+    def _handshake(self):
+        salt = os.urandom(20).replace(b'\0', b'\1')
+        payload = (b'\x0a' + _SERVER_VARIABLES['version'].encode('ascii') + b'\0' +
+                   struct.pack('<I', self.fake._next_thread_id()) +
+                   salt[:8] + b'\0' +
+                   struct.pack('<H', _SERVER_CAPABILITIES & 0xffff) +
+                   struct.pack('<B', _CHARSET_UTF8MB4) +
+                   struct.pack('<H', _STATUS_AUTOCOMMIT) +
+                   struct.pack('<H', _SERVER_CAPABILITIES >> 16) +
+                   struct.pack('<B', 21) + b'\0' * 10 +
+                   salt[8:] + b'\0' +
+                   b'mysql_native_password\0')
+        self.seq = 0
+        self.out.sendall(self._packet(payload))
+        if self._read_packet() is None:
+            raise ConnectionError('client closed during handshake')
+        self._send_ok()
+
+    def _query(self, sql):
+        statements = _split_statements(sql) or ['']
+        out = []
+        for i, statement in enumerate(statements):
+            more = i < len(statements) - 1
+            try:
+                out.append(self._run_statement(statement, more))
+            except FakeServerError as e:
+                # 和MySQL一致：多语句中出错后，后续语句不再执行
+                self.out.sendall(b''.join(out))
+                self._send_error(e)
+                return
+        self.out.sendall(b''.join(out))
+
+    def _run_statement(self, sql, more):
+        store = self.fake.store
+        timeout = self.fake.lock_timeout
+        if not sql.strip() or _NOOP_RE.match(sql):
+            return self._ok_packet(more=more)
+        if _BEGIN_RE.match(sql):
+            store.begin(self, timeout)
+            self.in_txn = True
+            return self._ok_packet(more=more)
+        if _COMMIT_RE.match(sql) or _ROLLBACK_RE.match(sql):
+            if self.in_txn:
+                store.end(self, commit=bool(_COMMIT_RE.match(sql)))
+                self.in_txn = False
+            return self._ok_packet(more=more)
+        m = _CREATE_DB_RE.match(sql)
+        if m:
+            store.create_database(m.group(1))
+            return self._ok_packet(more=more)
+        m = _DROP_DB_RE.match(sql)
+        if m:
+            store.drop_database(m.group(1))
+            return self._ok_packet(more=more)
+
+        translated = _translate_upsert(_translate(sql))
+        if _CREATE_TABLE_RE.match(translated):
+            translated = _translate_create_table(translated)
+        columns, rows, affected, insert_id = store.execute(translated, timeout)
+        if columns is None:
+            return self._ok_packet(affected, insert_id, more)
+        return self._result_set(columns, rows, more)
+
+    def _result_set(self, columns, rows, more):
+        types = []
+        for i, _ in enumerate(columns):
+            types.append(self._column_type([row[i] for row in rows]))
+
+        out = [self._packet(_lenenc_int(len(columns)))]
+        for name, (type_code, charset) in zip(columns, types):
+            name = name.encode('utf8')
+            out.append(self._packet(_lenenc_str(b'def') + _lenenc_str(b'') + _lenenc_str(b'') +
+                                    _lenenc_str(b'') + _lenenc_str(name) + _lenenc_str(name) +
+                                    b'\x0c' + struct.pack('<HIBHB', charset, 1024, type_code, 0, 0) +
+                                    b'\0\0'))
+        out.append(self._packet(b'\xfe' + struct.pack('<HH', 0, self._status())))
+        for row in rows:
+            values = []
+            for v in row:
+                if v is None:
+                    values.append(b'\xfb')
+                elif isinstance(v, bytes):
+                    values.append(_lenenc_str(v))
+                elif isinstance(v, float):
+                    values.append(_lenenc_str(repr(v).encode('ascii')))
+                else:
+                    values.append(_lenenc_str(str(v).encode('utf8')))
+            out.append(self._packet(b''.join(values)))
+        out.append(self._packet(b'\xfe' + struct.pack('<HH', 0, self._status(more))))
+        return b''.join(out)
+
+    @staticmethod
+    def _column_type(values):
+        """
+        根据列中的值推断MySQL的列类型
+        """
+        values = [v for v in values if v is not None]
+        if not values:
+            return _TYPE_VAR_STRING, _CHARSET_UTF8MB4
+        if all(isinstance(v, int) for v in values):
+            return _TYPE_LONGLONG, _CHARSET_BINARY
+        if all(isinstance(v, (int, float)) for v in values):
+            return _TYPE_DOUBLE, _CHARSET_BINARY
+        if all(isinstance(v, bytes) for v in values):
+            return _TYPE_BLOB, _CHARSET_BINARY
+        if all(isinstance(v, str) and _DATETIME_RE.match(v) and not v.startswith('0000') for v in values):
+            return _TYPE_DATETIME, _CHARSET_BINARY
+        return _TYPE_VAR_STRING, _CHARSET_UTF8MB4
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeMysqlServer:
+    """
+    进程内的MySQL协议模拟服务器，支持PyMySQL的握手、COM_QUERY、结果集和OK包。
+    数据保存在内存中的表里，可以注入延迟、带宽限制和连接失败率。
+
+    限制：sql会翻译成sqlite执行，只支持常见的MySQL语法；不校验用户名和密码；
+    事务之间串行执行(等待超过lock_timeout时返回1205错误)；结果集的列类型根据返回的值推断。
+
+    例如：
+        with FakeMysqlServer(latency=0.001) as server:
+            MySqlDBPool.init_pool(1, 4, **server.pool_config())
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 failure_rate=0.0, lock_timeout=5.0, seed=None):
+        """
+        :param host  监听的地址
+        :param port  监听的端口号(0表示随机端口)
+        :param latency  每个命令注入的延迟(秒)，也可以是(最小值, 最大值)的区间
+        :param bandwidth  服务端发送数据的带宽上限(字节/秒)，None表示不限制
+        :param failure_rate  新建连接失败的概率(0~1)
+        :param lock_timeout  事务锁等待的超时时间(秒)
+        :param seed  随机数种子，指定后注入的延迟和失败是可复现的
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.lock_timeout = lock_timeout
+        self.store = _TableStore()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread_id = 0
+        self._stats_lock = threading.Lock()
+        self.connections = 0  # 当前的连接数
+        self.total_connections = 0  # 累计的连接数
+        self.queries = 0  # 累计的COM_QUERY命令数
+        self._server = _ThreadingServer((host, port), _ConnectionHandler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def pool_config(self, username='fake', password=''):
+        """
+        返回可以直接传给MySqlDBPool.init_pool()的连接参数
+        """
+        host, port = self.address
+        return dict(host=host, port=port, username=username, password=password)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _next_thread_id(self):
+        with self._stats_lock:
+            self._thread_id += 1
+            return self._thread_id
+
+    def _on_connect(self):
+        with self._stats_lock:
+            self.connections += 1
+            self.total_connections += 1
+
+    def _on_query(self):
+        with self._stats_lock:
+            self.queries += 1
+
+    def _on_disconnect(self):
+        with self._stats_lock:
+            self.connections -= 1
+
+    def _should_fail(self):
+        if not self.failure_rate:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.failure_rate
+
+    def _inject_latency(self):
+        latency = self.latency
+        if isinstance(latency, tuple):
+            with self._random_lock:
+                latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
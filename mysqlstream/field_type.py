@@ -1,41 +1,46 @@
 # brief: 数据字段类型
-from .en_decoder import TextEnDecoder, DatetimeEnDecoder
+from .en_decoder import get_codec
 
 
 class FieldType:
     """
     数据库字段基类
     """
-    def __init__(self, name, column_type, primary_key, default, en_decoder):
+    def __init__(self, name, column_type, primary_key, default, en_decoder, deferred=False):
         self.name = name  # 数据表的列名
         self.column_type = column_type  # 列类型
         self.primary_type = primary_key   # 是否是主键
         self.default = default  # 列的默认值
-        self.en_decoder = en_decoder  # 编解码类名
+        # 编解码类名，或者register_codec()注册的名称
+        self.en_decoder = get_codec(en_decoder) if isinstance(en_decoder, str) else en_decoder
+        self.deferred = deferred  # 是否延迟加载(默认的查询不包括该列，访问时才查询)
 
 
 class StringType(FieldType):
     """
     char，varchar字段类型
     """
-    def __init__(self, name=None, column_type='varchar(32)', primary_key=False, default=None, en_decoder=None):
-        super(StringType, self).__init__(name, column_type, primary_key, default, en_decoder)
+    def __init__(self, name=None, column_type='varchar(32)', primary_key=False, default=None, en_decoder=None,
+                 deferred=False):
+        super(StringType, self).__init__(name, column_type, primary_key, default, en_decoder, deferred)
 
 
 class IntegerType(FieldType):
     """
     int，tinyint字段类型
     """
-    def __init__(self, name=None, column_tye='int(32)', primary_key=False, default=None, en_decoder=None):
-        super(IntegerType, self).__init__(name, column_tye, primary_key, default, en_decoder)
+    def __init__(self, name=None, column_tye='int(32)', primary_key=False, default=None, en_decoder=None,
+                 deferred=False):
+        super(IntegerType, self).__init__(name, column_tye, primary_key, default, en_decoder, deferred)
 
 
 class TextType(FieldType):
     """
     text字段类型
     """
-    def __init__(self, name=None, column_type='text', primary_key=False, default=None, en_decoder=TextEnDecoder):
-        super(TextType, self).__init__(name, column_type, primary_key, default, en_decoder)
+    def __init__(self, name=None, column_type='text', primary_key=False, default=None, en_decoder='json',
+                 deferred=False):
+        super(TextType, self).__init__(name, column_type, primary_key, default, en_decoder, deferred)
 
 
 class DatetimeType(FieldType):
@@ -43,5 +48,14 @@ class DatetimeType(FieldType):
     timestamp，datetime字段类型
     """
     def __init__(self, name=None, column_type='datetime', primary_key=False,
-                 default='0000-00-00 00:00:00', en_decoder=DatetimeEnDecoder):
-        super(DatetimeType, self).__init__(name, column_type, primary_key, default, en_decoder)
+                 default='0000-00-00 00:00:00', en_decoder='datetime', deferred=False):
+        super(DatetimeType, self).__init__(name, column_type, primary_key, default, en_decoder, deferred)
+
+
+class BlobType(FieldType):
+    """
+    blob字段类型，值为bytes，可以指定en_decoder='msgpack'或'compressed_json'存储对象
+    """
+    def __init__(self, name=None, column_type='blob', primary_key=False, default=None, en_decoder='blob',
+                 deferred=False):
+        super(BlobType, self).__init__(name, column_type, primary_key, default, en_decoder, deferred)
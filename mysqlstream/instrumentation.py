@@ -0,0 +1,253 @@
+# brief: sql语句的耗时统计和监听
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+
+_listeners = []  # 监听函数的集合，参数为StatementEvent
+
+_DIGEST_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|%\(\w+\)s|%s|\b0x[0-9a-f]+\b|\b\d+(?:\.\d+)?\b",
+                        re.IGNORECASE)
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')  # in (?,?,?) 和 values (?,?)
+_VALUES_RE = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')  # 多行的values
+
+
+def add_listener(listener):
+    """
+    添加监听函数，每条语句执行结束后(包括出错)都会调用 listener(event)
+    :param listener: 参数为StatementEvent的函数，在执行sql的线程中同步调用，需要尽快返回
+    """
+    global _listeners
+    _listeners = _listeners + [listener]
+
+
+def remove_listener(listener):
+    """
+    移除监听函数
+    """
+    global _listeners
+    _listeners = [f for f in _listeners if f != listener]
+
+
+def digest(sql):
+    """
+    去掉sql中的字面量后的摘要，相同结构的语句摘要相同
+    例如 select * from t where id in (1,2,3) and name='a' 的摘要为
+        select * from t where id in (...) and name=?
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf8', 'replace')
+    sql = _DIGEST_RE.sub('?', sql)
+    sql = _LIST_RE.sub('(...)', sql)
+    sql = _VALUES_RE.sub(r'\1', sql)
+    return ' '.join(sql.split()).lower()
+
+
+class StatementEvent:
+    """
+    单条语句(或单个事务)的耗时信息，时间的单位都是秒，未经历的阶段为0
+    """
+    __slots__ = ('kind', 'sql', 'checkout', 'execute', 'fetch', 'commit', 'total', 'rows', 'error')
+
+    def __init__(self, kind, sql):
+        """
+        :param kind  'query', 'query_batch', 'execute', 'execute_many', 'transaction',
+                     或MysqlExecutor对象的 'checkout', 'no_commit_execute', 'no_commit_execute_many',
+                     'commit', 'rollback'
+        :param sql  执行的sql，transaction和query_batch为sql的集合，checkout, commit和rollback为None
+        """
+        self.kind = kind
+        self.sql = sql
+        self.checkout = 0.0  # 从连接池获取连接的等待时间
+        self.execute = 0.0  # 执行语句的时间
+        self.fetch = 0.0  # 读取结果集的时间
+        self.commit = 0.0  # 提交或回滚的时间
+        self.total = 0.0  # 总时间
+        self.rows = 0  # 返回或受影响的行数
+        self.error = None  # 出错时的异常
+
+    def __repr__(self):
+        return f'{self.kind}:{self.total:.6f}s rows:{self.rows} sql:{self.sql}'
+
+
+class _StatementTimer:
+    """
+    记录各个阶段的耗时，退出时通知监听函数
+    """
+
+    def __init__(self, kind, sql):
+        self.event = StatementEvent(kind, sql)
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        记录上一次mark到现在的时间为phase阶段的耗时
+        """
+        now = time.perf_counter()
+        setattr(self.event, phase, getattr(self.event, phase) + now - self._last)
+        self._last = now
+
+    def set_rows(self, rows):
+        self.event.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        event = self.event
+        event.total = time.perf_counter() - self._start
+        event.error = exc_val
+        for listener in _listeners:
+            try:
+                listener(event)
+            except Exception:
+                logging.getLogger(__name__).exception('The listener:<%s> failed!', listener)
+
+
+class _NoopTimer:
+    """
+    没有监听函数时使用，不计时
+    """
+
+    def mark(self, phase):
+        pass
+
+    def set_rows(self, rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def start_timer(kind, sql):
+    """
+    开始记录一条语句的耗时，没有监听函数时返回不计时的timer
+    """
+    if not _listeners:
+        return _NOOP_TIMER
+    return _StatementTimer(kind, sql)
+
+
+class DigestStats:
+    """
+    按照语句摘要聚合的统计信息，作为监听函数使用
+
+    例如：
+        stats = DigestStats()
+        add_listener(stats)
+        ...
+        for item in stats.report():
+            print(item['digest'], item['count'], item['p99'])
+    """
+
+    def __init__(self, max_samples=1000, max_digests=10000):
+        """
+        :param max_samples  每个摘要保留的耗时样本数(超出后随机替换)，用于计算百分位数
+        :param max_digests  最多统计的摘要数，超出后新的摘要不再统计
+        """
+        if max_samples <= 0:
+            raise ValueError(f'max_samples:{max_samples} is incorrect !')
+        self.max_samples = max_samples
+        self.max_digests = max_digests
+        self._lock = threading.Lock()
+        self._stats = {}  # 摘要和[次数, 总耗时, 总行数, 出错次数, 耗时样本]的映射
+
+    def __call__(self, event):
+        if event.sql is None:  # checkout, commit和rollback
+            key = event.kind
+        elif isinstance(event.sql, (str, bytes)):
+            key = digest(event.sql)
+        else:
+            key = '; '.join(digest(sql) for sql in event.sql)
+        with self._lock:
+            item = self._stats.get(key)
+            if item is None:
+                if len(self._stats) >= self.max_digests:
+                    return
+                item = self._stats[key] = [0, 0.0, 0, 0, []]
+            item[0] += 1
+            item[1] += event.total
+            item[2] += event.rows
+            if event.error is not None:
+                item[3] += 1
+            samples = item[4]
+            if len(samples) < self.max_samples:
+                samples.append(event.total)
+            else:
+                i = random.randrange(item[0])
+                if i < self.max_samples:
+                    samples[i] = event.total
+
+    def report(self):
+        """
+        统计结果，按总耗时从大到小排序
+        :rtype: list of dict
+        """
+        with self._lock:
+            items = [(k, v[0], v[1], v[2], v[3], sorted(v[4])) for k, v in self._stats.items()]
+        result = []
+        for key, count, total_time, total_rows, errors, samples in items:
+            result.append(dict(digest=key,
+                               count=count,
+                               total_time=total_time,
+                               total_rows=total_rows,
+                               errors=errors,
+                               p50=_percentile(samples, 0.5),
+                               p95=_percentile(samples, 0.95),
+                               p99=_percentile(samples, 0.99)))
+        result.sort(key=lambda d: d['total_time'], reverse=True)
+        return result
+
+    def reset(self):
+        """
+        清空统计结果
+        """
+        with self._lock:
+            self._stats = {}
+
+
+def _percentile(samples, p):
+    """
+    排好序的样本的百分位数(最近秩法)
+    """
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(p * len(samples)) - 1)]
+
+
+class SlowQueryLog:
+    """
+    慢查询日志，作为监听函数使用，耗时超过threshold的语句写入日志，并保留最近的记录
+
+    例如：
+        add_listener(SlowQueryLog(threshold=0.5))
+    """
+
+    def __init__(self, threshold=1.0, logger=None, max_entries=100):
+        """
+        :param threshold  慢查询的阈值(秒)
+        :param logger  写入的logging.Logger，默认为 mysqlstream.slow_query
+        :param max_entries  保留的最近慢查询的条数
+        """
+        if threshold < 0:
+            raise ValueError(f'threshold:{threshold} is incorrect !')
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger('mysqlstream.slow_query')
+        self.entries = deque(maxlen=max_entries)  # 最近的慢查询(StatementEvent)
+
+    def __call__(self, event):
+        if event.total < self.threshold:
+            return
+        self.entries.append(event)
+        self.logger.warning('slow %s %.3fs (checkout:%.3fs execute:%.3fs fetch:%.3fs commit:%.3fs) rows:%s sql:%s',
+                            event.kind, event.total, event.checkout, event.execute, event.fetch, event.commit,
+                            event.rows, event.sql)
@@ -1,7 +1,129 @@
 # brief: 数据库的model类
+import queue
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from .field_type import FieldType
+from .mysql_db_pool import MySqlDBPool
 from .mysql_executor import MysqlExecutor
+from .async_mysql_db_pool import AsyncMySqlDBPool
+from .async_mysql_executor import AsyncMysqlExecutor
+
+_MISSING = object()
+_IMMUTABLE_TYPES = (str, bytes, int, float, bool, tuple, frozenset, type(None))
+
+
+def _upsert_args(columns):
+    """
+    on duplicate key update 后面的赋值语句
+    """
+    return ','.join([f"{k}=values({k})" for k in columns])
+
+
+def _raw_slot(attr):
+    """
+    保存数据库原始值的slot名称
+    """
+    return f'{attr}__raw'
+
+
+class _LazyColumn:
+    """
+    指定了解码器的列属性：从数据库读取时只保存原始值，第一次访问时才解码，并缓存解码后的值。
+    赋值后原始值被丢弃
+    """
+
+    def __init__(self, value_slot, raw_slot, en_decoder):
+        self._value_slot = value_slot  # 解码后的值的slot描述符
+        self._raw_slot = raw_slot  # 原始值的slot描述符
+        self._en_decoder = en_decoder
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            return self._value_slot.__get__(obj, owner)
+        except AttributeError:
+            value = self._en_decoder.decode(self._raw_slot.__get__(obj, owner))
+            self._value_slot.__set__(obj, value)
+            return value
+
+    def __set__(self, obj, value):
+        self._value_slot.__set__(obj, value)
+        try:
+            self._raw_slot.__delete__(obj)
+        except AttributeError:
+            pass
+
+    def __delete__(self, obj):
+        self._value_slot.__delete__(obj)
+        try:
+            self._raw_slot.__delete__(obj)
+        except AttributeError:
+            pass
+
+    def raw(self, obj, default=None):
+        """
+        数据库中的原始值，不是从数据库读取或被赋值后返回default
+        """
+        try:
+            return self._raw_slot.__get__(obj)
+        except AttributeError:
+            return default
+
+    def decode(self, value):
+        return self._en_decoder.decode(value)
+
+    def decode_many(self, values):
+        return self._en_decoder.decode_many(values)
+
+    def set_raw(self, obj, value):
+        """
+        写入原始值，保留解码后的值
+        """
+        self._raw_slot.__set__(obj, value)
+
+    def set_decoded(self, obj, value):
+        """
+        写入解码后的值，保留原始值
+        """
+        self._value_slot.__set__(obj, value)
+
+    def is_decoded(self, obj):
+        """
+        是否已经解码(或赋值)
+        """
+        try:
+            self._value_slot.__get__(obj)
+            return True
+        except AttributeError:
+            return False
+
+
+def _compile_row_decoder(model_class, columns):
+    """
+    生成解码单行数据的函数：按照columns的顺序读取元组行，直接写入slot。
+    指定了解码器的列只写入原始值，访问时才解码。对象记录查询了哪些列，没有查询的列在访问时加载
+
+    例如User的解码函数为：
+        def decode_row(row):
+            obj = new(model_class)
+            set_loaded(obj, loaded)
+            set_0(obj, row[0])
+            ...
+            set_3(obj, row[3])  # urls的原始值
+            ...
+            return obj
+    """
+    namespace = {'model_class': model_class, 'new': object.__new__, 'loaded': frozenset(columns),
+                 'set_loaded': model_class.__loaded_columns__.__set__}
+    lines = ['def decode_row(row):', '    obj = new(model_class)', '    set_loaded(obj, loaded)']
+    for i, column in enumerate(columns):
+        namespace[f'set_{i}'] = model_class.__column_setters__[column]
+        lines.append(f'    set_{i}(obj, row[{i}])')
+    lines.append('    return obj')
+    exec('\n'.join(lines), namespace)
+    return namespace['decode_row']
 
 
 class ModelMetaclass(type):
@@ -31,37 +153,53 @@ class ModelMetaclass(type):
             if v.primary_type:
                 if primary_key:
                     raise Exception(f'More than one primary key in Model:<{name}>')
+                if v.deferred:
+                    raise Exception(f'Primary key:<{column}> can not be deferred in Model:<{name}>')
                 primary_key = column
             else:
                 columns_without_primary_key.append(column)
         if not primary_key:
             raise Exception(f'Primary key not found in Model:<{name}>')
 
-        # 将列相关的attr删除
+        # 将列相关的attr删除，并为每个列生成slot，指定了解码器的列还需要保存原始值的slot
         for f in column2attr.values():
             attrs.pop(f, None)
+        lazy_attrs = {column2attr[c]: v.en_decoder for c, v in column2field_obj.items() if v.en_decoder}
+        attrs['__slots__'] = tuple(column2attr.values()) + tuple(_raw_slot(a) for a in lazy_attrs) + \
+            ('__loaded_columns__', '__dirty__') + tuple(attrs.get('__slots__', ()))
 
         all_columns = '%s,%s' % (primary_key, ','.join(columns_without_primary_key))
+        # 默认查询的列，不包括延迟加载的列
+        select_columns = [primary_key] + [c for c in columns_without_primary_key if not column2field_obj[c].deferred]
         values_args = ','.join(["%s" for i in range(len(columns_without_primary_key) + 1)])
         update_args = ','.join([f"{k}=%s" for k in columns_without_primary_key])
         attrs['__column2attr__'] = column2attr
+        attrs['__attr2column__'] = {attr: column for column, attr in column2attr.items()}
         attrs['__column2field_obj__'] = column2field_obj
         attrs['__table__'] = table_name
         attrs['__primary_key__'] = primary_key
         attrs['__columns_without_primary_key__'] = columns_without_primary_key
-        attrs['__get__'] = """select {all_columns} from {table_name} 
+        attrs['__insert_columns__'] = [primary_key] + columns_without_primary_key  # __insert__中列的顺序
+        attrs['__select_columns__'] = select_columns  # __select__中列的顺序
+        attrs['__deferred_columns__'] = [c for c in columns_without_primary_key if column2field_obj[c].deferred]
+        attrs['__get__'] = """select {select_columns} from {table_name} 
                                 where {primary_key}=%s""".format(primary_key=primary_key,
-                                                                 all_columns=all_columns,
+                                                                 select_columns=','.join(select_columns),
                                                                  table_name=table_name)
 
-        attrs['__select__'] = """select {all_columns} from {table_name}""".format(all_columns=all_columns,
-                                                                                  table_name=table_name)
+        attrs['__select__'] = """select {select_columns} from {table_name}""".format(
+            select_columns=','.join(select_columns),
+            table_name=table_name)
 
         attrs['__insert__'] = """insert into {table_name} ({all_columns})
                                     value({values_args})""".format(table_name=table_name,
                                                                    all_columns=all_columns,
                                                                    values_args=values_args)
 
+        attrs['__upsert__'] = """{insert} on duplicate key update {upsert_args}""".format(
+            insert=attrs['__insert__'],
+            upsert_args=_upsert_args(columns_without_primary_key or [primary_key]))
+
         attrs['__update__'] = """update {table_name} set {update_args} 
                                     where {primary_key}=%s""".format(table_name=table_name,
                                                                      update_args=update_args,
@@ -69,39 +207,177 @@ class ModelMetaclass(type):
         attrs['__delete__'] = """delete from {table_name} 
                                     where {primary_key}=%s""".format(table_name=table_name,
                                                                      primary_key=primary_key)
-        return type.__new__(mcs, name, base_tuple, attrs)
+        model_class = type.__new__(mcs, name, base_tuple, attrs)
+        # 属性名和_LazyColumn的映射，替换掉slot描述符
+        model_class.__lazy_columns__ = {}
+        for attr, en_decoder in lazy_attrs.items():
+            lazy_column = _LazyColumn(model_class.__dict__[attr], model_class.__dict__[_raw_slot(attr)], en_decoder)
+            model_class.__lazy_columns__[attr] = lazy_column
+            setattr(model_class, attr, lazy_column)
+        # 列名和写入数据库返回值的方法的映射，指定了解码器的列写入原始值
+        model_class.__column_setters__ = {}
+        for column, attr in column2attr.items():
+            slot = model_class.__lazy_columns__[attr]._raw_slot if attr in lazy_attrs else model_class.__dict__[attr]
+            model_class.__column_setters__[column] = slot.__set__
+        model_class.__decoders__ = {}  # 查询的列(tuple)和解码函数的映射
+        model_class.__update_sqls__ = {}  # 更新的列(tuple)和update语句的映射
+        model_class.__decode_row__ = staticmethod(_compile_row_decoder(model_class, select_columns))
+        return model_class
+
+
+class Model(metaclass=ModelMetaclass):
+    """
+    model基类，子类的每个列属性都是一个slot，对象不带__dict__，占用的内存更少。
+    未赋值的列属性在读取时抛出AttributeError。
+    需要mapping时使用to_dict()，也支持 obj['name'] 和 dict(obj) 的写法。
+    需要给对象设置其它属性时，在子类中声明 __slots__ = ('__dict__',)
 
+    指定了解码器的列(例如TextType)在第一次访问时才解码，raw_value()可以获取数据库中的原始值，
+    用于不需要解码的透传(例如直接输出json字符串)。没有访问过的列在save(),update()时直接写入原始值。
+    decode_all()可以批量解码query_all()等返回的对象，save_many(),upsert_many()按列批量编码。
 
-class Model(dict, metaclass=ModelMetaclass):  # 继承自 dict ！！！
+    字段指定deferred=True时默认的查询不包括该列，query_all(),iter_all(),get()也可以通过columns参数只查询部分列。
+    从数据库读取的对象访问没有查询的列时，会再执行一次查询加载该列；
+    需要访问多个对象的这些列时，使用load_columns()批量加载(asyncio中只能使用aload_columns())。
+
+    从数据库读取或者保存过的对象会记录之后被赋值的属性，update()只更新这些列(以及原地修改过的json等列)，
+    没有修改时不执行update语句。新创建的对象第一次update()时更新所有的列。
+
+    在子类中声明 __cache__ = LRUCache(...) 可以开启get()的缓存，缓存的是主键对应的行，
+    每次命中都解码出新的对象。通过save(),update(),delete()等方法写入时会删除对应的缓存，
+    直接使用MysqlExecutor写入的数据只能等待缓存过期。
+
+    在子类中声明 __coalescer__ = Coalescer(...) 可以把多线程并发的get()合并成一次get_many()查询，
+    此时主键值的类型需要和数据库返回的主键类型一致。
+    """
+    __slots__ = ()
+    __cache__ = None  # get()使用的缓存(LRUCache)，为None时不缓存
+    __coalescer__ = None  # 合并并发get()的Coalescer，为None时不合并
 
     def __init__(self, **kwargs):
-        # 调用父类的__init__
-        super(Model, self).__init__(**kwargs)
+        for attr, value in kwargs.items():
+            object.__setattr__(self, attr, value)  # 新创建的对象不需要记录修改
+
+    def __setattr__(self, attr, value):
+        """
+        赋值时记录修改过的属性
+        """
+        object.__setattr__(self, attr, value)
+        if attr in self.__attr2column__:
+            try:
+                object.__getattribute__(self, '__dirty__').add(attr)
+            except AttributeError:
+                object.__setattr__(self, '__dirty__', {attr})
 
     def __repr__(self):
         """
         打印出所有的attrs
         """
-        lines = []
-        for column, attr in self.__column2attr__.items():
-            v = getattr(self, attr)
-            lines.append(f'{attr}:{v}')
-        return ','.join(lines)
+        return ','.join([f'{attr}:{v}' for attr, v in self.to_dict().items()])
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def to_dict(self):
+        """
+        转成属性名和值的dict(不包括未赋值的属性)
+        """
+        d = {}
+        for attr in self.__column2attr__.values():
+            try:
+                d[attr] = object.__getattribute__(self, attr)  # 不触发没有查询的列的加载
+            except AttributeError:
+                pass
+        return d
+
+    def __getattr__(self, attr):
+        """
+        访问从数据库读取的对象中没有查询的列(延迟加载的列，或者columns参数中没有的列)时，查询该列
+        """
+        column = getattr(type(self), '__attr2column__', {}).get(attr)
+        if column is None:
+            raise AttributeError(attr)
+        try:
+            loaded = object.__getattribute__(self, '__loaded_columns__')
+        except AttributeError:  # 不是从数据库读取的对象
+            raise AttributeError(attr)
+        if column in loaded:
+            raise AttributeError(attr)
+        self.load_columns([self], [column])
+        return object.__getattribute__(self, attr)
 
-    def __getattr__(self, item):
+    def __getstate__(self):
         """
-        getattr调用的具体方法
+        pickle时只保存已赋值的slot，不触发没有查询的列的加载
         """
+        slots = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name in ('__dict__', '__weakref__') or name in slots:
+                    continue
+                try:
+                    slots[name] = object.__getattribute__(self, name)
+                except AttributeError:
+                    pass
         try:
-            return self[item]
-        except KeyError:
-            raise AttributeError(f"""Model object has no attribute:<{item}>""")
+            d = object.__getattribute__(self, '__dict__')
+        except AttributeError:
+            d = None
+        return d or None, slots
+
+    def __setstate__(self, state):
+        """
+        unpickle时直接恢复slot，不记录为修改过的属性
+        """
+        d, slots = state
+        if d:
+            object.__getattribute__(self, '__dict__').update(d)
+        lazy_columns = self.__lazy_columns__
+        for name, value in slots.items():
+            lazy_column = lazy_columns.get(name)
+            if lazy_column is not None:
+                lazy_column.set_decoded(self, value)  # 保留原始值
+            else:
+                object.__setattr__(self, name, value)
 
-    def __setattr__(self, key, value):
+    def keys(self):
         """
-        赋值方法
+        已赋值的属性名，和__getitem__一起兼容dict(obj)的写法
         """
-        self[key] = value
+        return self.to_dict().keys()
+
+    def __getitem__(self, item):
+        if item not in self.__column2attr__.values():
+            raise KeyError(item)
+        try:
+            return getattr(self, item)
+        except AttributeError:
+            raise KeyError(item)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, item):
+        return item in self.to_dict()
+
+    def raw_value(self, attr, default=None):
+        """
+        获取数据库中的原始值(解码前的值)
+        :param attr: 属性名
+        :param default: 列没有解码器、对象不是从数据库读取(或保存过)或属性被赋值后返回default
+
+        注意：原地修改解码后的值(例如 user.urls['a'] = 1)不会丢弃原始值
+        """
+        lazy_column = self.__lazy_columns__.get(attr)
+        if lazy_column is None:
+            return default
+        return lazy_column.raw(self, default)
 
     def _decode(self, column, value):
         """
@@ -114,40 +390,141 @@ class Model(dict, metaclass=ModelMetaclass):  # 继承自 dict ！！！
             # print('..... end', value)
         return value
 
+    def _default_value(self, column):
+        """
+        未设置值的列使用的默认值
+        """
+        obj = self.__column2field_obj__[column]
+        if None is not obj.default:
+            return obj.default() if callable(obj.default) else obj.default
+        raise ValueError(f'Value of column:<column> is not found !')
+
     def _encode(self, column, value):
         """
         编码列的值
         """
         obj = self.__column2field_obj__[column]
         if value is None:  # 未设置值，则使用默认值
-            if None is not obj.default:
-                value = obj.default() if callable(obj.default) else obj.default
-            else:
-                raise ValueError(f'Value of column:<column> is not found !')
+            value = self._default_value(column)
 
         if obj.en_decoder:
             value = obj.en_decoder.encode(value)  # 调用编码器
         return value
 
-    def _row2obj(self, row):
+    def _db_values_of_column(self, column, objs):
+        """
+        多个对象某一列的值，需要编码的值通过en_decoder.encode_many()一次编码
+        """
+        attr = self.__column2attr__[column]
+        en_decoder = self.__column2field_obj__[column].en_decoder
+        lazy_column = self.__lazy_columns__.get(attr)
+        values = []
+        pending = []  # 需要编码的值在values中的位置
+        for obj in objs:
+            if lazy_column is not None and not lazy_column.is_decoded(obj):
+                raw = lazy_column.raw(obj, _MISSING)
+                if raw is not _MISSING:  # 没有解码过，直接写入原始值
+                    values.append(raw)
+                    continue
+            value = getattr(obj, attr, None)
+            if value is None:
+                value = self._default_value(column)
+            if en_decoder:
+                pending.append(len(values))
+            values.append(value)
+        if pending:
+            encoded = en_decoder.encode_many([values[i] for i in pending])
+            for i, value in zip(pending, encoded):
+                values[i] = value
+        return values
+
+    def _row2obj(self, row, columns=None):
         """
         将单行转成对象
+        :param row: 按照__select__中列的顺序的元组，或者列名和值的dict
+        :param columns: _projection()返回的查询的列，为None时是__select__中的列
         """
         if not row:
             return None
 
-        kwargs = {}
-        cls = self.__class__
-        for column, attr in self.__column2attr__.items():
-            v = row[column]
-            kwargs[attr] = self._decode(column, v)
-        return cls(**kwargs)
+        if columns is None:
+            columns, decode_row = self.__select_columns__, self.__decode_row__
+        else:
+            decode_row = self._decoder_of(columns)
+        if isinstance(row, dict):
+            row = [row[column] for column in columns]
+        return decode_row(row)
+
+    def _decoder_of(self, columns):
+        """
+        查询指定列时使用的解码函数，每种列的组合只生成一次
+        """
+        decode_row = self.__decoders__.get(columns)
+        if decode_row is None:
+            decode_row = self.__decoders__[columns] = _compile_row_decoder(type(self), columns)
+        return decode_row
+
+    def _projection(self, columns):
+        """
+        检查columns参数，返回主键在第一列的tuple，columns为None时返回None
+        """
+        if columns is None:
+            return None
+        unknown = [c for c in columns if c not in self.__column2field_obj__]
+        if unknown or isinstance(columns, str):
+            raise ValueError(f"columns:{columns} is incorrect !")
+        return tuple(dict.fromkeys([self.__primary_key__] + list(columns)))
+
+    def _select_sql(self, columns):
+        """
+        查询指定列的select语句，columns为None时是__select__
+        """
+        if columns is None:
+            return self.__select__
+        return f"select {','.join(columns)} from {self.__table__}"
+
+    def _invalidate_cache(self, objs):
+        """
+        删除对象主键对应的缓存
+        在scope()的事务中时，提交前其它线程可能把旧的行再次写入缓存，所以提交时再删除一次
+        """
+        cache = self.__cache__
+        if cache is None:
+            return
+        pinned = MySqlDBPool.pinned()
+        deferred = pinned is not None and pinned.in_transaction
+        attr = self.__column2attr__[self.__primary_key__]
+        for obj in objs:
+            pk = getattr(obj, attr, None)
+            if pk is not None:
+                cache.delete(pk)
+                if deferred:
+                    pinned.cache_keys.append((cache, pk))
+
+    def _cache(self):
+        """
+        get()等使用的缓存，强制使用主库时(use_primary()或scope()中)不读写缓存，保证能读到自己刚写入的行
+        """
+        return None if MySqlDBPool.primary_forced() else self.__cache__
+
+    def _cache_key(self, pk):
+        """
+        get()的参数对应的缓存key
+        """
+        if isinstance(pk, (list, tuple)) and len(pk) == 1:
+            return pk[0]
+        return pk
 
     def _db_value_of_column(self, column):
         """
         根据列名获取该列的值
         """
         attr = self.__column2attr__[column]
+        lazy_column = self.__lazy_columns__.get(attr)
+        if lazy_column is not None and not lazy_column.is_decoded(self):
+            raw = lazy_column.raw(self, _MISSING)
+            if raw is not _MISSING:  # 没有解码过，直接写入原始值
+                return raw
         value = None
         try:
             value = getattr(self, attr)  # 获取到对象属性的值
@@ -155,11 +532,11 @@ class Model(dict, metaclass=ModelMetaclass):  # 继承自 dict ！！！
             pass
         return self._encode(column, value)
 
-    def query_all(self, where=None, args=None, **kwargs):
+    def _query_all_sql(self, where, args, kwargs):
         """
-        指定查询条件和排序，分页等搜索
+        构造query_all()的sql和参数
         """
-        sql_elements = [self.__select__]
+        sql_elements = [self._select_sql(self._projection(kwargs.get('columns')))]
         if where:
             sql_elements.append('where')
             sql_elements.append(where)
@@ -182,50 +559,810 @@ class Model(dict, metaclass=ModelMetaclass):  # 继承自 dict ！！！
                 args.extend(limit)
             else:
                 raise ValueError(f"limit:{limit} is incorrect !")
-        sql = ' '.join(sql_elements)
-        rows = MysqlExecutor.query_multi_rows(sql, args)
-        return [self._row2obj(row) for row in rows]
+        return ' '.join(sql_elements), args
 
-    def count_of_rows(self, column, where=None, args=None):
+    def query_all(self, where=None, args=None, **kwargs):
         """
-        获取指定查询条件的行数
+        指定查询条件和排序，分页等搜索
+        kwargs支持order_by, limit，以及columns(只查询的列名集合，主键总是会被查询)
+        """
+        columns = self._projection(kwargs.get('columns'))
+        sql, args = self._query_all_sql(where, args, kwargs)
+        rows = MysqlExecutor.query_multi_rows(sql, args, cursor_class=MySqlDBPool.tuple_cursor_class())
+        return [self._row2obj(row, columns) for row in rows]
+
+    def _iter_all_sql(self, where, args, last_seen, chunk_size, columns=None):
+        """
+        构造iter_all()中单页的sql和参数
+        """
+        conditions = []
+        chunk_args = list(args) if args else []
+        if where:
+            conditions.append(f'({where})')
+        if last_seen is not None:
+            conditions.append(f'{self.__primary_key__}>%s')
+            chunk_args.append(last_seen)
+
+        sql_elements = [self._select_sql(columns)]
+        if conditions:
+            sql_elements.append('where')
+            sql_elements.append(' and '.join(conditions))
+        sql_elements.append(f'order by {self.__primary_key__} limit %s')
+        chunk_args.append(chunk_size)
+        return ' '.join(sql_elements), chunk_args
+
+    def iter_all(self, where=None, args=None, chunk_size=1000, columns=None):
+        """
+        按主键顺序遍历符合条件的所有行
+        :param where: 查询条件，规则和query_all()相同
+        :param args: where中占位符对应的参数集合
+        :param chunk_size: 每次查询的行数
+        :param columns: 只查询的列名集合，规则和query_all()相同
+        :return: model对象的生成器
+
+        使用 where pk > 上一页最后的主键 的方式分页，每页的查询代价和遍历的深度无关。
+        每页都是一次独立的查询，遍历期间不会一直占用连接，也不会持有长事务。
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+
+        columns = self._projection(columns)
+        last_seen = None
+        while True:
+            sql, chunk_args = self._iter_all_sql(where, args, last_seen, chunk_size, columns)
+            rows = MysqlExecutor.query_multi_rows(sql, chunk_args,
+                                                  cursor_class=MySqlDBPool.tuple_cursor_class())
+            for row in rows:
+                yield self._row2obj(row, columns)
+
+            if len(rows) < chunk_size:
+                return
+            last_seen = rows[-1][0]
+
+    def _min_max_sql(self, where):
+        """
+        构造查询主键最小值和最大值的sql
+        """
+        sql = [f'select min({self.__primary_key__}), max({self.__primary_key__}) from {self.__table__}']
+        if where:
+            sql.append('where')
+            sql.append(where)
+        return ' '.join(sql)
+
+    def _boundary_sql(self, where):
+        """
+        构造按主键顺序取第N行主键的sql
+        """
+        sql = [f'select {self.__primary_key__} from {self.__table__}']
+        if where:
+            sql.append('where')
+            sql.append(where)
+        sql.append(f'order by {self.__primary_key__} limit %s, 1')
+        return ' '.join(sql)
+
+    def _scan_boundaries(self, where, args, ranges, split):
+        """
+        把主键空间拆分成最多ranges个区间
+        :return: 边界的list，相邻的两个边界是一个区间[low, high)，首尾的None表示没有限制；没有符合条件的行时为[]
+        """
+        tuple_cursor = MySqlDBPool.tuple_cursor_class()
+        if split in (None, 'range'):
+            row = MysqlExecutor.query_one_row(self._min_max_sql(where), args, cursor_class=tuple_cursor)
+            if not row or row[0] is None:
+                return []
+            low, high = row
+            if isinstance(low, int) and isinstance(high, int):
+                span = high - low + 1
+                inner = sorted({low + span * i // ranges for i in range(1, ranges)} - {low})
+                return [None] + inner + [None]
+            if split == 'range':
+                raise ValueError(f'split:{split} is incorrect ! The primary key must be integer.')
+        elif split != 'sample':
+            raise ValueError(f'split:{split} is incorrect !')
+
+        count = self.count_of_rows(self.__primary_key__, where, args)
+        if not count:
+            return []
+        sql = self._boundary_sql(where)
+        inner = []
+        for i in range(1, ranges):
+            row = MysqlExecutor.query_one_row(sql, (list(args) if args else []) + [count * i // ranges],
+                                              cursor_class=tuple_cursor)
+            if row and (not inner or row[0] > inner[-1]):
+                inner.append(row[0])
+        return [None] + inner + [None]
+
+    def _range_where(self, where, args, low, high):
+        """
+        在查询条件上增加主键区间[low, high)的限制
+        """
+        conditions = [f'({where})'] if where else []
+        range_args = list(args) if args else []
+        if low is not None:
+            conditions.append(f'{self.__primary_key__}>=%s')
+            range_args.append(low)
+        if high is not None:
+            conditions.append(f'{self.__primary_key__}<%s')
+            range_args.append(high)
+        return ' and '.join(conditions) or None, range_args
+
+    def parallel_scan(self, workers=4, where=None, args=None, fn=None, chunk_size=1000, columns=None,
+                      ordered=False, ranges=None, split=None, prefetch=2):
+        """
+        把主键空间拆分成多个区间，使用多个线程并发遍历符合条件的所有行
+        :param workers: 并发的线程数，每个线程的查询使用各自的连接，不应超过连接池的最大连接数
+        :param where: 查询条件，规则和iter_all()相同
+        :param args: where中占位符对应的参数集合
+        :param fn: 在工作线程中对每个model对象调用的函数(例如序列化)，返回它的结果；为None时返回model对象
+        :param chunk_size: 每次查询的行数
+        :param columns: 只查询的列名集合，规则和query_all()相同
+        :param ordered: 为True时按主键顺序返回，否则按查询完成的顺序返回
+        :param ranges: 拆分的区间数，默认为workers * 4，区间越多各线程的负载越均衡
+        :param split: 拆分区间的方式
+                      'range': 按主键的MIN/MAX平均拆分，主键需要是整数
+                      'sample': 按主键顺序在等间隔的位置取样作为边界，适用于非整数或分布不均匀的主键
+                      None: 整数主键使用'range'，否则使用'sample'
+        :param prefetch: 每个区间(ordered为False时为每个线程)最多缓存的页数，消费不及时时工作线程阻塞
+        :return: model对象或fn结果的生成器
+
+        每个区间使用和iter_all()相同的方式分页，不持有长事务。
+        生成器提前关闭时，工作线程在当前查询结束后退出。
+
+        例如：
+            for line in User().parallel_scan(workers=8, where='age>%s', args=[10], fn=json_line):
+                f.write(line)
+        """
+        if workers <= 0:
+            raise ValueError(f"workers:{workers} is incorrect !")
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+        if prefetch <= 0:
+            raise ValueError(f"prefetch:{prefetch} is incorrect !")
+        ranges = workers * 4 if ranges is None else ranges
+        if ranges <= 0:
+            raise ValueError(f"ranges:{ranges} is incorrect !")
+
+        boundaries = self._scan_boundaries(where, args, ranges, split)
+        bounds = list(zip(boundaries[:-1], boundaries[1:]))
+        if not bounds:
+            return
+        if ordered:
+            queues = [queue.Queue(prefetch) for _ in bounds]
+        else:
+            queues = [queue.Queue(prefetch * workers)] * len(bounds)  # 所有区间共用一个队列
+        stop = threading.Event()
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scan(q, low, high):
+            # 队列中的元素为(页, 异常)，(None, None)表示区间遍历结束
+            try:
+                range_where, range_args = self._range_where(where, args, low, high)
+                page = []
+                for obj in self.iter_all(range_where, range_args, chunk_size, columns):
+                    page.append(obj if fn is None else fn(obj))
+                    if len(page) == chunk_size:
+                        if not put(q, (page, None)):
+                            return
+                        page = []
+                if page and not put(q, (page, None)):
+                    return
+                put(q, (None, None))
+            except Exception as e:
+                put(q, (None, e))
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parallel_scan')
+        futures = []
+        try:
+            for q, (low, high) in zip(queues, bounds):
+                futures.append(executor.submit(scan, q, low, high))
+            index = 0
+            while index < len(bounds):
+                page, error = queues[index].get()
+                if error is not None:
+                    raise error
+                if page is None:
+                    index += 1
+                    continue
+                yield from page
+        finally:
+            stop.set()
+            for future in futures:  # 取消还没有开始的区间
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _count_sql(self, column, where):
+        """
+        构造count_of_rows()的sql
         """
         sql = ["""select count({column}) as total from {table}""".format(column=column, table=self.__table__)]
         if None is not where:
             sql.append('where')
             sql.append(where)
-        sql = ' '.join(sql)
-        row = MysqlExecutor.query_one_row(sql, args)
+        return ' '.join(sql)
+
+    def count_of_rows(self, column, where=None, args=None):
+        """
+        获取指定查询条件的行数
+        """
+        row = MysqlExecutor.query_one_row(self._count_sql(column, where), args,
+                                          cursor_class=MySqlDBPool.tuple_cursor_class())
         if not row:
             return 0
-        return row['total']
+        return row[0]
 
-    def save(self):
+    def _insert_args(self):
         """
-        保存
+        和__insert__中的列顺序一致的参数集合
         """
         args = [self._db_value_of_column(self.__primary_key__)]
         args.extend(list(map(self._db_value_of_column, self.__columns_without_primary_key__)))
-        return MysqlExecutor.execute(self.__insert__, args)
+        return args
+
+    def _insert_rows(self, objs):
+        """
+        多个对象的insert参数，按列批量编码
+        """
+        return list(zip(*[self._db_values_of_column(column, objs) for column in self.__insert_columns__]))
+
+    def decode_all(self, objs, attrs=None):
+        """
+        批量解码多个对象还没有解码的列，每列调用一次en_decoder.decode_many()
+        :param objs: model对象的集合，例如query_all()的结果
+        :param attrs: 需要解码的属性名集合，默认为所有指定了解码器的属性
+        :return: objs
+        """
+        for attr in (self.__lazy_columns__ if attrs is None else attrs):
+            lazy_column = self.__lazy_columns__.get(attr)
+            if lazy_column is None:
+                raise ValueError(f'attr:{attr} is incorrect !')
+            pending = [obj for obj in objs if not lazy_column.is_decoded(obj)
+                       and lazy_column.raw(obj, _MISSING) is not _MISSING]
+            if not pending:
+                continue
+            values = lazy_column.decode_many([lazy_column.raw(obj) for obj in pending])
+            for obj, value in zip(pending, values):
+                lazy_column.set_decoded(obj, value)
+        return objs
+
+    def save(self):
+        """
+        保存
+        """
+        args = self._insert_args()
+        try:
+            result = MysqlExecutor.execute(self.__insert__, args)
+        finally:
+            self._invalidate_cache([self])
+        self._mark_clean([self], self.__insert_columns__, [args])
+        return result
+
+    def save_many(self, objs):
+        """
+        批量保存，多个对象合并成多行的insert语句执行
+        :param objs: model对象的集合
+        :return: 每个分块受影响的行数和第一条insert数据的ID，规则和MysqlExecutor.execute_many()相同
+        """
+        rows = self._insert_rows(objs)
+        try:
+            result = MysqlExecutor.execute_many(self.__insert__, rows)
+        finally:
+            self._invalidate_cache(objs)
+        self._mark_clean(objs, self.__insert_columns__, rows)
+        return result
+
+    def _upsert_sql(self, update_columns):
+        """
+        构造upsert_many()的sql
+        """
+        if update_columns is None:
+            return self.__upsert__
+
+        unknown = [c for c in update_columns if c not in self.__columns_without_primary_key__]
+        if unknown or not update_columns:
+            raise ValueError(f"update_columns:{update_columns} is incorrect !")
+        return f'{self.__insert__} on duplicate key update {_upsert_args(update_columns)}'
+
+    def upsert_many(self, objs, update_columns=None):
+        """
+        批量插入或更新(insert ... on duplicate key update)，分块规则和save_many()相同
+        :param objs: model对象的集合
+        :param update_columns: 主键冲突时需要更新的列名集合，默认为除主键外的所有列
+        :return: 每个分块受影响的行数和第一条insert数据的ID(MySQL对被更新的行计2行受影响)
+        """
+        sql = self._upsert_sql(update_columns)
+        rows = self._insert_rows(objs)
+        try:
+            result = MysqlExecutor.execute_many(sql, rows)
+        finally:
+            self._invalidate_cache(objs)
+        self._mark_clean(objs, self.__insert_columns__, rows)
+        return result
+
+    def _delete_args(self):
+        """
+        和__delete__对应的参数集合
+        """
+        return [self._db_value_of_column(self.__primary_key__)]
 
     def delete(self):
         """
         删除主键对应的行
         """
-        args = [self._db_value_of_column(self.__primary_key__)]
-        return MysqlExecutor.execute(self.__delete__, args)
+        try:
+            return MysqlExecutor.execute(self.__delete__, self._delete_args())
+        finally:
+            self._invalidate_cache([self])
 
-    def update(self):
+    def _update_args(self):
         """
-        更新主键对应的行
+        和__update__中的列顺序一致的参数集合
         """
         args = list(map(self._db_value_of_column, self.__columns_without_primary_key__))
         args.append(self._db_value_of_column(self.__primary_key__))
-        return MysqlExecutor.execute(self.__update__, args)
+        return args
+
+    def _is_tracked(self):
+        """
+        是否记录了修改(从数据库读取或者保存过的对象)
+        """
+        try:
+            object.__getattribute__(self, '__loaded_columns__')
+            return True
+        except AttributeError:
+            return False
+
+    def _changed_columns(self):
+        """
+        需要update的列，按照__columns_without_primary_key__的顺序
+        新创建的对象返回所有的列；其它对象返回被赋值过的列，以及解码后原地修改过的列(和原始值解码后的值不同)。
+        比较的是解码后的值，所以原始值的格式(空格，ensure_ascii等)和编码器的输出不同时不会被误判为修改
+        """
+        if not self._is_tracked():
+            return self.__columns_without_primary_key__
+        try:
+            dirty = object.__getattribute__(self, '__dirty__')
+        except AttributeError:
+            dirty = ()
+        columns = []
+        for column in self.__columns_without_primary_key__:
+            attr = self.__column2attr__[column]
+            if attr in dirty:
+                columns.append(column)
+                continue
+            lazy_column = self.__lazy_columns__.get(attr)
+            if lazy_column is None or not lazy_column.is_decoded(self):
+                continue
+            value = object.__getattribute__(self, attr)
+            if isinstance(value, _IMMUTABLE_TYPES):  # 不可能被原地修改
+                continue
+            raw = lazy_column.raw(self, _MISSING)
+            if raw is not _MISSING and lazy_column.decode(raw) != value:
+                columns.append(column)
+        return columns
+
+    def _mark_clean(self, objs, columns, rows):
+        """
+        写入成功后清空修改记录，新创建的对象开始记录修改
+        已解码的列把写入的值作为原始值，用于之后判断是否被原地修改
+        :param columns: 写入的列名集合
+        :param rows: 和objs对应的写入的参数集合，参数的顺序和columns相同
+        """
+        lazy_columns = [(i, self.__lazy_columns__[self.__column2attr__[column]]) for i, column in enumerate(columns)
+                        if self.__column2attr__[column] in self.__lazy_columns__]
+        for obj, row in zip(objs, rows):
+            if not obj._is_tracked():
+                loaded = frozenset(self.__attr2column__[attr] for attr in obj.to_dict())
+                object.__setattr__(obj, '__loaded_columns__', loaded)
+            try:
+                object.__delattr__(obj, '__dirty__')
+            except AttributeError:
+                pass
+            for i, lazy_column in lazy_columns:
+                if lazy_column.is_decoded(obj):
+                    lazy_column.set_raw(obj, row[i])
+
+    def _update_sql(self, columns):
+        """
+        只更新columns的update语句，每种列的组合只生成一次
+        """
+        columns = tuple(columns)
+        sql = self.__update_sqls__.get(columns)
+        if sql is None:
+            update_args = ','.join([f"{k}=%s" for k in columns])
+            sql = self.__update_sqls__[columns] = f'update {self.__table__} set {update_args} ' \
+                                                  f'where {self.__primary_key__}=%s'
+        return sql
+
+    def _update_many_sql(self, columns, count):
+        """
+        一条语句更新count行的columns列：
+            update t set c1=case pk when %s then %s ... end, ... where pk in (%s,...)
+        """
+        primary_key = self.__primary_key__
+        cases = ' '.join(['when %s then %s'] * count)
+        update_args = ','.join([f'{column}=case {primary_key} {cases} end' for column in columns])
+        values_args = ','.join(['%s'] * count)
+        return f'update {self.__table__} set {update_args} where {primary_key} in ({values_args})'
+
+    def _update_many_args(self, objs, columns):
+        """
+        和_update_many_sql()对应的参数集合
+        :return: 参数集合，以及每个对象按columns顺序的写入值(用于_mark_clean())
+        """
+        keys = self._db_values_of_column(self.__primary_key__, objs)
+        values = [self._db_values_of_column(column, objs) for column in columns]
+        args = []
+        for column_values in values:
+            for key, value in zip(keys, column_values):
+                args.append(key)
+                args.append(value)
+        args.extend(keys)
+        return args, list(zip(*values))
+
+    def _delete_many_sql(self, count):
+        """
+        构造按主键批量删除的sql
+        """
+        return f"delete from {self.__table__} where {self.__primary_key__} in ({','.join(['%s'] * count)})"
+
+    def _update_statement(self):
+        """
+        update()执行的sql，参数和更新的列，没有需要更新的列时返回(None, None, [])
+        """
+        columns = self._changed_columns()
+        if not columns:
+            return None, None, columns
+        if columns is self.__columns_without_primary_key__:
+            return self.__update__, self._update_args(), columns
+        args = list(map(self._db_value_of_column, columns))
+        args.append(self._db_value_of_column(self.__primary_key__))
+        return self._update_sql(columns), args, columns
+
+    def update(self):
+        """
+        更新主键对应的行，只更新修改过的列
+        :return: 受影响的行数和ID，没有修改时返回(0, 0)且不访问数据库
+        """
+        sql, args, columns = self._update_statement()
+        if sql is None:
+            return 0, 0
+        try:
+            result = MysqlExecutor.execute(sql, args)
+        finally:
+            self._invalidate_cache([self])
+        self._mark_clean([self], columns, [args])
+        return result
+
+    def _get_many_sql(self, count, columns=None):
+        """
+        构造按主键批量查询的sql
+        """
+        return '{select} where {primary_key} in ({values_args})'.format(select=self._select_sql(columns),
+                                                                        primary_key=self.__primary_key__,
+                                                                        values_args=','.join(['%s'] * count))
 
-    def get(self, pk):
+    def _fetch_rows(self, keys, chunk_size):
         """
-        获取指定主键值的行
+        分块查询主键对应的行，开启了__cache__时回填缓存
+        :return: 主键和元组行的dict
         """
-        row = MysqlExecutor.query_one_row(self.__get__, pk)
+        cache = self._cache()
+        generation = cache.generation if cache is not None else None
+        rows = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            for row in MysqlExecutor.query_multi_rows(self._get_many_sql(len(chunk)), chunk,
+                                                      cursor_class=MySqlDBPool.tuple_cursor_class()):
+                rows[row[0]] = row
+        if cache is not None:
+            for key, row in rows.items():
+                cache.set(key, row, generation)
+        return rows
+
+    def _cached_rows(self, keys):
+        """
+        从__cache__中读取主键对应的行
+        :return: 主键和元组行的dict(不包括未命中的主键)
+        """
+        rows = {}
+        cache = self._cache()
+        if cache is not None:
+            for key in keys:
+                row = cache.get(key)
+                if row is not None:
+                    rows[key] = row
+        return rows
+
+    def get_many(self, pks, chunk_size=500):
+        """
+        批量获取多个主键值的行，每chunk_size个主键一次 where pk in (...) 查询
+        :param pks: 主键值的集合，类型需要和数据库返回的主键类型一致
+        :param chunk_size: 每次查询的主键数量
+        :return: 和pks顺序一致的model对象list，不存在的主键对应None
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+
+        keys = list(dict.fromkeys(pks))  # 去重并保持顺序
+        rows = self._cached_rows(keys)
+        missing = [k for k in keys if k not in rows]
+        if missing:
+            rows.update(self._fetch_rows(missing, chunk_size))
+        return [self._row2obj(rows.get(pk)) for pk in pks]
+
+    def _get_sql(self, columns):
+        """
+        构造按主键查询指定列的sql
+        """
+        return f'{self._select_sql(columns)} where {self.__primary_key__}=%s'
+
+    def _load_columns_plan(self, objs, columns):
+        """
+        找出objs中需要加载的列
+        :return: (需要加载的对象和列名的集合, 查询的列, 去重的主键值)
+        """
+        if columns is None:
+            columns = self.__columns_without_primary_key__
+        elif self._projection(columns) is None:
+            raise ValueError(f"columns:{columns} is incorrect !")
+        pk_attr = self.__column2attr__[self.__primary_key__]
+        pending = []
+        needed = {}
+        for obj in objs:
+            if obj is None:
+                continue
+            try:
+                loaded = object.__getattribute__(obj, '__loaded_columns__')
+            except AttributeError:  # 不是从数据库读取的对象
+                continue
+            assigned = obj.to_dict()
+            missing = [c for c in columns if c not in loaded and self.__column2attr__[c] not in assigned]
+            if missing:
+                pending.append((obj, missing))
+                needed.update(dict.fromkeys(missing))
+        query_columns = self._projection(list(needed))
+        keys = list(dict.fromkeys(object.__getattribute__(obj, pk_attr) for obj, _ in pending))
+        return pending, query_columns, keys
+
+    def _assign_columns(self, pending, query_columns, rows):
+        """
+        把查询到的列写入对象
+        :param rows: 主键值和元组行的dict
+        """
+        pk_attr = self.__column2attr__[self.__primary_key__]
+        index = {column: i for i, column in enumerate(query_columns)}
+        setters = self.__column_setters__
+        for obj, missing in pending:
+            row = rows.get(object.__getattribute__(obj, pk_attr))
+            if row is None:  # 已经被删除
+                continue
+            for column in missing:
+                setters[column](obj, row[index[column]])
+
+    def load_columns(self, objs, columns=None, chunk_size=500):
+        """
+        批量加载从数据库读取的对象中没有查询的列，每chunk_size个主键一次 where pk in (...) 查询
+        :param objs: model对象的集合，例如query_all()的结果，已赋值的列和不是从数据库读取的对象不会被覆盖
+        :param columns: 需要加载的列名集合，默认为所有没有查询的列
+        :param chunk_size: 每次查询的主键数量
+        :return: objs
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+        pending, query_columns, keys = self._load_columns_plan(objs, columns)
+        if not pending:
+            return objs
+
+        rows = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            for row in MysqlExecutor.query_multi_rows(self._get_many_sql(len(chunk), query_columns), chunk,
+                                                      cursor_class=MySqlDBPool.tuple_cursor_class()):
+                rows[row[0]] = row
+        self._assign_columns(pending, query_columns, rows)
+        return objs
+
+    def get(self, pk, columns=None):
+        """
+        获取指定主键值的行，开启了__cache__时优先从缓存中读取，开启了__coalescer__时合并并发的查询
+        强制使用主库时(use_primary()或scope()中)不使用__cache__和__coalescer__
+        :param columns: 只查询的列名集合，规则和query_all()相同，指定时不使用__cache__和__coalescer__
+        """
+        if columns is not None:
+            columns = self._projection(columns)
+            row = MysqlExecutor.query_one_row(self._get_sql(columns), pk,
+                                              cursor_class=MySqlDBPool.tuple_cursor_class())
+            return self._row2obj(row, columns)
+
+        cache = self._cache()
+        coalescer = self.__coalescer__
+        if MySqlDBPool.primary_forced() or MySqlDBPool.pinned() is not None:
+            coalescer = None  # 合并的查询在其它线程的上下文中执行，看不到本线程的连接和事务
+        if cache is None and coalescer is None:
+            row = MysqlExecutor.query_one_row(self.__get__, pk, cursor_class=MySqlDBPool.tuple_cursor_class())
+            return self._row2obj(row)
+
+        key = self._cache_key(pk)
+        row = cache.get(key) if cache is not None else None
+        if row is None and coalescer is not None:
+            row = coalescer.load(key, lambda keys: self._fetch_rows(keys, coalescer.max_batch))
+        elif row is None:
+            generation = cache.generation  # 查询期间有写入时不回填缓存，避免缓存旧数据
+            row = MysqlExecutor.query_one_row(self.__get__, pk, cursor_class=MySqlDBPool.tuple_cursor_class())
+            if row:
+                cache.set(key, row, generation)
+        return self._row2obj(row)
+
+    # 以下是asyncio版本的方法，使用AsyncMySqlDBPool的连接池，参数和返回值都和同名的同步方法相同
+
+    async def aquery_all(self, where=None, args=None, **kwargs):
+        """
+        query_all()的asyncio版本
+        """
+        columns = self._projection(kwargs.get('columns'))
+        sql, args = self._query_all_sql(where, args, kwargs)
+        rows = await AsyncMysqlExecutor.query_multi_rows(sql, args, AsyncMySqlDBPool.tuple_cursor_class())
+        return [self._row2obj(row, columns) for row in rows]
+
+    async def aiter_all(self, where=None, args=None, chunk_size=1000, columns=None):
+        """
+        iter_all()的asyncio版本
+        :return: model对象的异步生成器
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+
+        columns = self._projection(columns)
+        last_seen = None
+        while True:
+            sql, chunk_args = self._iter_all_sql(where, args, last_seen, chunk_size, columns)
+            rows = await AsyncMysqlExecutor.query_multi_rows(sql, chunk_args,
+                                                             AsyncMySqlDBPool.tuple_cursor_class())
+            for row in rows:
+                yield self._row2obj(row, columns)
+
+            if len(rows) < chunk_size:
+                return
+            last_seen = rows[-1][0]
+
+    async def acount_of_rows(self, column, where=None, args=None):
+        """
+        count_of_rows()的asyncio版本
+        """
+        row = await AsyncMysqlExecutor.query_one_row(self._count_sql(column, where), args,
+                                                     AsyncMySqlDBPool.tuple_cursor_class())
+        if not row:
+            return 0
+        return row[0]
+
+    async def asave(self):
+        """
+        save()的asyncio版本
+        """
+        args = self._insert_args()
+        try:
+            result = await AsyncMysqlExecutor.execute(self.__insert__, args)
+        finally:
+            self._invalidate_cache([self])
+        self._mark_clean([self], self.__insert_columns__, [args])
+        return result
+
+    async def asave_many(self, objs):
+        """
+        save_many()的asyncio版本
+        """
+        rows = self._insert_rows(objs)
+        try:
+            result = await AsyncMysqlExecutor.execute_many(self.__insert__, rows)
+        finally:
+            self._invalidate_cache(objs)
+        self._mark_clean(objs, self.__insert_columns__, rows)
+        return result
+
+    async def aupsert_many(self, objs, update_columns=None):
+        """
+        upsert_many()的asyncio版本
+        """
+        sql = self._upsert_sql(update_columns)
+        rows = self._insert_rows(objs)
+        try:
+            result = await AsyncMysqlExecutor.execute_many(sql, rows)
+        finally:
+            self._invalidate_cache(objs)
+        self._mark_clean(objs, self.__insert_columns__, rows)
+        return result
+
+    async def adelete(self):
+        """
+        delete()的asyncio版本
+        """
+        try:
+            return await AsyncMysqlExecutor.execute(self.__delete__, self._delete_args())
+        finally:
+            self._invalidate_cache([self])
+
+    async def aupdate(self):
+        """
+        update()的asyncio版本
+        """
+        sql, args, columns = self._update_statement()
+        if sql is None:
+            return 0, 0
+        try:
+            result = await AsyncMysqlExecutor.execute(sql, args)
+        finally:
+            self._invalidate_cache([self])
+        self._mark_clean([self], columns, [args])
+        return result
+
+    async def aget_many(self, pks, chunk_size=500):
+        """
+        get_many()的asyncio版本
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+
+        keys = list(dict.fromkeys(pks))
+        rows = self._cached_rows(keys)
+        missing = [k for k in keys if k not in rows]
+        cache = self._cache()
+        generation = cache.generation if cache is not None else None
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            for row in await AsyncMysqlExecutor.query_multi_rows(self._get_many_sql(len(chunk)), chunk,
+                                                                 AsyncMySqlDBPool.tuple_cursor_class()):
+                rows[row[0]] = row
+                if cache is not None:
+                    cache.set(row[0], row, generation)
+        return [self._row2obj(rows.get(pk)) for pk in pks]
+
+    async def aload_columns(self, objs, columns=None, chunk_size=500):
+        """
+        load_columns()的asyncio版本
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size:{chunk_size} is incorrect !")
+        pending, query_columns, keys = self._load_columns_plan(objs, columns)
+        if not pending:
+            return objs
+
+        rows = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            for row in await AsyncMysqlExecutor.query_multi_rows(self._get_many_sql(len(chunk), query_columns), chunk,
+                                                                 AsyncMySqlDBPool.tuple_cursor_class()):
+                rows[row[0]] = row
+        self._assign_columns(pending, query_columns, rows)
+        return objs
+
+    async def aget(self, pk, columns=None):
+        """
+        get()的asyncio版本(不使用__coalescer__)
+        """
+        if columns is not None:
+            columns = self._projection(columns)
+            row = await AsyncMysqlExecutor.query_one_row(self._get_sql(columns), pk,
+                                                         AsyncMySqlDBPool.tuple_cursor_class())
+            return self._row2obj(row, columns)
+
+        cache = self._cache()
+        if cache is None:
+            row = await AsyncMysqlExecutor.query_one_row(self.__get__, pk, AsyncMySqlDBPool.tuple_cursor_class())
+            return self._row2obj(row)
+
+        key = self._cache_key(pk)
+        row = cache.get(key)
+        if row is None:
+            generation = cache.generation
+            row = await AsyncMysqlExecutor.query_one_row(self.__get__, pk, AsyncMySqlDBPool.tuple_cursor_class())
+            if row:
+                cache.set(key, row, generation)
         return self._row2obj(row)
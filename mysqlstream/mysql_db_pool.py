@@ -1,18 +1,94 @@
 # brief: DB的链接池
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
 import pymysql
+from pymysql.constants import CLIENT
 try:
     from DBUtils.PooledDB import PooledDB
 except:
     from dbutils.pooled_db import PooledDB
 
+ROLE_PRIMARY = 'primary'  # 主库，所有的写操作和事务都在主库上执行
+ROLE_REPLICA = 'replica'  # 从库，只用于读操作
+
+BALANCE_ROUND_ROBIN = 'round_robin'  # 从库之间轮询
+BALANCE_LEAST_OUTSTANDING = 'least_outstanding'  # 选择正在使用的连接最少的从库
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # 获取连接等待时间的直方图的上界(秒)
+
+
+class _PinnedConnection:
+    """
+    pin()的上下文中固定使用的连接
+    """
+    __slots__ = ('connection', 'pool_name', 'in_transaction', 'executed_sql_list', 'cache_keys')
+
+    def __init__(self, connection, pool_name):
+        self.connection = connection
+        self.pool_name = pool_name
+        self.in_transaction = False  # 是否在MysqlExecutor对象开始的事务中
+        self.executed_sql_list = []  # 事务中执行过的写操作，提交后让相关的查询缓存失效
+        self.cache_keys = []  # 事务中修改过的model缓存的(LRUCache, 主键)，提交后再次删除
+
+
+class _PoolMetrics:
+    """
+    单个连接池的统计信息和自适应的配置
+    """
+
+    def __init__(self, min_idle_connections, max_connections, adaptive, target_wait, quiet_period):
+        self.min_idle_connections = min_idle_connections
+        self.max_connections = max_connections
+        self.adaptive = adaptive
+        self.target_wait = target_wait
+        self.quiet_period = quiet_period
+        self.waiters = 0  # 正在等待连接的线程数
+        self.checkouts = 0  # 获取连接的次数
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self.connections = weakref.WeakKeyDictionary()  # pymysql连接和[打开的时间, 被获取的次数]的映射
+        self.last_slow = self.last_shrink = time.monotonic()  # 最近一次等待超时和收缩的时间
+        self.blocked = 0  # 连接数达到上限后正在等待连接的线程数，在连接池的锁中修改
+        self.watcher = None  # 有线程在等待时增加连接数上限的线程，每个连接池最多一个
+
+    def record_checkout(self, wait, raw_connection):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        i = 0
+        while i < len(WAIT_BUCKETS) and wait > WAIT_BUCKETS[i]:
+            i += 1
+        self.wait_histogram[i] += 1
+        item = self.connections.get(raw_connection)
+        if item is None:
+            item = self.connections[raw_connection] = [time.monotonic(), 0]
+        item[1] += 1
+
 
 class MySqlDBPool:
-    _pool = None  # 连接池对象
+    _pool = None  # 主库的连接池对象
+    _pools = {}  # 连接池名称和连接池对象的映射
+    _primary_name = None  # 主库的连接池名称
+    _replica_names = []  # 从库的连接池名称
+    _outstanding = {}  # 连接池名称和正在使用的连接数的映射
+    _metrics = {}  # 连接池名称和_PoolMetrics的映射
+    _balance_policy = BALANCE_ROUND_ROBIN  # 从库的负载均衡策略
+    _next_replica = 0  # 轮询时下一个从库的下标
+    _lock = threading.Lock()
+    _force_primary = ContextVar('mysqlstream_force_primary', default=False)  # 读操作是否强制使用主库
+    _pinned = ContextVar('mysqlstream_pinned_connection', default=None)  # pin()中固定使用的连接
+    _cursor_class = pymysql.cursors.DictCursor  # 初始化时指定的cursor类型
+    _encoding = 'utf8'  # 和字符集对应的编码
 
     @classmethod
     def init_pool(cls, min_idle_connections, max_connections,
                   host, port, username, password, charset='utf8mb4',
-                  cursor_class=pymysql.cursors.DictCursor):
+                  cursor_class=pymysql.cursors.DictCursor, name='default', role=ROLE_PRIMARY,
+                  blocking=False, adaptive=False, target_wait=0.01, quiet_period=60, multi_statements=False):
         """
         初始化连接池，app全局调用一次就够了！
         :param min_idle_connections   最小的空闲链接数
@@ -23,35 +99,363 @@ class MySqlDBPool:
         :param password  MySQL的密码
         :param charset  MySQL的字符集
         :param cursor_class  使用的cursor类型
+        :param name  连接池的名称，同名的连接池会被替换
+        :param role  连接池的角色: 'primary'(主库，只能有一个) 或 'replica'(从库，可以有多个)
+        :param blocking  连接数达到上限时是否等待，为False时抛出TooManyConnections
+        :param adaptive  是否自适应连接数：获取连接的等待时间超过target_wait时把连接数上限加1(最多到max_connections)，
+                         quiet_period秒内没有超时则关闭多余的空闲连接(最少保留min_idle_connections个)。开启时总是等待连接
+        :param target_wait  自适应时获取连接的目标等待时间(秒)
+        :param quiet_period  自适应时收缩空闲连接的间隔(秒)
+        :param multi_statements  是否开启多语句(一次发送多条分号分隔的语句)，
+                                 MysqlExecutor.transaction_execute(pipeline=True)和query_batch()需要开启
+
+        读操作(MysqlExecutor.query_*和Model的查询方法)在有从库时按负载均衡策略分配到从库上，
+        写操作和事务都在主库上执行。从库需要使用和主库相同的charset和cursor_class。
+
+        例如：
+            MySqlDBPool.init_pool(1, 4, **primary_cfg)
+            MySqlDBPool.init_pool(1, 4, **replica1_cfg, name='replica1', role='replica')
+            MySqlDBPool.init_pool(1, 4, **replica2_cfg, name='replica2', role='replica')
+        """
+        if role not in (ROLE_PRIMARY, ROLE_REPLICA):
+            raise ValueError(f'role:{role} is incorrect !')
+        if adaptive and max_connections <= 0:
+            raise ValueError(f'max_connections:{max_connections} is incorrect !')
+
+        pool = PooledDB(pymysql,
+                        min_idle_connections,
+                        maxconnections=max_connections,
+                        blocking=blocking or adaptive,
+                        host=host,
+                        user=username,
+                        passwd=password,
+                        port=port,
+                        charset=charset,
+                        cursorclass=cursor_class,
+                        client_flag=CLIENT.MULTI_STATEMENTS if multi_statements else 0)
+        if adaptive:  # 从最小的空闲连接数开始增长
+            pool._maxconnections = max(min_idle_connections, 1)
+        metrics = _PoolMetrics(min_idle_connections, max_connections, adaptive, target_wait, quiet_period)
+        with cls._lock:
+            if name == cls._primary_name:
+                cls._pool = None
+                cls._primary_name = None
+            cls._replica_names = [n for n in cls._replica_names if n != name]
+            cls._pools[name] = pool
+            cls._outstanding[name] = 0
+            cls._metrics[name] = metrics
+            if role == ROLE_PRIMARY:
+                cls._pool = pool
+                cls._primary_name = name
+                cls._cursor_class = cursor_class
+                cls._encoding = pymysql.charset.charset_by_name(charset).encoding
+            else:
+                cls._replica_names = cls._replica_names + [name]
+
+    @classmethod
+    def close_pool(cls, name):
+        """
+        关闭并移除指定名称的连接池
+        """
+        with cls._lock:
+            pool = cls._pools.pop(name, None)
+            cls._outstanding.pop(name, None)
+            cls._metrics.pop(name, None)
+            cls._replica_names = [n for n in cls._replica_names if n != name]
+            if name == cls._primary_name:
+                cls._pool = None
+                cls._primary_name = None
+        if pool:
+            pool.close()
+
+    @classmethod
+    def set_balance_policy(cls, policy):
+        """
+        设置从库的负载均衡策略
+        :param policy: 'round_robin'(轮询) 或 'least_outstanding'(正在使用的连接数最少)
+        """
+        if policy not in (BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING):
+            raise ValueError(f'policy:{policy} is incorrect !')
+        cls._balance_policy = policy
+
+    @classmethod
+    @contextmanager
+    def use_primary(cls):
+        """
+        在上下文中的读操作都使用主库(用于需要读到刚写入数据的场景)
+
+        例如：
+            user.save()
+            with MySqlDBPool.use_primary():
+                user = User().get(user.id)
+        """
+        token = cls._force_primary.set(True)
+        try:
+            yield
+        finally:
+            cls._force_primary.reset(token)
+
+    @classmethod
+    @contextmanager
+    def pin(cls, name=None):
+        """
+        在上下文中获取的都是同一个连接，退出时才归还到连接池，省去每次执行语句时获取和归还连接的开销
+        :param name  使用指定名称的连接池，为None时使用主库
+        上下文中的读操作也使用该连接(即主库)，不使用查询缓存。嵌套时使用外层的连接。
+        连接只属于当前的线程(contextvars)，新的线程中仍然从连接池获取连接。
+        """
+        pinned = cls._pinned.get()
+        if pinned is not None:
+            yield pinned.connection
+            return
+
+        db_pool = cls(name)
+        connection = db_pool.get_connection()
+        pinned_token = cls._pinned.set(_PinnedConnection(connection, db_pool._pool_name))
+        primary_token = cls._force_primary.set(True)
+        try:
+            yield connection
+        finally:
+            cls._force_primary.reset(primary_token)
+            cls._pinned.reset(pinned_token)
+            db_pool.recycle_connection()
+
+    @classmethod
+    def pinned(cls):
+        """
+        当前上下文中固定使用的连接(_PinnedConnection)，不在pin()中时返回None
+        """
+        return cls._pinned.get()
+
+    @classmethod
+    def pool_stats(cls, name=None):
+        """
+        获取连接池的实时状态
+        :param name  连接池的名称，为None时使用主库
+        :rtype: dict
+
+        in_use: 正在使用的连接数，idle: 空闲的连接数，waiters: 正在等待连接的线程数，
+        max_connections: 连接数上限(自适应时为当前的上限)，checkouts: 获取连接的次数，
+        wait_total, wait_max: 获取连接的总等待时间和最大等待时间(秒)，
+        wait_histogram: 等待时间的直方图，(上界, 次数)的list，
+        connections: 打开的连接的 age(打开的秒数) 和 reuse(被重复获取的次数)
+        """
+        if name is None:
+            name = cls._primary_name
+        if name not in cls._pools:
+            raise Exception(f'The pool:<{name}> is not found!')
+
+        pool = cls._pools[name]
+        metrics = cls._metrics[name]
+        with pool._lock:
+            idle = len(pool._idle_cache)
+            in_use = pool._connections
+            max_connections = pool._maxconnections
+        now = time.monotonic()
+        with cls._lock:
+            connections = [dict(age=now - opened_at, reuse=checkouts - 1)
+                           for raw, (opened_at, checkouts) in list(metrics.connections.items()) if raw.open]
+            return dict(name=name,
+                        in_use=in_use,
+                        idle=idle,
+                        waiters=metrics.waiters,
+                        max_connections=max_connections,
+                        checkouts=metrics.checkouts,
+                        wait_total=metrics.wait_total,
+                        wait_max=metrics.wait_max,
+                        wait_histogram=list(zip(WAIT_BUCKETS + (float('inf'),), metrics.wait_histogram)),
+                        connections=connections)
+
+    @classmethod
+    def _begin_waiting(cls, pool, metrics):
+        """
+        自适应时，连接数已经达到上限则登记为等待的线程，并确保连接池的watcher线程在运行
+        :return: 是否登记了等待，登记了的需要在获取到连接后调用_end_waiting()
         """
-        cls._pool = PooledDB(pymysql,
-                             min_idle_connections,
-                             maxconnections=max_connections,
-                             host=host,
-                             user=username,
-                             passwd=password,
-                             port=port,
-                             charset=charset,
-                             cursorclass=cursor_class)
-
-    def __init__(self):
+        with pool._lock:
+            if not (pool._maxconnections and pool._connections >= pool._maxconnections):
+                return False
+            metrics.blocked += 1
+            if metrics.watcher is None:
+                metrics.watcher = threading.Thread(target=cls._watch_waiting, args=(pool, metrics),
+                                                   name='mysqlstream_pool_grow', daemon=True)
+                metrics.watcher.start()
+            return True
+
+    @classmethod
+    def _end_waiting(cls, pool, metrics):
+        """
+        获取到连接后取消_begin_waiting()的登记
+        """
+        with pool._lock:
+            metrics.blocked -= 1
+
+    @classmethod
+    def _watch_waiting(cls, pool, metrics):
+        """
+        watcher线程：有线程在等待时每隔target_wait增加一次连接数上限并唤醒等待的线程，
+        没有线程在等待或者已经达到max_connections时退出
+        """
+        while True:
+            time.sleep(metrics.target_wait)
+            with pool._lock:
+                if not metrics.blocked or pool._maxconnections >= metrics.max_connections:
+                    metrics.watcher = None
+                    return
+                if pool._connections >= pool._maxconnections:
+                    pool._maxconnections += 1
+                    metrics.last_slow = time.monotonic()
+                    pool._lock.notify_all()
+
+    @classmethod
+    def _shrink(cls, pool, metrics):
+        """
+        自适应时，一段时间内没有等待超时则关闭多余的空闲连接，并降低连接数上限
+        """
+        now = time.monotonic()
+        if now - metrics.last_slow < metrics.quiet_period or now - metrics.last_shrink < metrics.quiet_period:
+            return
+        metrics.last_shrink = now
+        with pool._lock:
+            idle = pool._idle_cache
+            closing = idle[metrics.min_idle_connections:]
+            del idle[metrics.min_idle_connections:]
+            pool._maxconnections = max(metrics.min_idle_connections, 1, pool._connections + len(idle))
+        for con in closing:
+            try:
+                con._close()
+            except Exception:
+                pass
+
+    @classmethod
+    def primary_forced(cls):
+        """
+        当前上下文的读操作是否强制使用主库(在use_primary()中)
+        """
+        return cls._force_primary.get()
+
+    @classmethod
+    def multi_statements(cls, connection):
+        """
+        连接是否开启了多语句(init_pool()时指定了multi_statements=True)
+        """
+        return bool(connection._con._con.client_flag & CLIENT.MULTI_STATEMENTS)
+
+    @classmethod
+    def encoding(cls):
+        """
+        获取和连接字符集对应的编码
+        """
+        return cls._encoding
+
+    @classmethod
+    def tuple_cursor_class(cls):
+        """
+        获取返回元组行的cursor类型，不受初始化时指定的cursor_class的影响
+        """
+        return pymysql.cursors.Cursor
+
+    @classmethod
+    def unbuffered_cursor_class(cls, cursor_class=None):
+        """
+        获取和cursor_class对应的无缓冲(服务端)cursor类型，用于流式读取结果集
+        :param cursor_class  为None时使用初始化时指定的cursor_class
+        """
+        if issubclass(cursor_class or cls._cursor_class, pymysql.cursors.DictCursorMixin):
+            return pymysql.cursors.SSDictCursor
+        return pymysql.cursors.SSCursor
+
+    @classmethod
+    def _choose_pool_name(cls, name, readonly):
+        """
+        选择本次使用的连接池
+        """
+        if name is not None:
+            if name not in cls._pools:
+                raise Exception(f'The pool:<{name}> is not found!')
+            return name
+
+        if not cls._pool:
+            raise Exception("The class method init_pool() must be invoke at first!")
+
+        replica_names = cls._replica_names
+        if not readonly or not replica_names or cls._force_primary.get():
+            return cls._primary_name
+
+        if cls._balance_policy == BALANCE_LEAST_OUTSTANDING:
+            return min(replica_names, key=lambda n: cls._outstanding[n])
+        with cls._lock:
+            cls._next_replica = (cls._next_replica + 1) % len(replica_names)
+            return replica_names[cls._next_replica]
+
+    def __init__(self, name=None, readonly=False):
+        """
+        :param name  使用指定名称的连接池，为None时根据readonly自动选择
+        :param readonly  是否只用于读操作，为True时可以分配到从库
+        """
+        self._name = name
+        self._readonly = readonly
+        self._pool_name = None  # 实际使用的连接池名称
         self._connection = None
+        self._is_pinned = False  # 是否使用的是pin()中固定的连接
 
     def get_connection(self):
         """
-        获取连接
+        获取连接，在pin()的上下文中返回固定的连接
         """
-        if not self._pool:
-            raise Exception("The class method init() must be invoke at first!")
+        pinned = self._pinned.get()
+        if pinned is not None and self._name in (None, pinned.pool_name):
+            self._is_pinned = True
+            self._pool_name = pinned.pool_name
+            self._connection = pinned.connection
+            return self._connection
 
-        self._connection = self._pool.connection()
+        pool_name = self._choose_pool_name(self._name, self._readonly)
+        pool = self._pools[pool_name]
+        metrics = self._metrics[pool_name]
+        with self._lock:
+            metrics.waiters += 1
+        start = time.perf_counter()
+        waiting = metrics.adaptive and self._begin_waiting(pool, metrics)
+        try:
+            self._connection = pool.connection()
+        finally:
+            wait = time.perf_counter() - start
+            if waiting:
+                self._end_waiting(pool, metrics)
+            with self._lock:
+                metrics.waiters -= 1
+        self._pool_name = pool_name
+        with self._lock:
+            self._outstanding[pool_name] += 1
+            metrics.record_checkout(wait, self._connection._con._con)
+        if metrics.adaptive and wait > metrics.target_wait:
+            metrics.last_slow = time.monotonic()
         return self._connection
 
+    def pool_name(self):
+        """
+        get_connection()实际使用的连接池名称(pin()中为固定的连接所属的连接池)
+        """
+        return self._pool_name
+
     def recycle_connection(self):
         """
-        回收连接
+        回收连接，pin()中固定的连接在退出pin()时才回收
         """
-        self._connection.close()
+        if self._is_pinned:
+            self._is_pinned = False
+            return
+        try:
+            self._connection.close()
+        finally:
+            with self._lock:
+                if self._pool_name in self._outstanding:
+                    self._outstanding[self._pool_name] -= 1
+        metrics = self._metrics.get(self._pool_name)
+        pool = self._pools.get(self._pool_name)
+        if metrics is not None and metrics.adaptive and pool is not None:
+            self._shrink(pool, metrics)
 
     def __enter__(self):
         # connections = self._pool._connections
@@ -61,4 +465,4 @@ class MySqlDBPool:
     def __exit__(self, exc_type, exc_val, exc_tb):
         # connections = self._pool._connections
         # print('>>>> MysqlDBPool exit, connections:', connections)
-        self._connection.close()
+        self.recycle_connection()
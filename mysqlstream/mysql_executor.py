@@ -1,47 +1,304 @@
 # brief: 基于连接池的mysql执行器
+import re
+import pymysql
 from .mysql_db_pool import MySqlDBPool
+from .columnar import build_columns, check_backend, ColumnsBuilder, BACKEND_ARRAY
+from .instrumentation import start_timer
+from .escaper import format_sql, compile_sql
+
+# 可以改写成多行插入的语句: insert/replace ... values (%s,...) [on duplicate key update ...]
+_INSERT_VALUES_RE = re.compile(
+    r"\s*((?:INSERT|REPLACE)\b.+\bVALUES?\s*)"
+    r"(\(\s*(?:%s|%\(.+\)s)\s*(?:,\s*(?:%s|%\(.+\)s)\s*)*\))"
+    r"(\s*(?:ON DUPLICATE.*)?);?\s*\Z",
+    re.IGNORECASE | re.DOTALL)
+
+_PACKET_HEADROOM = 1024  # 多行语句的长度和max_allowed_packet之间预留的空间
+_STATEMENT_SEPARATOR = ';\n'  # 多语句包中语句之间的分隔符
+_COLUMNAR_FETCH_SIZE = 10000  # query_columnar()每次从连接读取的行数
+
+
+def _literal_sql(sql):
+    """
+    不含占位符的sql片段按照mogrify()的规则把%%还原成%，含有占位符时返回None
+    """
+    template = compile_sql(sql)
+    return None if template.keys else template.parts[0]
+
+
+class BatchStatementError(Exception):
+    """
+    多语句批量执行时，某一条语句出错(之后的语句都没有执行)
+    """
+
+    def __init__(self, index, sql, error, results=None):
+        """
+        :param index  出错的语句在集合中的下标
+        :param sql  出错的语句(已格式化)
+        :param error  MySQL返回的异常
+        :param results  query_batch()中出错之前的语句的结果集
+        """
+        super(BatchStatementError, self).__init__(f'The statement:<{index}> failed: {error}')
+        self.index = index
+        self.sql = sql
+        self.error = error
+        self.results = results or []
 
 
 class MysqlExecutor:
+    _max_allowed_packet = {}  # 连接池名称和服务端的max_allowed_packet的映射，第一次批量执行时查询
+    _query_cache = None  # 查询结果的缓存(QueryCache)，为None时不缓存
+
     def __init__(self):
         self._db_pool = MySqlDBPool()
-        self._connection = self._db_pool.get_connection()
+        with start_timer('checkout', None) as timer:
+            self._connection = self._db_pool.get_connection()
+            timer.mark('checkout')
+        self._executed_sql_list = []  # 事务中执行过的sql，提交后让相关的查询缓存失效
+        self._savepoint = None  # 在scope()中已开始的事务中再开始事务时使用的保存点
 
     @classmethod
-    def _execute_query(cls, sql, args, fetchone=False):
-        with MySqlDBPool() as connection:
+    def set_query_cache(cls, query_cache):
+        """
+        设置query_one_row()和query_multi_rows()使用的结果缓存
+        :param query_cache: QueryCache对象，为None时关闭缓存
+        """
+        cls._query_cache = query_cache
+
+    @classmethod
+    def _invalidate_query_cache(cls, sql):
+        """
+        让写操作的sql修改的表的查询缓存失效
+        """
+        query_cache = cls._query_cache
+        if query_cache is not None:
+            query_cache.invalidate_sql(sql)
+            pinned = MySqlDBPool.pinned()
+            if pinned is not None and pinned.in_transaction:  # 提交后还需要再次失效
+                pinned.executed_sql_list.append(sql)
+
+    @classmethod
+    def scope(cls, name=None):
+        """
+        在上下文中的所有语句(包括ORM的方法)都使用同一个连接，退出时才归还连接，规则和MySqlDBPool.pin()相同
+
+        上下文中通过MysqlExecutor对象开始事务后，直到对象commit()或rollback()之前，
+        execute()等类方法都在该事务中执行，不再单独提交或回滚。
+
+        例如：
+            with MysqlExecutor.scope():
+                user = User().get(1)
+                MysqlExecutor.execute(sql, args)
+
+                exe = MysqlExecutor()
+                exe.start_transaction()
+                exe.no_commit_execute(sql, args)
+                user.update()  # 在exe的事务中执行
+                exe.commit()
+        """
+        return MySqlDBPool.pin(name)
+
+    @classmethod
+    def _in_scoped_transaction(cls):
+        """
+        是否在scope()中通过MysqlExecutor对象开始的事务中
+        """
+        pinned = MySqlDBPool.pinned()
+        return pinned is not None and pinned.in_transaction
+
+    @classmethod
+    def _execute_query(cls, sql, args, fetchone=False, use_primary=False, cursor_class=None):
+        query_cache = cls._query_cache
+        if query_cache is None or use_primary or MySqlDBPool.primary_forced() or not query_cache.cacheable(sql):
+            return cls._query(sql, args, fetchone, use_primary, cursor_class)
+
+        key = query_cache.key_of(sql, args, fetchone, cursor_class)
+        if key is None:
+            return cls._query(sql, args, fetchone, use_primary, cursor_class)
+        return query_cache.get_or_load(key, sql, lambda: cls._query(sql, args, fetchone, use_primary, cursor_class))
+
+    @classmethod
+    def _query(cls, sql, args, fetchone, use_primary, cursor_class):
+        with start_timer('query', sql) as timer, MySqlDBPool(readonly=not use_primary) as connection:
+            timer.mark('checkout')
             try:
-                cursor = connection.cursor()
+                cursor = connection.cursor(cursor_class)
                 cursor.execute(sql, args)
+                timer.mark('execute')
                 if fetchone:
                     rows = cursor.fetchone()
+                    timer.set_rows(0 if rows is None else 1)
                 else:
                     rows = cursor.fetchall()
+                    timer.set_rows(len(rows))
+                timer.mark('fetch')
                 return rows
             finally:
                 cursor.close()
 
     @classmethod
-    def query_one_row(cls, sql, args):
+    def query_one_row(cls, sql, args, use_primary=False, cursor_class=None):
         """
         查询单行结果
         :param  sql: sql的集合，规则和execute()相同
         :param args: args的集合，规则和execute()相同
+        :param use_primary: 是否强制在主库上查询(默认在有从库时使用从库)
+        :param cursor_class: 本次查询使用的cursor类型，为None时使用连接池的cursor_class
         :return: 符合的数据结果
         :rtype: None or dict
         """
-        return cls._execute_query(sql, args, True)
+        return cls._execute_query(sql, args, True, use_primary, cursor_class)
 
     @classmethod
-    def query_multi_rows(cls, sql, args):
+    def query_multi_rows(cls, sql, args, use_primary=False, cursor_class=None):
         """
         查询多行结果
         :param  sql: sql的集合，规则和execute()相同
         :param args: args的集合，规则和execute()相同
+        :param use_primary: 是否强制在主库上查询(默认在有从库时使用从库)
+        :param cursor_class: 本次查询使用的cursor类型，为None时使用连接池的cursor_class
         :return: 符合的数据结果集合
         :rtype: list of dict
         """
-        return cls._execute_query(sql, args)
+        return cls._execute_query(sql, args, use_primary=use_primary, cursor_class=cursor_class)
+
+    @classmethod
+    def query_stream(cls, sql, args, batch_size=None, use_primary=False, cursor_class=None):
+        """
+        流式查询结果，使用无缓冲(服务端)的cursor，结果集不会一次性加载到内存中
+        :param  sql: sql的集合，规则和execute()相同
+        :param args: args的集合，规则和execute()相同
+        :param batch_size: 为None时逐行返回，否则每次返回最多batch_size行组成的list
+        :param use_primary: 是否强制在主库上查询(默认在有从库时使用从库)
+        :param cursor_class: 为None时使用连接池的cursor_class，会自动换成对应的无缓冲cursor类型
+        :return: 结果的生成器
+        :rtype: generator of dict (batch_size不为None时是 generator of list)
+
+        连接只在迭代期间占用，迭代结束、提前break或出现异常时都会归还到连接池。
+        提前结束时直接关闭连接(连接池在下次获取时重新连接)，不读取剩余的结果；
+        scope()中固定的连接不能关闭，仍然读完(丢弃)剩余的结果。
+
+        例如：
+            for row in MysqlExecutor.query_stream("select * from user where age>%s", [10]):
+                print(row)
+
+            for rows in MysqlExecutor.query_stream("select * from user", None, batch_size=1000):
+                print(len(rows))
+        """
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError(f'batch_size:{batch_size} is incorrect !')
+
+        db_pool = MySqlDBPool(readonly=not use_primary)
+        connection = db_pool.get_connection()
+        try:
+            cursor = connection.cursor(MySqlDBPool.unbuffered_cursor_class(cursor_class))
+            finished = False
+            try:
+                cursor.execute(sql, args)
+                if batch_size is None:
+                    for row in iter(cursor.fetchone, None):
+                        yield row
+                else:
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield rows
+                finished = True
+            finally:
+                cls._close_stream(connection, cursor, finished)
+        finally:
+            db_pool.recycle_connection()
+
+    @classmethod
+    def _close_stream(cls, connection, cursor, finished):
+        """
+        关闭无缓冲的cursor：读完结果时正常关闭；提前结束或出错时关闭连接，
+        scope()中固定的连接不能关闭，仍然读完(丢弃)剩余的结果
+        """
+        pinned = MySqlDBPool.pinned()
+        if finished or (pinned is not None and pinned.connection is connection):
+            cursor.close()
+        else:
+            cls._discard_stream(connection, cursor)
+
+    @classmethod
+    def _discard_stream(cls, connection, cursor):
+        """
+        提前结束的流式查询：关闭底层的连接，剩余的结果不再传输
+        """
+        result = cursor._result
+        if result is not None:
+            result.unbuffered_active = False  # 回收result时不再读取剩余的结果
+        cursor.connection = None  # 之后cursor.close()不再访问连接
+        connection._con._close()
+
+    @classmethod
+    def query_columnar(cls, sql, args, backend=BACKEND_ARRAY, use_primary=False):
+        """
+        查询多行结果，按列返回(不创建每行的dict，适合分析类的查询)
+        :param  sql: sql的集合，规则和execute()相同
+        :param args: args的集合，规则和execute()相同
+        :param backend: 'array'(标准库的array和list) 或 'numpy'(需要安装numpy)
+        :param use_primary: 是否强制在主库上查询(默认在有从库时使用从库)
+        :return: 列名和列数组的映射，各类型列的数组规则见columnar.build_columns()
+        :rtype: dict
+
+        例如：
+            columns = MysqlExecutor.query_columnar("select id,age from user", None, backend='numpy')
+            print(columns['age'].mean())
+        """
+        check_backend(backend)
+        with MySqlDBPool(readonly=not use_primary) as connection:
+            # 使用无缓冲的cursor分块读取，每块追加到列中后丢弃，不在内存中同时保留所有的行和列
+            cursor = connection.cursor(MySqlDBPool.unbuffered_cursor_class(MySqlDBPool.tuple_cursor_class()))
+            finished = False
+            try:
+                cursor.execute(sql, args)
+                builder = ColumnsBuilder(cursor.description, backend)
+                while True:
+                    rows = cursor.fetchmany(_COLUMNAR_FETCH_SIZE)
+                    if not rows:
+                        break
+                    builder.extend(rows)
+                finished = True
+                return builder.build()
+            finally:
+                cls._close_stream(connection, cursor, finished)
+
+    @classmethod
+    def query_columnar_stream(cls, sql, args, chunk_size=100000, backend=BACKEND_ARRAY, use_primary=False):
+        """
+        流式地按列查询结果(用于超出内存的结果集)，每次返回最多chunk_size行组成的按列结果
+        :param  sql: sql的集合，规则和execute()相同
+        :param args: args的集合，规则和execute()相同
+        :param chunk_size: 每块的行数
+        :param backend: 'array' 或 'numpy'，规则和query_columnar()相同
+        :param use_primary: 是否强制在主库上查询(默认在有从库时使用从库)
+        :return: 按列结果的生成器，连接的占用和归还规则和query_stream()相同
+        :rtype: generator of dict
+        """
+        if chunk_size <= 0:
+            raise ValueError(f'chunk_size:{chunk_size} is incorrect !')
+        check_backend(backend)
+
+        db_pool = MySqlDBPool(readonly=not use_primary)
+        connection = db_pool.get_connection()
+        try:
+            cursor = connection.cursor(MySqlDBPool.unbuffered_cursor_class(MySqlDBPool.tuple_cursor_class()))
+            finished = False
+            try:
+                cursor.execute(sql, args)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield build_columns(cursor.description, rows, backend)
+                finished = True
+            finally:
+                cls._close_stream(connection, cursor, finished)
+        finally:
+            db_pool.recycle_connection()
 
     @classmethod
     def execute(cls, sql, args):
@@ -69,83 +326,380 @@ class MysqlExecutor:
         if not sql:
             raise ValueError('sql is empty!')
 
-        with MySqlDBPool() as connection:
+        with start_timer('execute', sql) as timer, MySqlDBPool() as connection:
+            timer.mark('checkout')
             try:
                 cursor = connection.cursor()
                 affected = cursor.execute(sql, args)
-                connection.commit()
+                timer.mark('execute')
+                timer.set_rows(affected)
+                if not cls._in_scoped_transaction():
+                    connection.commit()
+                    timer.mark('commit')
                 return affected, cursor.lastrowid
             finally:
                 cursor.close()
+                cls._invalidate_query_cache(sql)
+
+    @classmethod
+    def execute_many(cls, sql, rows):
+        """
+        批量执行同一条sql
+        :param sql: 需要执行的sql语句，规则和execute()相同
+        :param rows: 每一行的args组成的集合
+        :type rows: list of (tuple, list or dict)
+
+        :return: 每个分块受影响的行数和第一条insert数据的ID
+        :rtype: list of int, int
+
+        insert/replace语句会改写成多行的 insert ... values (...),(...) 语句，
+        并按照服务端的max_allowed_packet分块，所有分块在一个事务中执行，出错时回滚。
+        其它的语句在一个事务中逐行执行。
+
+        例如：
+            sql = "insert into user (name,age,sex) value(%s,%s,%s)"
+            rows = [["ChongChong", 3, 1], ["XiaoMing", 4, 1]]
+            affected_list, first_id = MysqlExecutor.execute_many(sql, rows)
+        """
+        if not sql:
+            raise ValueError('sql is empty!')
+        if not rows:
+            return [], 0
+
+        db_pool = MySqlDBPool()
+        with start_timer('execute_many', sql) as timer, db_pool as connection:
+            timer.mark('checkout')
+            cursor = connection.cursor()
+            in_transaction = cls._in_scoped_transaction()
+            try:
+                max_length = cls._max_statement_length(cursor, db_pool.pool_name())
+                if not in_transaction:
+                    connection.begin()
+                affected_list = []
+                first_id = 0
+                statements = cls._split_statements(cursor, sql, rows, max_length, MySqlDBPool.encoding())
+                for statement in statements:
+                    affected_list.append(cursor.execute(statement))
+                    if not first_id:
+                        first_id = cursor.lastrowid
+                timer.mark('execute')
+                timer.set_rows(sum(affected_list))
+                if not in_transaction:
+                    connection.commit()
+                    timer.mark('commit')
+                return affected_list, first_id
+            except Exception as e:
+                if not in_transaction:
+                    connection.rollback()
+                raise e
+            finally:
+                cursor.close()
+                cls._invalidate_query_cache(sql)
+
+    @classmethod
+    def _max_statement_length(cls, cursor, pool_name):
+        """
+        单条语句允许的最大字节数，每个连接池(对应的服务端)分别查询一次
+        """
+        max_allowed_packet = cls._max_allowed_packet.get(pool_name)
+        if max_allowed_packet is None:
+            cursor.execute('select @@max_allowed_packet as max_allowed_packet')
+            row = cursor.fetchone()
+            max_allowed_packet = int(row['max_allowed_packet'] if isinstance(row, dict) else row[0])
+            cls._max_allowed_packet[pool_name] = max_allowed_packet
+        return max_allowed_packet - _PACKET_HEADROOM
+
+    @classmethod
+    def _split_statements(cls, cursor, sql, rows, max_length, encoding):
+        """
+        将批量数据拆分成不超过max_length字节的多行语句
+        只有values(...)之外(例如on duplicate key update中)没有占位符时才改写成多行语句，否则逐行执行
+        """
+        m = _INSERT_VALUES_RE.match(sql)
+        prefix = postfix = None
+        if m:
+            prefix = _literal_sql(m.group(1))
+            postfix = _literal_sql(m.group(3))
+        if prefix is None or postfix is None:
+            for args in rows:
+                yield cursor.mogrify(sql, args).encode(encoding)
+            return
+
+        prefix = prefix.encode(encoding)
+        values = m.group(2).rstrip()
+        postfix = postfix.encode(encoding)
+        statement = []
+        length = len(prefix) + len(postfix)
+        for args in rows:
+            value = cursor.mogrify(values, args).encode(encoding)
+            if statement and length + len(value) + 1 > max_length:
+                yield prefix + b','.join(statement) + postfix
+                statement = []
+                length = len(prefix) + len(postfix)
+            statement.append(value)
+            length += len(value) + 1
+        yield prefix + b','.join(statement) + postfix
+
+    @classmethod
+    def _split_batches(cls, statements, max_length, encoding):
+        """
+        将格式化好的语句拆分成不超过max_length字节的多语句包
+        :return: (第一条语句的下标, 语句集合)的生成器
+        """
+        separator_length = len(_STATEMENT_SEPARATOR)
+        start = 0
+        length = 0
+        for i, statement in enumerate(statements):
+            statement_length = len(statement.encode(encoding)) + separator_length
+            if i > start and length + statement_length > max_length:
+                yield start, statements[start:i]
+                start = i
+                length = 0
+            length += statement_length
+        if start < len(statements):
+            yield start, statements[start:]
+
+    @classmethod
+    def _pipeline(cls, connection, cursor, statements, on_result, pool_name):
+        """
+        把多条语句合并成多语句包发送(每个包一次往返)，按顺序读取每条语句的结果
+        :param statements: 格式化好的语句集合
+        :param on_result: 读取到每条语句的结果时调用 on_result(cursor)
+        :param pool_name: 连接所属的连接池名称
+        """
+        if not MySqlDBPool.multi_statements(connection):
+            raise Exception("The pool must be initialized with multi_statements=True at first!")
+
+        statements = [s.strip().rstrip(';') for s in statements]
+        max_length = cls._max_statement_length(cursor, pool_name)
+        for start, batch in cls._split_batches(statements, max_length, MySqlDBPool.encoding()):
+            index = start
+            try:
+                cursor.execute(_STATEMENT_SEPARATOR.join(batch))
+                on_result(cursor)
+                for index in range(start + 1, start + len(batch)):
+                    cursor.nextset()
+                    on_result(cursor)
+            except pymysql.MySQLError as e:
+                raise BatchStatementError(index, statements[index], e) from e
 
     @classmethod
-    def transaction_execute(cls, sql_list, args_list, rollback=True):
+    def transaction_execute(cls, sql_list, args_list, rollback=True, pipeline=False):
         """
         在一个事务中运行多条sql语句,默认失败后自动回滚
         :param  sql_list: sql的集合，规则和execute()相同
         :param args_list: args的集合，规则和execute()相同（可为None，此时sql_list必须自行格式化好的SQL语句）
+        :param pipeline: 是否把所有语句合并成多语句包发送，减少和服务端之间的往返次数，
+                         需要连接池开启multi_statements，出错时抛出BatchStatementError
         """
         if not sql_list:
             raise ValueError('sql_list is empty!')
 
+        in_transaction = cls._in_scoped_transaction()  # 在外层的事务中执行，由外层提交或回滚
         try:
-            with MySqlDBPool() as connection:
-                connection.begin()
+            db_pool = MySqlDBPool()
+            with start_timer('transaction', sql_list) as timer, db_pool as connection:
+                timer.mark('checkout')
+                if not in_transaction:
+                    connection.begin()
+                cursor = connection.cursor()
                 try:
-                    cursor = connection.cursor()
-                    for i, sql in enumerate(sql_list):
-                        if args_list:
-                            cursor.execute(sql, args_list[i])
-                        else:
-                            cursor.execute(sql)
+                    affected = 0
+                    if pipeline:
+                        statements = [cursor.mogrify(sql, args_list[i] if args_list else None)
+                                      for i, sql in enumerate(sql_list)]
+                        rowcounts = []
+                        cls._pipeline(connection, cursor, statements, lambda c: rowcounts.append(c.rowcount),
+                                      db_pool.pool_name())
+                        affected = sum(rowcounts)
+                    else:
+                        for i, sql in enumerate(sql_list):
+                            if args_list:
+                                affected += cursor.execute(sql, args_list[i])
+                            else:
+                                affected += cursor.execute(sql)
+                    timer.mark('execute')
+                    timer.set_rows(affected)
+                    if not in_transaction:
+                        connection.commit()
+                        timer.mark('commit')
+                except Exception as e:
+                    if rollback and not in_transaction:  # 在归还连接之前回滚
+                        connection.rollback()
+                    raise e
                 finally:
                     cursor.close()
-                connection.commit()
-        except Exception as e:
-            if rollback:
-                connection.rollback()
-            raise e
+        finally:
+            for sql in sql_list:
+                cls._invalidate_query_cache(sql)
+
+    @classmethod
+    def query_batch(cls, queries, use_primary=False, cursor_class=None):
+        """
+        把多条查询合并成多语句包发送，一次往返获取多个结果集(不使用查询缓存)
+        :param queries: (sql, args)的集合，规则和query_multi_rows()相同
+        :param use_primary: 是否强制使用主库
+        :param cursor_class: 使用的cursor类型，为None时使用初始化时指定的cursor_class
+        :return: 和queries顺序一致的结果集的list
+
+        需要连接池开启multi_statements。某条语句出错时后面的语句都不会执行，
+        抛出BatchStatementError，其中index是出错的语句的下标，results是之前的语句的结果集
+
+        例如：
+            users, total = MysqlExecutor.query_batch([("select * from user where age>%s", [10]),
+                                                      ("select count(*) as total from user", None)])
+        """
+        if not queries:
+            return []
+
+        db_pool = MySqlDBPool(readonly=not use_primary)
+        with start_timer('query_batch', [sql for sql, _ in queries]) as timer, db_pool as connection:
+            timer.mark('checkout')
+            cursor = connection.cursor(cursor_class)
+            results = []
+            try:
+                statements = [cursor.mogrify(sql, args) for sql, args in queries]
+                cls._pipeline(connection, cursor, statements, lambda c: results.append(c.fetchall()),
+                              db_pool.pool_name())
+            except BatchStatementError as e:
+                e.results = results
+                raise e
+            finally:
+                cursor.close()
+            timer.mark('fetch')
+            timer.set_rows(sum(len(rows) for rows in results))
+            return results
 
     @classmethod
     def build_sql(cls, sql, args):
         """
         构造防SQL注入的语句. 针对args中的特殊字符,做和转义.
+        不需要获取连接，使用连接池字符集对应的编码，按照服务端没有开启NO_BACKSLASH_ESCAPES的规则转义
         :param sql: 需要执行的sql语句
         :param args: 和sql中占位符对应的参数集合
 
         :rtype str:
         """
-        with MySqlDBPool() as connection:
-            try:
-                cursor = connection.cursor()
-                return cursor.mogrify(sql, args)
-            finally:
-                cursor.close()
+        return format_sql(sql, args, MySqlDBPool.encoding())
 
     def start_transaction(self):
         """
         开始事务
+        scope()中已经有其它对象开始的事务时(例如在事务中使用Session)，不再发送BEGIN(MySQL会隐式提交已开始的事务)，
+        而是创建保存点：commit()释放保存点，rollback()回滚到保存点，由外层的事务最终提交或回滚
         """
+        pinned = self._pinned()
+        if pinned is not None and pinned.in_transaction:
+            self._savepoint = f'mysqlstream_{id(self)}'
+            self._connection.cursor().execute(f'savepoint {self._savepoint}')
+            return
         self._connection.begin()
+        if pinned is not None:
+            pinned.in_transaction = True
+
+    def _pinned(self):
+        """
+        使用的是scope()中固定的连接时返回_PinnedConnection，否则返回None
+        """
+        pinned = MySqlDBPool.pinned()
+        if pinned is not None and pinned.connection is self._connection:
+            return pinned
+        return None
+
+    def _end_transaction(self):
+        """
+        提交或回滚后，返回scope()中其它类方法在事务中执行过的写操作
+        """
+        pinned = self._pinned()
+        if pinned is None:
+            return []
+        pinned.in_transaction = False
+        sql_list, pinned.executed_sql_list = pinned.executed_sql_list, []
+        cache_keys, pinned.cache_keys = pinned.cache_keys, []
+        for cache, key in cache_keys:
+            cache.delete(key)
+        return sql_list
 
     def no_commit_execute(self, sql, args):
         """
         不自动提交地执行sql（事务处理时使用）
         :param  sql: sql的集合，规则和execute()相同
         :param args: args的集合，规则和execute()相同
+        :return: 受影响的行数
+        """
+        if not sql:
+            raise ValueError('sql is None!')
+        with start_timer('no_commit_execute', sql) as timer:
+            affected = self._connection.cursor().execute(sql, args)
+            timer.set_rows(affected)
+            timer.mark('execute')
+        self._executed_sql_list.append(sql)
+        return affected
+
+    def no_commit_execute_many(self, sql, rows):
+        """
+        不自动提交地批量执行同一条sql（事务处理时使用），insert/replace语句的改写和分块规则和execute_many()相同
+        :return: 每个分块受影响的行数和第一条insert数据的ID
+        :rtype: list of int, int
         """
         if not sql:
             raise ValueError('sql is None!')
-        self._connection.cursor().execute(sql, args)
+        if not rows:
+            return [], 0
+
+        with start_timer('no_commit_execute_many', sql) as timer:
+            cursor = self._connection.cursor()
+            try:
+                max_length = self._max_statement_length(cursor, self._db_pool.pool_name())
+                affected_list = []
+                first_id = 0
+                for statement in self._split_statements(cursor, sql, rows, max_length, MySqlDBPool.encoding()):
+                    affected_list.append(cursor.execute(statement))
+                    if not first_id:
+                        first_id = cursor.lastrowid
+                timer.mark('execute')
+                timer.set_rows(sum(affected_list))
+            finally:
+                cursor.close()
+                self._executed_sql_list.append(sql)
+        return affected_list, first_id
 
     def commit(self):
         """
         提交
         """
-        self._connection.commit()
+        if self._savepoint is not None:
+            savepoint, self._savepoint = self._savepoint, None
+            self._connection.cursor().execute(f'release savepoint {savepoint}')
+            sql_list, self._executed_sql_list = self._executed_sql_list, []
+            self._pinned().executed_sql_list.extend(sql_list)  # 外层的事务提交后才让查询缓存失效
+            return
+        try:
+            with start_timer('commit', None) as timer:
+                self._connection.commit()
+                timer.mark('commit')
+        finally:
+            sql_list, self._executed_sql_list = self._executed_sql_list, []
+            sql_list.extend(self._end_transaction())
+            for sql in sql_list:
+                self._invalidate_query_cache(sql)
 
     def rollback(self):
         """
         回滚
         """
-        self._connection.rollback()
+        self._executed_sql_list = []
+        if self._savepoint is not None:
+            savepoint, self._savepoint = self._savepoint, None
+            self._connection.cursor().execute(f'rollback to savepoint {savepoint}')
+            return
+        self._end_transaction()
+        with start_timer('rollback', None) as timer:
+            self._connection.rollback()
+            timer.mark('commit')
+
+    def close(self):
+        """
+        把连接归还到连接池，之后不能再使用该对象
+        """
+        self._db_pool.recycle_connection()
@@ -0,0 +1,291 @@
+# brief: MysqlExecutor查询结果的缓存
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_IDENT = r'(?:`[^`]+`|\w+)(?:\s*\.\s*(?:`[^`]+`|\w+))?'  # 表名，可以带库名
+_KEYWORDS = r'where|on|using|group|order|limit|join|inner|left|right|cross|natural|straight_join|union|having|for|lock'
+_ALIAS = r'(?:\s+(?:as\s+)?(?!(?:' + _KEYWORDS + r')\b)\w+)?'  # 表的别名
+_READ_TABLES_RE = re.compile(r'\b(?:from|join)\s+(' + _IDENT + _ALIAS + r'(?:\s*,\s*' + _IDENT + _ALIAS + r')*)',
+                             re.IGNORECASE)
+_WRITE_TABLES_RE = re.compile(
+    r'^\s*(?:'
+    r'(?:insert|replace)\s+(?:(?:low_priority|delayed|high_priority|ignore)\s+)*(?:into\s+)?'
+    r'|update\s+(?:(?:low_priority|ignore)\s+)*'
+    r'|delete\s+(?:(?:low_priority|quick|ignore)\s+)*(?:\w+(?:\s*,\s*\w+)*\s+)?from\s+'
+    r'|(?:truncate|alter|drop|rename|create)\s+(?:temporary\s+)?table\s+(?:if\s+(?:not\s+)?exists\s+)?'
+    r'|load\s+data\s+.*?\binto\s+table\s+'
+    r')(' + _IDENT + r')',
+    re.IGNORECASE | re.DOTALL)
+_NO_WRITE_RE = re.compile(r'^\s*(?:select|set|use|show|explain|describe|desc|do|begin|start|commit|rollback|'
+                          r'savepoint|release)\b', re.IGNORECASE)  # 不修改表数据的语句
+_UNCACHEABLE_RE = re.compile(r'\bfor\s+update\b|\block\s+in\s+share\s+mode\b|\bfor\s+share\b|\bsql_no_cache\b',
+                             re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)|\s+", re.DOTALL)
+
+
+def normalize_sql(sql):
+    """
+    合并sql中引号外的连续空白字符
+    """
+    return _WHITESPACE_RE.sub(lambda m: m.group(1) or ' ', sql).strip()
+
+
+def _table_name(ident):
+    """
+    去掉库名和反引号后的小写表名，作为缓存的标签
+    """
+    return ident.split('.')[-1].strip().strip('`').lower()
+
+
+def read_tables(sql):
+    """
+    查询语句读取的表名集合(from和join后面的表)
+    """
+    tables = set()
+    for m in _READ_TABLES_RE.finditer(sql):
+        for part in m.group(1).split(','):
+            tables.add(_table_name(re.match(_IDENT, part.strip()).group(0)))
+    return tables
+
+
+def written_tables(sql):
+    """
+    写操作语句修改的表名集合(包括语句中读取的表)，无法解析时返回None
+    """
+    if _NO_WRITE_RE.match(sql):
+        return set()
+    m = _WRITE_TABLES_RE.match(sql)
+    if not m:
+        return None
+    return {_table_name(m.group(1))} | read_tables(sql)
+
+
+def _freeze(value):
+    """
+    把参数转成可以hash的值
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+def _estimate_size(result):
+    """
+    估算结果集占用的字节数
+    """
+    if result is None:
+        return 0
+    if isinstance(result, dict) or (isinstance(result, tuple) and not _is_rows(result)):
+        rows = [result]  # 单行结果
+    else:
+        rows = result
+    size = sys.getsizeof(rows)
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in values)
+    return size
+
+
+def _is_rows(result):
+    """
+    元组是多行的结果集还是单行
+    """
+    return isinstance(result, tuple) and bool(result) and isinstance(result[0], (dict, tuple, list))
+
+
+def _copy_result(result):
+    """
+    复制dict行，避免调用方修改缓存中的数据(元组行不可变，不需要复制)
+    """
+    if isinstance(result, dict):
+        return dict(result)
+    if isinstance(result, (list, tuple)) and result and isinstance(result[0], dict):
+        return [dict(row) for row in result]
+    if isinstance(result, list):
+        return list(result)
+    return result
+
+
+class QueryCache:
+    """
+    查询结果的缓存，按照sql和参数缓存query_one_row()和query_multi_rows()的结果。
+    每个结果都以读取的表名作为标签，MysqlExecutor对这些表的写操作(包括Model的写方法)会让结果失效。
+    同时发生的相同查询只会有一次查询到数据库，其它线程等待它的结果(single-flight)。
+
+    只缓存select语句，for update, lock in share mode 和无法解析出表名的语句不缓存。
+    强制使用主库(use_primary=True 或 MySqlDBPool.use_primary())的查询不使用缓存。
+    不经过mysqlstream的写操作只能等待缓存过期。
+
+    例如：
+        MysqlExecutor.set_query_cache(QueryCache(max_size=10000, ttl=30, max_bytes=64 * 1024 * 1024))
+    """
+
+    def __init__(self, max_size=1024, ttl=None, max_bytes=None):
+        """
+        :param max_size  最多缓存的结果数
+        :param ttl  缓存的有效期(秒)，None表示不过期
+        :param max_bytes  缓存的结果估算占用的最大字节数，None表示不限制
+        """
+        if max_size <= 0:
+            raise ValueError(f'max_size:{max_size} is incorrect !')
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f'max_bytes:{max_bytes} is incorrect !')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key和(过期时间, 标签的版本号, 字节数, 结果)的映射
+        self._flights = {}  # 正在查询的key和(Future, 表名集合)的映射
+        self._generations = {}  # 表名和版本号的映射，写操作时加1
+        self._epoch = 0  # 清空缓存时加1
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cacheable(sql):
+        """
+        sql是否可以缓存
+        """
+        return sql.lstrip().lower().startswith('select') and not _UNCACHEABLE_RE.search(sql) \
+            and bool(read_tables(sql))
+
+    @staticmethod
+    def key_of(sql, args, *options):
+        """
+        缓存的key，参数不能hash时返回None
+        """
+        key = (normalize_sql(sql), _freeze(args)) + options
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get_or_load(self, key, sql, loader):
+        """
+        获取缓存的结果，未命中时调用loader查询并缓存
+        :param key  key_of()返回的key
+        :param sql  查询的sql，用于解析表名
+        :param loader  无参数的查询函数
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if self._valid(entry):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return _copy_result(entry[3])
+                self._remove(key)
+                self.evictions += 1
+            self.misses += 1
+            flight = self._flights.get(key)
+            if flight is None:
+                tables = read_tables(sql)
+                future = Future()
+                self._flights[key] = (future, tables)
+                snapshot = {t: self._generations.get(t, 0) for t in tables}
+                epoch = self._epoch
+        if flight is not None:
+            return _copy_result(flight[0].result())
+
+        try:
+            result = loader()
+        except Exception as e:
+            with self._lock:
+                if self._flights.get(key, (None,))[0] is future:
+                    del self._flights[key]
+            future.set_exception(e)
+            raise e
+
+        with self._lock:
+            if self._flights.get(key, (None,))[0] is future:
+                del self._flights[key]
+            # 查询期间有相关的写操作时不缓存，避免缓存旧数据
+            if epoch == self._epoch and all(self._generations.get(t, 0) == g for t, g in snapshot.items()):
+                self._store(key, snapshot, result)
+        future.set_result(result)
+        return _copy_result(result)
+
+    def invalidate_sql(self, sql):
+        """
+        让写操作语句修改的表的缓存失效，无法解析时清空缓存
+        """
+        tables = written_tables(sql)
+        if tables is None:
+            self.clear()
+        else:
+            self.invalidate_tables(tables)
+
+    def invalidate_tables(self, tables):
+        """
+        让读取了指定表的缓存失效
+        :param tables  表名的集合，可以带库名
+        """
+        tables = {_table_name(t) for t in tables}
+        with self._lock:
+            for t in tables:
+                self._generations[t] = self._generations.get(t, 0) + 1
+            # 失效前发起的查询结果可能是旧数据，之后的相同查询不再等待它
+            for key in [k for k, (_, ts) in self._flights.items() if ts & tables]:
+                del self._flights[key]
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+            self._flights.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        缓存的统计信息
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(size=len(self._data),
+                        max_size=self.max_size,
+                        bytes=self.bytes,
+                        max_bytes=self.max_bytes,
+                        hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _valid(self, entry):
+        expire_at, snapshot = entry[0], entry[1]
+        if expire_at is not None and expire_at <= time.monotonic():
+            return False
+        return all(self._generations.get(t, 0) == g for t, g in snapshot.items())
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self.bytes -= entry[2]
+
+    def _store(self, key, snapshot, result):
+        size = _estimate_size(result)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        expire_at = None if self.ttl is None else time.monotonic() + self.ttl
+        self._data[key] = (expire_at, snapshot, size, result)
+        self.bytes += size
+        while len(self._data) > self.max_size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
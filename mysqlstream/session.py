@@ -0,0 +1,163 @@
+# brief: 合并ORM写操作的工作单元
+from .models import Model
+from .mysql_executor import MysqlExecutor
+
+_SAVE = 'save'
+_UPDATE = 'update'
+_DELETE = 'delete'
+
+
+class Session:
+    """
+    工作单元：记录model对象的save(), update(), delete()操作，flush()时使用一个连接在一个事务中批量执行。
+    同一张表的同一种操作合并执行：
+        save: 多行的insert语句，按max_allowed_packet分块
+        delete: delete ... where pk in (...)
+        update: 按修改过的列分组，每组 update ... set c=case pk when ... then ... end where pk in (...)
+    不同的分组按照第一次记录的顺序执行，所以同一行在一个Session中只应该记录一种操作。
+
+    例如：
+        with Session() as session:
+            session.save(User(id=1, name='name1', age=1, urls={}))
+            user = User().get(2)
+            user.age = 3
+            session.update(user)
+            session.delete(User(id=3))
+        # 正常退出时执行flush()，出现异常时丢弃记录的操作
+
+    flush()之前不访问数据库。暂不支持asyncio。
+    """
+
+    def __init__(self, chunk_size=500):
+        """
+        :param chunk_size  每条update和delete语句包含的最大行数
+        """
+        if chunk_size <= 0:
+            raise ValueError(f'chunk_size:{chunk_size} is incorrect !')
+        self.chunk_size = chunk_size
+        self._groups = {}  # (操作, model类)和对象集合的映射，按照第一次记录的顺序
+        self._recorded = set()  # 已记录的(操作, id(对象))，避免重复记录
+
+    def save(self, obj):
+        """
+        记录插入操作
+        """
+        self._add(_SAVE, obj)
+
+    def save_many(self, objs):
+        """
+        记录多个对象的插入操作
+        """
+        for obj in objs:
+            self._add(_SAVE, obj)
+
+    def update(self, obj):
+        """
+        记录更新操作，flush()时才确定修改过的列，没有修改的对象不执行
+        """
+        self._add(_UPDATE, obj)
+
+    def delete(self, obj):
+        """
+        记录删除操作
+        """
+        self._add(_DELETE, obj)
+
+    def _add(self, operation, obj):
+        if not isinstance(obj, Model):
+            raise ValueError(f'obj:{obj} is incorrect !')
+        key = (operation, id(obj))
+        if key in self._recorded:
+            return
+        self._recorded.add(key)
+        self._groups.setdefault((operation, type(obj)), []).append(obj)
+
+    def __len__(self):
+        """
+        记录的操作数
+        """
+        return len(self._recorded)
+
+    def clear(self):
+        """
+        丢弃记录的操作
+        """
+        self._groups = {}
+        self._recorded = set()
+
+    def _statements(self, groups):
+        """
+        把记录的操作转成需要执行的语句
+        :return: (model对象, sql, 参数, 是否批量执行, 写入的对象, 写入的列, 写入的值)的list，
+                 删除操作写入的列为None
+        """
+        statements = []
+        for (operation, model_class), objs in groups.items():
+            model = model_class()
+            if operation == _SAVE:
+                rows = model._insert_rows(objs)
+                statements.append((model, model.__insert__, rows, True, objs, model.__insert_columns__, rows))
+                continue
+
+            if operation == _DELETE:
+                for i in range(0, len(objs), self.chunk_size):
+                    chunk = objs[i:i + self.chunk_size]
+                    keys = model._db_values_of_column(model.__primary_key__, chunk)
+                    statements.append((model, model._delete_many_sql(len(chunk)), keys, False, chunk, None, None))
+                continue
+
+            changed = {}  # 修改过的列和对象集合的映射
+            for obj in objs:
+                columns = tuple(obj._changed_columns())
+                if columns:
+                    changed.setdefault(columns, []).append(obj)
+            for columns, changed_objs in changed.items():
+                for i in range(0, len(changed_objs), self.chunk_size):
+                    chunk = changed_objs[i:i + self.chunk_size]
+                    args, rows = model._update_many_args(chunk, columns)
+                    statements.append((model, model._update_many_sql(columns, len(chunk)), args, False,
+                                       chunk, columns, rows))
+        return statements
+
+    def flush(self):
+        """
+        在一个事务中执行记录的操作并清空记录，出错时回滚并抛出异常
+        :return: 受影响的总行数
+        """
+        groups = self._groups
+        self.clear()
+        statements = self._statements(groups)  # 在获取连接之前完成编码
+        if not statements:
+            return 0
+
+        affected = 0
+        executor = MysqlExecutor()
+        try:
+            executor.start_transaction()
+            for model, sql, args, many, objs, columns, rows in statements:
+                if many:
+                    affected += sum(executor.no_commit_execute_many(sql, args)[0])
+                else:
+                    affected += executor.no_commit_execute(sql, args)
+            executor.commit()
+        except Exception as e:
+            executor.rollback()
+            raise e
+        finally:
+            executor.close()
+            for model, sql, args, many, objs, columns, rows in statements:
+                model._invalidate_cache(objs)
+
+        for model, sql, args, many, objs, columns, rows in statements:
+            if columns is not None:
+                model._mark_clean(objs, columns, rows)
+        return affected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.clear()
@@ -0,0 +1,88 @@
+# brief: async_mysql_executor的测试用例
+import asyncio
+import json
+import unittest
+from mysqlstream.tests.test_config import TestConfig
+from mysqlstream.async_mysql_executor import AsyncMysqlExecutor
+from mysqlstream.async_mysql_db_pool import AsyncMySqlDBPool
+
+
+class TestAsyncMysqlExecutor(unittest.TestCase):
+    """
+    每个用例在新的事件循环中运行，不依赖Python 3.8的IsolatedAsyncioTestCase
+    """
+
+    def setUp(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(AsyncMySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool()))
+        self.table = 'mysqlstream.t_user'
+
+    def tearDown(self) -> None:
+        try:
+            self.loop.run_until_complete(AsyncMySqlDBPool.close_pool())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+
+    def test_1(self):
+        self.loop.run_until_complete(self._test_1())
+
+    def test_2(self):
+        self.loop.run_until_complete(self._test_2())
+
+    async def _test_1(self):
+        ids = [10, 11, 12]
+        insert_sql = "insert into {table} (id,name,age,urls) value (%s,%s,%s,%s)".format(table=self.table)
+        affected, last_id = await AsyncMysqlExecutor.execute(insert_sql, [ids[0], 'name', 1, json.dumps({})])
+        self.assertEqual(1, affected)
+        self.assertEqual(ids[0], last_id)
+
+        await AsyncMysqlExecutor.transaction_execute([insert_sql for i in ids[1:]],
+                                                     [[i, 'name', 1, json.dumps({})] for i in ids[1:]])
+        sql_all = "select * from {table} order by id".format(table=self.table)
+        rows = await AsyncMysqlExecutor.query_multi_rows(sql_all, None)
+        self.assertEqual(ids, [row['id'] for row in rows])
+
+        select_sql = "select * from {table} where id=%s".format(table=self.table)
+        row = await AsyncMysqlExecutor.query_one_row(select_sql, [ids[1]])
+        self.assertEqual(ids[1], row['id'])
+
+        rows = [row async for row in AsyncMysqlExecutor.query_stream(sql_all, None)]
+        self.assertEqual(ids, [row['id'] for row in rows])
+        batches = [rows async for rows in AsyncMysqlExecutor.query_stream(sql_all, None, batch_size=2)]
+        self.assertEqual([2, 1], [len(rows) for rows in batches])
+        stream = AsyncMysqlExecutor.query_stream(sql_all, None)
+        try:
+            async for row in stream:
+                self.assertEqual(ids[0], row['id'])
+                break
+        finally:
+            await stream.aclose()
+
+        delete_sql = 'delete from {table} where id=%s'.format(table=self.table)
+        exe = AsyncMysqlExecutor()
+        await exe.start_transaction()
+        for i in ids:
+            await exe.no_commit_execute(delete_sql, [i])
+        await exe.commit()
+        rows = await AsyncMysqlExecutor.query_multi_rows(sql_all, None)
+        self.assertEqual(0, len(rows))
+
+    async def _test_2(self):
+        insert_sql = "insert into {table} (id,name,age,urls) value (%s,%s,%s,%s)".format(table=self.table)
+        rows = [[i, 'name', i, json.dumps({})] for i in range(20, 30)]
+        affected_list, first_id = await AsyncMysqlExecutor.execute_many(insert_sql, rows)
+        self.assertEqual([10], affected_list)
+        self.assertEqual(20, first_id)
+
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        affected, _ = await AsyncMysqlExecutor.execute(delete_sql, [20])
+        self.assertEqual(10, affected)
+
+        s = "select * from user where uid=%s"
+        sql = await AsyncMysqlExecutor.build_sql(s, ['1 and 1=1'])
+        self.assertEqual("select * from user where uid='1 and 1=1'", sql)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# brief: cache的测试用例
+import time
+import unittest
+from mysqlstream.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_1(self):
+        cache = LRUCache(max_size=2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        self.assertEqual('a', cache.get(1))
+        cache.set(3, 'c')  # 淘汰最久未使用的2
+        self.assertIsNone(cache.get(2))
+        self.assertEqual('c', cache.get(3))
+        self.assertEqual(dict(size=2, max_size=2, hits=2, misses=1, evictions=1), cache.stats())
+
+        with self.assertRaises(ValueError):
+            LRUCache(max_size=0)
+
+    def test_2(self):
+        cache = LRUCache(ttl=0.05)
+        cache.set(1, 'a')
+        self.assertEqual('a', cache.get(1))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(0, len(cache))
+
+    def test_3(self):
+        cache = LRUCache()
+        generation = cache.generation
+        cache.delete(1)  # 查询期间有删除，不写入旧数据
+        self.assertFalse(cache.set(1, 'old', generation))
+        self.assertIsNone(cache.get(1))
+        self.assertTrue(cache.set(1, 'new', cache.generation))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
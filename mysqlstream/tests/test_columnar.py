@@ -0,0 +1,73 @@
+# brief: columnar的测试用例
+import unittest
+from array import array
+from datetime import datetime
+from pymysql.constants import FIELD_TYPE
+from mysqlstream.columnar import build_columns, ColumnsBuilder, numpy
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.description = [('id', FIELD_TYPE.LONGLONG), ('score', FIELD_TYPE.DOUBLE),
+                            ('create_ts', FIELD_TYPE.DATETIME), ('name', FIELD_TYPE.VAR_STRING),
+                            ('age', FIELD_TYPE.LONG)]
+        self.rows = [(1, 1.5, datetime(2020, 9, 23), 'name1', 10),
+                     (2, None, '0000-00-00 00:00:00', 'name2', None)]
+
+    def test_1(self):
+        columns = build_columns(self.description, self.rows)
+        self.assertEqual(array('q', [1, 2]), columns['id'])
+        self.assertEqual('d', columns['score'].typecode)
+        self.assertEqual(1.5, columns['score'][0])
+        self.assertNotEqual(columns['score'][1], columns['score'][1])  # nan
+        self.assertEqual(['name1', 'name2'], columns['name'])
+        self.assertEqual([10, None], columns['age'])
+
+        columns = build_columns(self.description, [])
+        self.assertEqual(array('q'), columns['id'])
+        self.assertEqual([], columns['name'])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_2(self):
+        columns = build_columns(self.description, self.rows, 'numpy')
+        self.assertEqual(numpy.int64, columns['id'].dtype)
+        self.assertEqual(numpy.float64, columns['age'].dtype)
+        self.assertTrue(numpy.isnan(columns['age'][1]))
+        self.assertEqual(numpy.dtype('datetime64[us]'), columns['create_ts'].dtype)
+        self.assertTrue(numpy.isnat(columns['create_ts'][1]))
+        self.assertEqual(object, columns['name'].dtype)
+
+    def test_3(self):
+        """
+        分块追加的结果和一次构建的相同，后面的块中出现NULL或超出int64范围的值时转换列的类型
+        """
+        description = self.description + [('big', FIELD_TYPE.LONGLONG)]
+        rows = [(i, i / 2, datetime(2020, 9, 23), f'name{i}', i, i) for i in range(5)]
+        rows += [(5, None, None, 'name5', None, 2 ** 64)]
+        backends = ['array', 'numpy'] if numpy is not None else ['array']
+        for backend in backends:
+            builder = ColumnsBuilder(description, backend)
+            for i in range(0, len(rows), 2):
+                builder.extend(rows[i:i + 2])
+            columns = builder.build()
+            expected = build_columns(description, rows, backend)
+            for name in expected:
+                self.assertEqual(type(expected[name]), type(columns[name]))
+                self.assertEqual(repr(list(expected[name])), repr(list(columns[name])))
+        self.assertEqual([0, 1, 2, 3, 4, None], build_columns(description, rows)['age'])
+        self.assertEqual([0, 1, 2, 3, 4, 2 ** 64], build_columns(description, rows)['big'])
+        self.assertEqual(array('q', [0, 1]), build_columns(description, rows[:2])['big'])
+        if numpy is not None:
+            builder = ColumnsBuilder(description, 'numpy')
+            builder.extend(rows[:3])
+            builder.extend(rows[3:])
+            columns = builder.build()
+            self.assertEqual(numpy.float64, columns['age'].dtype)
+            self.assertTrue(numpy.isnan(columns['age'][5]))
+            self.assertEqual(object, columns['big'].dtype)
+            self.assertEqual(numpy.int64, columns['id'].dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
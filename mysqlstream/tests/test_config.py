@@ -1,4 +1,6 @@
 # brief:
+import os
+import pymysql
 
 
 class TestConfig:
@@ -8,13 +10,34 @@ class TestConfig:
         username='chong',
         password=''
     )
+    _fake_server = None  # 设置了环境变量MYSQLSTREAM_FAKE_SERVER时使用的模拟服务器
 
     @classmethod
     def cfg_for_mysql_db_pool(cls):
+        if os.environ.get('MYSQLSTREAM_FAKE_SERVER') and cls._fake_server is None:
+            cls._start_fake_server()
         return cls._mysql_cfg
 
+    @classmethod
+    def _start_fake_server(cls):
+        """
+        启动进程内的模拟服务器并建好测试用的表，用于没有MySQL的环境
+        """
+        from mysqlstream.fake_mysql_server import FakeMysqlServer
 
-"""
+        cls._fake_server = FakeMysqlServer().start()
+        cls._mysql_cfg = cls._fake_server.pool_config()
+        host, port = cls._fake_server.address
+        connection = pymysql.connect(host=host, port=port, user='fake', password='')
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('create database if not exists mysqlstream')
+                cursor.execute(T_USER_DDL.replace('`t_user`', 'mysqlstream.`t_user`'))
+        finally:
+            connection.close()
+
+
+T_USER_DDL = """
 CREATE TABLE `t_user` (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `name` varchar(32) NOT NULL,
@@ -0,0 +1,59 @@
+# brief: en_decoder的测试用例
+import unittest
+from datetime import datetime
+from mysqlstream.en_decoder import EnDecoder, TextEnDecoder, FastJsonEnDecoder, DatetimeEnDecoder, \
+    BlobEnDecoder, MsgpackEnDecoder, CompressedJsonEnDecoder, msgpack, register_codec, get_codec, _codecs
+from mysqlstream.field_type import TextType, BlobType
+
+
+class TestEnDecoder(unittest.TestCase):
+
+    def test_1(self):
+        value = {'urls': ['http://@@', '🤖😁'], 'n': 1}
+        for codec in (TextEnDecoder, FastJsonEnDecoder, CompressedJsonEnDecoder):
+            encoded = codec.encode_many([value, [], None])
+            self.assertEqual([value, [], None], codec.decode_many(encoded))
+            self.assertEqual(value, codec.decode(codec.encode(value)))
+        self.assertIsInstance(CompressedJsonEnDecoder.encode(value), bytes)
+
+        self.assertEqual(b'a', BlobEnDecoder.encode(bytearray(b'a')))
+        self.assertEqual([b'a', b'b'], BlobEnDecoder.decode_many([b'a', memoryview(b'b')]))
+        if msgpack is not None:
+            self.assertEqual(value, MsgpackEnDecoder.decode(MsgpackEnDecoder.encode(value)))
+
+        ts = datetime(2020, 9, 23, 16, 48, 33, 123)
+        self.assertEqual([ts.strftime('%Y-%m-%d %H:%M:%S'), None, '2020-09-23'],
+                         DatetimeEnDecoder.decode_many([ts, None, '2020-09-23']))
+
+    def test_2(self):
+        """
+        按名称注册和替换编解码器
+        """
+        self.assertIs(TextEnDecoder, TextType().en_decoder)
+        self.assertIs(CompressedJsonEnDecoder, TextType(en_decoder='compressed_json').en_decoder)
+        self.assertIs(BlobEnDecoder, BlobType().en_decoder)
+        with self.assertRaises(ValueError):
+            get_codec('unknown')
+        with self.assertRaises(ValueError):
+            register_codec('json', object)
+
+        class UpperEnDecoder(EnDecoder):
+            @classmethod
+            def encode(cls, value):
+                return value.upper()
+
+            @classmethod
+            def decode(cls, value):
+                return value.lower()
+
+        try:
+            register_codec('json', UpperEnDecoder)
+            self.assertIs(UpperEnDecoder, TextType().en_decoder)
+            self.assertEqual(['A', 'B'], TextType().en_decoder.encode_many(['a', 'b']))
+        finally:
+            register_codec('json', TextEnDecoder)
+        self.assertIs(TextEnDecoder, _codecs['json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
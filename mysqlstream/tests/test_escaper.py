@@ -0,0 +1,68 @@
+# brief: escaper的测试用例
+import unittest
+from datetime import datetime, date
+from decimal import Decimal
+import pymysql
+from pymysql.err import ProgrammingError
+from mysqlstream.escaper import escape, compile_sql, format_sql, _templates
+
+
+class TestEscaper(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 不连接服务端的pymysql连接，用于对比转义结果
+        cls.connection = pymysql.connect(charset='utf8mb4', defer_connect=True)
+        cls.connection.server_status = 0
+
+    def test_1(self):
+        """
+        和pymysql的cursor.mogrify()结果相同
+        """
+        cursor = self.connection.cursor()
+        values = ["a'b\\c\n\x00\"", '🤖', b'\x00\xff', None, True, 1, 1.5, Decimal('1.10'),
+                  datetime(2020, 9, 23, 16, 48, 33, 123), date(2020, 9, 23), [1, 'a'], (2, None)]
+        for value in values:
+            self.assertEqual(cursor.mogrify('select %s', (value,)), format_sql('select %s', (value,)))
+        self.assertEqual(cursor.mogrify('%s,%s', values[:2]), format_sql('%s,%s', values[:2]))
+        self.assertEqual(cursor.mogrify('select %s', 'x'), format_sql('select %s', 'x'))
+
+        sql = "select * from user where name=%(name)s and age>%(age)s or alias=%(name)s and rate like '10%%'"
+        args = dict(name="a'b", age=10, unused=1)
+        self.assertEqual(cursor.mogrify(sql, args), format_sql(sql, args))
+        self.assertEqual(cursor.mogrify('100%%', ()), format_sql('100%%', ()))
+        self.assertEqual('100%%', format_sql('100%%', None))
+        self.assertEqual("'a''b'", escape("a'b", no_backslash_escapes=True))
+
+    def test_2(self):
+        """
+        相同的sql只解析一次，错误的参数抛出ProgrammingError，不完整的格式和mogrify()一样抛出ValueError
+        """
+        sql = 'select * from user where id in (%s, %s)'
+        template = compile_sql(sql)
+        self.assertIs(template, compile_sql(sql))
+        self.assertIs(template, _templates.get(sql))
+        self.assertEqual(['select * from user where id in (', ', ', ')'], template.parts)
+
+        with self.assertRaises(ProgrammingError):
+            format_sql(sql, [1])
+        with self.assertRaises(ProgrammingError):
+            format_sql(sql, dict(id=1))
+        with self.assertRaises(ProgrammingError):
+            format_sql('select %(id)s', dict(uid=1))
+        with self.assertRaises(ProgrammingError):
+            format_sql('select %d', [1])
+        with self.assertRaises(ProgrammingError):
+            format_sql('select %s, %(id)s', [1])
+
+        cursor = self.connection.cursor()
+        for sql, args in [('select 1 %', ()), ('select %s %', [1]), ('select %(id', dict(id=1))]:
+            with self.assertRaises(ValueError) as mogrify_error:
+                cursor.mogrify(sql, args)
+            with self.assertRaises(ValueError) as format_error:
+                format_sql(sql, args)
+            self.assertEqual(str(mogrify_error.exception), str(format_error.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
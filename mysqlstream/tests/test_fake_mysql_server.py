@@ -0,0 +1,79 @@
+# brief: fake_mysql_server的测试用例
+import time
+import unittest
+from datetime import datetime
+import pymysql
+from mysqlstream.fake_mysql_server import FakeMysqlServer
+
+
+class TestFakeMysqlServer(unittest.TestCase):
+
+    def _connect(self, server):
+        host, port = server.address
+        return pymysql.connect(host=host, port=port, user='fake', password='', autocommit=True)
+
+    def test_1(self):
+        """
+        常见的语句和结果集
+        """
+        with FakeMysqlServer() as server:
+            connection = self._connect(server)
+            with connection.cursor() as cursor:
+                cursor.execute('create database if not exists db')
+                cursor.execute("""create table db.`t` (
+                                      `id` int(11) not null auto_increment,
+                                      `name` varchar(32) not null,
+                                      `create_ts` timestamp not null default current_timestamp,
+                                      primary key (`id`)
+                                  ) engine=InnoDB default charset=utf8mb4""")
+                cursor.execute('insert into db.t (name, create_ts) value(%s, %s)', ["it's\n", datetime(2020, 1, 2)])
+                self.assertEqual(1, cursor.lastrowid)
+                cursor.execute("insert into db.t (name) values ('a'),('b')")
+                self.assertEqual((2, 2), (cursor.rowcount, cursor.lastrowid))
+
+                cursor.execute('insert into db.t (id, name) value(%s, %s) on duplicate key update name=values(name)',
+                               [2, 'new_a'])
+                cursor.execute('select id, name, create_ts from db.t where id<=%s order by id', [2])
+                rows = cursor.fetchall()
+                self.assertEqual((1, "it's\n", datetime(2020, 1, 2)), rows[0])
+                self.assertEqual('new_a', rows[1][1])
+
+                cursor.execute('select @@max_allowed_packet')
+                self.assertGreater(cursor.fetchone()[0], 0)
+                with self.assertRaises(pymysql.err.ProgrammingError):
+                    cursor.execute('select * from db.unknown')
+            connection.close()
+            self.assertGreater(server.queries, 0)
+
+    def test_2(self):
+        """
+        注入的延迟和带宽限制
+        """
+        with FakeMysqlServer(latency=0.05) as server:
+            connection = self._connect(server)
+            with connection.cursor() as cursor:
+                start = time.perf_counter()
+                cursor.execute('select 1')
+                self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+            connection.close()
+
+        with FakeMysqlServer(bandwidth=100 * 1024) as server:
+            connection = self._connect(server)
+            with connection.cursor() as cursor:
+                start = time.perf_counter()
+                cursor.execute("select '%s'" % ('x' * 20 * 1024))
+                self.assertGreaterEqual(time.perf_counter() - start, 0.15)
+            connection.close()
+
+    def test_3(self):
+        """
+        注入的连接失败
+        """
+        with FakeMysqlServer(failure_rate=1.0) as server:
+            with self.assertRaises(pymysql.err.OperationalError):
+                self._connect(server)
+        self.assertEqual(1, server.total_connections)
+
+
+if __name__ == '__main__':
+    unittest.main()
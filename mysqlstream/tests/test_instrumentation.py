@@ -0,0 +1,64 @@
+# brief: instrumentation的测试用例
+import logging
+import unittest
+from mysqlstream.instrumentation import (StatementEvent, DigestStats, SlowQueryLog, add_listener, remove_listener,
+                                         start_timer, digest)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_1(self):
+        self.assertEqual('select * from t where id in (...) and name=?',
+                         digest("select * from t where id in (1, 2,3) and name='a'"))
+        self.assertEqual('insert into t (a,b) values (...)',
+                         digest(b"insert into t (a,b) values (1,'x'),(2,'y')"))
+        self.assertEqual(digest('select * from t where id=%s'), digest('select  * from t\nwhere id=10'))
+
+    def test_2(self):
+        events = []
+        self.assertFalse(hasattr(start_timer('query', 'select 1'), 'event'))  # 没有监听函数时不计时
+        add_listener(events.append)
+        try:
+            with start_timer('query', 'select 1') as timer:
+                timer.mark('checkout')
+                timer.set_rows(1)
+            with self.assertRaises(ValueError):
+                with start_timer('execute', 'delete from t'):
+                    raise ValueError()
+        finally:
+            remove_listener(events.append)
+        self.assertFalse(hasattr(start_timer('query', 'select 1'), 'event'))
+        self.assertEqual(['query', 'execute'], [e.kind for e in events])
+        self.assertEqual(1, events[0].rows)
+        self.assertGreaterEqual(events[0].total, events[0].checkout)
+        self.assertIsInstance(events[1].error, ValueError)
+
+    def test_3(self):
+        stats = DigestStats(max_samples=10)
+        for i in range(1, 101):
+            event = StatementEvent('query', f'select * from t where id={i}')
+            event.total = i / 1000
+            event.rows = 1
+            stats(event)
+        item, = stats.report()
+        self.assertEqual('select * from t where id=?', item['digest'])
+        self.assertEqual(100, item['count'])
+        self.assertEqual(100, item['total_rows'])
+        self.assertLessEqual(item['p50'], item['p95'])
+        self.assertLessEqual(item['p95'], item['p99'])
+        stats.reset()
+        self.assertEqual([], stats.report())
+
+    def test_4(self):
+        slow_log = SlowQueryLog(threshold=0.5)
+        fast = StatementEvent('query', 'select 1')
+        slow = StatementEvent('query', 'select sleep(1)')
+        slow.total = 1.0
+        with self.assertLogs('mysqlstream.slow_query', logging.WARNING):
+            slow_log(fast)
+            slow_log(slow)
+        self.assertEqual([slow], list(slow_log.entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,19 @@
 # brief: models的单元测试
+import asyncio
+import pickle
 import unittest
+import pymysql
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from mysqlstream.tests.test_config import TestConfig
 from mysqlstream.field_type import StringType, IntegerType, TextType, DatetimeType
+from mysqlstream.cache import LRUCache
+from mysqlstream.coalescer import Coalescer
 from mysqlstream.models import Model
 from mysqlstream.mysql_db_pool import MySqlDBPool
+from mysqlstream.mysql_executor import MysqlExecutor
+from mysqlstream.async_mysql_db_pool import AsyncMySqlDBPool
+from mysqlstream.instrumentation import add_listener, remove_listener
 
 
 class User(Model):
@@ -107,6 +116,390 @@ class TestModels(unittest.TestCase):
         count = User().count_of_rows('id')
         self.assertEqual(0, count)
 
+    def test_2(self):
+        """
+        按主键分页遍历
+        """
+        ids = list(range(1, 12))
+        for i in ids:
+            User(id=i, name=f'name{i}', age=i, urls={}).save()
+
+        users = list(User().iter_all(chunk_size=3))
+        self.assertEqual(ids, [u.id for u in users])
+
+        users = list(User().iter_all('age>%s', args=[5], chunk_size=2))
+        self.assertEqual(ids[5:], [u.id for u in users])
+
+        users = list(User().iter_all('age>%s', args=[100]))
+        self.assertEqual([], users)
+
+        for i in ids:
+            User(id=i).delete()
+
+    def test_3(self):
+        """
+        批量保存
+        """
+        ids = list(range(1, 21))
+        users = [User(id=i, name=f'name{i}', age=i, urls={'i': i}) for i in ids]
+        affected_list, first_id = User().save_many(users)
+        self.assertEqual(len(ids), sum(affected_list))
+        self.assertEqual(ids[0], first_id)
+
+        users = User().query_all(order_by='id')
+        self.assertEqual(ids, [u.id for u in users])
+        self.assertEqual([{'i': i} for i in ids], [u.urls for u in users])
+
+        for i in ids:
+            User(id=i).delete()
+
+    def test_4(self):
+        """
+        批量插入或更新
+        """
+        User(id=1, name='name1', age=1, urls={}).save()
+        users = [User(id=i, name=f'new_name{i}', age=i * 10, urls={}) for i in (1, 2)]
+        User().upsert_many(users)
+        self.assertEqual('new_name1', User().get(1).name)
+        self.assertEqual(10, User().get(1).age)
+        self.assertEqual('new_name2', User().get(2).name)
+
+        users = [User(id=i, name='ignored', age=i * 100, urls={}) for i in (1, 2, 3)]
+        User().upsert_many(users, update_columns=['age'])
+        self.assertEqual(['new_name1', 'new_name2', 'ignored'], [u.name for u in User().query_all(order_by='id')])
+        self.assertEqual([100, 200, 300], [u.age for u in User().query_all(order_by='id')])
+
+        with self.assertRaises(ValueError):
+            User().upsert_many(users, update_columns=['id'])
+
+        for i in (1, 2, 3):
+            User(id=i).delete()
+
+    def test_5(self):
+        """
+        asyncio版本的方法
+        """
+        async def run():
+            await AsyncMySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool())
+            try:
+                await User(id=1, name='name1', age=1, urls={'a': 1}).asave()
+                await User().asave_many([User(id=i, name=f'name{i}', age=i, urls={}) for i in (2, 3)])
+                user = await User().aget(1)
+                self.assertEqual({'a': 1}, user.urls)
+
+                user.age = 10
+                await user.aupdate()
+                self.assertEqual(10, (await User().aget(1)).age)
+
+                await User().aupsert_many([User(id=3, name='new_name3', age=3, urls={})])
+                users = await User().aquery_all('id>%s', args=[1], order_by='id')
+                self.assertEqual(['name2', 'new_name3'], [u.name for u in users])
+                users = [u async for u in User().aiter_all(chunk_size=2)]
+                self.assertEqual([1, 2, 3], [u.id for u in users])
+                self.assertEqual(3, await User().acount_of_rows('id'))
+                users = await User().aget_many([3, 100, 1])
+                self.assertEqual([3, None, 1], [u and u.id for u in users])
+
+                for i in (1, 2, 3):
+                    await User(id=i).adelete()
+                self.assertEqual(0, await User().acount_of_rows('id'))
+            finally:
+                await AsyncMySqlDBPool.close_pool()
+
+        asyncio.run(run())
+
+    def test_6(self):
+        """
+        编译后的行解码函数
+        """
+        create_ts = datetime(2020, 9, 23, 16, 48, 33)
+        row = (1, 'name1', 10, '{"a": 1}', create_ts)
+        user = User.__decode_row__(row)
+        self.assertEqual(1, user.id)
+        self.assertEqual({'a': 1}, user.urls)
+        self.assertEqual('2020-09-23 16:48:33', user.create_ts)
+
+        columns = ['id', 'name', 'age', 'urls', 'create_ts']
+        self.assertEqual(user, User()._row2obj(dict(zip(columns, row))))
+        self.assertEqual(user, User()._row2obj(row))
+
+        # ORM的查询不受连接池的cursor_class影响
+        MySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool(), cursor_class=pymysql.cursors.Cursor)
+        try:
+            User(id=1, name='name1', age=10, urls={'a': 1}).save()
+            self.assertEqual({'a': 1}, User().get(1).urls)
+            self.assertEqual([1], [u.id for u in User().query_all()])
+            self.assertEqual(1, User().count_of_rows('id'))
+            User(id=1).delete()
+        finally:
+            MySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool())
+
+    def test_7(self):
+        """
+        slot存储的model对象
+        """
+        user = User(id=1, name='name1', age=10, urls={'a': 1})
+        self.assertFalse(hasattr(user, '__dict__'))
+        self.assertEqual({'id': 1, 'name': 'name1', 'age': 10, 'urls': {'a': 1}}, user.to_dict())
+        self.assertEqual(user.to_dict(), dict(user))
+        self.assertEqual('name1', user['name'])
+        self.assertTrue('age' in user)
+        self.assertFalse('create_ts' in user)
+        with self.assertRaises(AttributeError):
+            _ = user.create_ts
+        with self.assertRaises(AttributeError):
+            User(unknown=1)
+        self.assertEqual(user, pickle.loads(pickle.dumps(user)))
+
+    def test_8(self):
+        """
+        get()的缓存
+        """
+        class CachedUser(Model):
+            __table__ = 'mysqlstream.t_user'
+            __cache__ = LRUCache(max_size=10)
+
+            id = IntegerType('id', primary_key=True)
+            name = StringType('name', default='')
+            age = IntegerType('age')
+            urls = TextType()
+            create_ts = DatetimeType()
+
+        cache = CachedUser.__cache__
+        CachedUser(id=1, name='name1', age=1, urls={'a': 1}).save()
+        user = CachedUser().get(1)
+        self.assertEqual(user, CachedUser().get([1]))
+        self.assertEqual(1, cache.stats()['hits'])
+
+        user.urls['a'] = 2  # 修改对象不影响缓存
+        self.assertEqual({'a': 1}, CachedUser().get(1).urls)
+
+        user.age = 10
+        user.update()
+        self.assertEqual(10, CachedUser().get(1).age)
+        hits = cache.stats()['hits']
+        with MySqlDBPool.use_primary():  # 强制使用主库时不读缓存
+            self.assertEqual(10, CachedUser().get(1).age)
+            self.assertEqual(10, CachedUser().get_many([1])[0].age)
+        self.assertEqual(hits, cache.stats()['hits'])
+
+        user.delete()
+        self.assertIsNone(CachedUser().get(1))
+        self.assertEqual(0, len(cache))
+
+        user = CachedUser(id=2, name='name2', age=2, urls={})
+        user.save()
+        with MysqlExecutor.scope():
+            exe = MysqlExecutor()
+            exe.start_transaction()
+            user.age = 20
+            user.update()
+            cache.set(2, (2, 'name2', 2, '{}', None))  # 提交前其它线程缓存了旧的行
+            exe.commit()
+            exe.close()
+        self.assertEqual(20, CachedUser().get(2).age)
+        user.delete()
+
+    def test_9(self):
+        """
+        批量获取和合并并发的get()
+        """
+        class CoalescedUser(Model):
+            __table__ = 'mysqlstream.t_user'
+            __coalescer__ = Coalescer(window=0.05, max_batch=100)
+
+            id = IntegerType('id', primary_key=True)
+            name = StringType('name', default='')
+            age = IntegerType('age')
+            urls = TextType()
+            create_ts = DatetimeType()
+
+        ids = list(range(1, 11))
+        User().save_many([User(id=i, name=f'name{i}', age=i, urls={}) for i in ids])
+        users = User().get_many([3, 100, 1, 3], chunk_size=2)
+        self.assertEqual([3, None, 1, 3], [u and u.id for u in users])
+        self.assertIsNot(users[0], users[3])
+
+        coalescer = CoalescedUser.__coalescer__
+        with ThreadPoolExecutor(max_workers=len(ids)) as executor:
+            users = list(executor.map(lambda i: CoalescedUser().get(i), ids + [100]))
+        self.assertEqual(ids + [None], [u and u.id for u in users])
+        self.assertEqual(len(ids) + 1, coalescer.loads)
+        self.assertLess(coalescer.batches, coalescer.loads)
+
+        with MysqlExecutor.scope():  # 在固定的连接上查询，不合并
+            exe = MysqlExecutor()
+            exe.start_transaction()
+            MysqlExecutor.execute('update mysqlstream.t_user set age=%s where id=%s', [100, 1])
+            self.assertEqual(100, CoalescedUser().get(1).age)  # 能读到未提交的修改
+            exe.rollback()
+            exe.close()
+        self.assertEqual(len(ids) + 1, coalescer.loads)
+
+        for i in ids:
+            User(id=i).delete()
+
+    def test_10(self):
+        """
+        TextType等列在访问时才解码
+        """
+        user = User()._row2obj((1, 'name1', 10, '{"a": [1, 2]}', datetime(2020, 9, 23, 16, 48, 33)))
+        self.assertEqual('{"a": [1, 2]}', user.raw_value('urls'))
+        self.assertEqual('{"a": [1, 2]}', user._db_value_of_column('urls'))  # 没有解码，直接写入原始值
+        self.assertIsNone(user.raw_value('name'))
+
+        urls = user.urls
+        self.assertEqual({'a': [1, 2]}, urls)
+        self.assertIs(urls, user.urls)  # 解码一次后缓存
+        self.assertEqual('2020-09-23 16:48:33', user.create_ts)
+        urls['b'] = 1  # 已经解码的值重新编码
+        self.assertEqual('{"a": [1, 2], "b": 1}', user._db_value_of_column('urls'))
+
+        user.urls = {'c': 3}
+        self.assertIsNone(user.raw_value('urls'))
+        self.assertEqual({'c': 3}, user.urls)
+
+        user = User()._row2obj((1, 'name1', 10, '{}', datetime(2020, 9, 23, 16, 48, 33)))
+        copied = pickle.loads(pickle.dumps(user))
+        self.assertEqual(user, copied)
+        self.assertEqual(user.to_dict(), copied.to_dict())
+
+    def test_11(self):
+        """
+        按列批量编码和解码
+        """
+        create_ts = datetime(2020, 9, 23, 16, 48, 33)
+        users = [User()._row2obj((i, f'name{i}', i, '{"i": %d}' % i, create_ts)) for i in range(1, 4)]
+        users[1].urls = {'b': 2}
+        users.append(User(id=4, age=4, urls=[4], create_ts='2020-09-23 16:48:33'))
+        self.assertEqual([tuple(u._insert_args()) for u in users], User()._insert_rows(users))
+        self.assertEqual('{"i": 1}', User()._insert_rows(users)[0][3])  # 原始值直接写入
+
+        self.assertIs(users, User().decode_all(users, ['urls']))
+        self.assertEqual([{'i': 1}, {'b': 2}, {'i': 3}, [4]], [u.urls for u in users])
+        self.assertEqual('{"i": 3}', users[2].raw_value('urls'))  # 批量解码后保留原始值
+        User().decode_all(users)
+        self.assertEqual('2020-09-23 16:48:33', users[0].create_ts)
+        with self.assertRaises(ValueError):
+            User().decode_all(users, ['name'])
+
+    def test_12(self):
+        """
+        只查询部分列和延迟加载的列
+        """
+        class DeferredUser(Model):
+            __table__ = 'mysqlstream.t_user'
+
+            id = IntegerType('id', primary_key=True)
+            name = StringType('name', default='')
+            age = IntegerType('age')
+            urls = TextType(deferred=True)
+            create_ts = DatetimeType()
+
+        self.assertNotIn('urls', DeferredUser.__select__)
+        ids = list(range(1, 6))
+        User().save_many([User(id=i, name=f'name{i}', age=i, urls={'i': i}) for i in ids])
+
+        user = DeferredUser().get(1)
+        self.assertNotIn('urls', user)
+        self.assertEqual({'i': 1}, user.urls)  # 访问时查询
+        self.assertEqual('{"i": 1}', user.raw_value('urls'))
+
+        users = DeferredUser().query_all('id<=%s', [3], order_by='id')
+        self.assertIs(users, DeferredUser().load_columns(users, ['urls']))
+        self.assertTrue(all('urls' in u for u in users))
+        self.assertEqual([{'i': 1}, {'i': 2}, {'i': 3}], [u.urls for u in users])
+
+        users = User().query_all('id<=%s', [2], order_by='id', columns=['name'])
+        self.assertEqual([dict(id=1, name='name1'), dict(id=2, name='name2')], [u.to_dict() for u in users])
+        self.assertEqual(2, users[1].age)
+        self.assertEqual(['id', 'age'], list(User().get(3, columns=['age']).keys()))
+        self.assertEqual(ids, [u.id for u in User().iter_all(chunk_size=2, columns=['id'])])
+        copied = pickle.loads(pickle.dumps(users[0]))
+        self.assertEqual(users[0], copied)
+        self.assertEqual({'i': 1}, copied.urls)
+
+        with self.assertRaises(AttributeError):
+            User(id=1).urls  # 不是从数据库读取的对象不加载
+        with self.assertRaises(ValueError):
+            User().query_all(columns=['unknown'])
+
+        for i in ids:
+            User(id=i).delete()
+
+    def test_13(self):
+        """
+        update()只更新修改过的列
+        """
+        events = []
+        user = User(id=1, name='name1', age=1, urls={'a': 1})
+        user.save()
+        add_listener(events.append)
+        try:
+            self.assertEqual((0, 0), user.update())  # 保存后没有修改
+            user.age = 2
+            self.assertEqual(['age'], user._changed_columns())
+            self.assertEqual(1, user.update()[0])
+            self.assertIn('set age=%s where', events[-1].sql)
+            self.assertEqual((0, 0), user.update())
+
+            user = User().get(1)
+            user.urls['b'] = 2  # 原地修改
+            user.name = 'new_name1'
+            self.assertEqual(['name', 'urls'], user._changed_columns())
+            self.assertIs(user._update_sql(['name', 'urls']), user._update_statement()[0])
+            user.update()
+            self.assertEqual([], user._changed_columns())
+            self.assertEqual(3, len(events))
+        finally:
+            remove_listener(events.append)
+
+        user = User().get(1)
+        self.assertEqual(('new_name1', 2, {'a': 1, 'b': 2}), (user.name, user.age, user.urls))
+        self.assertEqual([], user._changed_columns())
+        self.assertEqual(User.__columns_without_primary_key__, User(id=1)._changed_columns())
+        self.assertEqual([], pickle.loads(pickle.dumps(user))._changed_columns())  # unpickle不记录修改
+        User(id=1).delete()
+
+        user = User()._row2obj((1, 'name1', 1, '{"a":1,  "b" : "\\u4e2d"}', None))  # 和编码器的输出格式不同
+        self.assertEqual({'a': 1, 'b': '中'}, user.urls)
+        self.assertEqual([], user._changed_columns())
+        user.urls['a'] = 2
+        self.assertEqual(['urls'], user._changed_columns())
+
+    def test_14(self):
+        """
+        按主键区间并发遍历
+        """
+        ids = list(range(1, 21)) + [100]
+        User().save_many([User(id=i, name=f'name{i}', age=i % 3, urls={'i': i}) for i in ids])
+        try:
+            self.assertEqual([None, 26, 51, 76, None], User()._scan_boundaries(None, None, 4, 'range'))
+            self.assertEqual([None, 6, 11, 16, None], User()._scan_boundaries(None, None, 4, 'sample'))
+
+            users = list(User().parallel_scan(workers=3, chunk_size=2, ordered=True))
+            self.assertEqual(ids, [u.id for u in users])
+            self.assertEqual({'i': 100}, users[-1].urls)
+            scanned = User().parallel_scan(workers=3, where='age=%s', args=[0], chunk_size=2, fn=lambda u: u.id)
+            self.assertEqual([i for i in ids if i % 3 == 0], sorted(scanned))
+            scanned = User().parallel_scan(workers=2, chunk_size=3, ordered=True, split='sample', columns=['name'])
+            self.assertEqual([f'name{i}' for i in ids], [u.name for u in scanned])
+            self.assertEqual([], list(User().parallel_scan(where='id>%s', args=[1000])))
+
+            scanned = User().parallel_scan(workers=2, chunk_size=1, prefetch=1, ordered=True)
+            self.assertEqual([1, 2], [next(scanned).id, next(scanned).id])
+            scanned.close()  # 提前关闭时工作线程退出
+
+            def fail(u):
+                raise RuntimeError(u.id)
+            with self.assertRaises(RuntimeError):
+                list(User().parallel_scan(workers=2, fn=fail))
+            with self.assertRaises(ValueError):
+                list(User().parallel_scan(split='unknown'))
+        finally:
+            for i in ids:
+                User(id=i).delete()
+
 
 if __name__ == '__main__':
     unittest.main()
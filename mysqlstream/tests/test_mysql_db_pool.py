@@ -1,4 +1,6 @@
 # brief: mysql_db_pool的测试用例
+import threading
+import time
 import unittest
 from mysqlstream.tests.test_config import TestConfig
 from mysqlstream.mysql_db_pool import MySqlDBPool
@@ -17,17 +19,100 @@ class TestMysqlDBPool(unittest.TestCase):
         """
         方法功能测试
         """
-        self.assertEqual(MySqlDBPool._pool._connections, 0)
+        self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 0)
         self.mysql_db_pool.get_connection()
-        self.assertEqual(MySqlDBPool._pool._connections, 1)
+        self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 1)
 
         self.mysql_db_pool.recycle_connection()
-        self.assertEqual(MySqlDBPool._pool._connections, 0)
+        self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 0)
 
         with MySqlDBPool() as _:
-            self.assertEqual(MySqlDBPool._pool._connections, 1)
+            self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 1)
             pass
-        self.assertEqual(MySqlDBPool._pool._connections, 0)
+        self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 0)
+
+    def test_2(self):
+        """
+        读写分离
+        """
+        cfg = TestConfig.cfg_for_mysql_db_pool()
+        MySqlDBPool.init_pool(1, 4, **cfg, name='replica1', role='replica')
+        MySqlDBPool.init_pool(1, 4, **cfg, name='replica2', role='replica')
+        try:
+            # 写操作使用主库，读操作在从库间轮询
+            with MySqlDBPool() as _:
+                self.assertEqual(MySqlDBPool.pool_stats()['in_use'], 1)
+            names = []
+            for i in range(4):
+                pool = MySqlDBPool(readonly=True)
+                with pool as _:
+                    names.append(pool._pool_name)
+            self.assertEqual(['replica1', 'replica2'], sorted(set(names)))
+            self.assertNotEqual(names[0], names[1])
+
+            with MySqlDBPool.use_primary():
+                pool = MySqlDBPool(readonly=True)
+                with pool as _:
+                    self.assertEqual('default', pool._pool_name)
+
+            # 选择正在使用的连接最少的从库
+            MySqlDBPool.set_balance_policy('least_outstanding')
+            busy = MySqlDBPool(readonly=True)
+            busy.get_connection()
+            pool = MySqlDBPool(readonly=True)
+            with pool as _:
+                self.assertNotEqual(busy._pool_name, pool._pool_name)
+            busy.recycle_connection()
+
+            pool = MySqlDBPool(name='replica2')
+            with pool as _:
+                self.assertEqual('replica2', pool._pool_name)
+        finally:
+            MySqlDBPool.set_balance_policy('round_robin')
+            MySqlDBPool.close_pool('replica1')
+            MySqlDBPool.close_pool('replica2')
+        pool = MySqlDBPool(readonly=True)
+        with pool as _:
+            self.assertEqual('default', pool._pool_name)
+
+    def test_3(self):
+        """
+        连接池的状态和自适应的连接数
+        """
+        cfg = TestConfig.cfg_for_mysql_db_pool()
+        MySqlDBPool.init_pool(1, 3, **cfg, name='adaptive', role='replica',
+                              adaptive=True, target_wait=0.05, quiet_period=0.2)
+        try:
+            busy = MySqlDBPool(name='adaptive')
+            busy.get_connection()
+            stats = MySqlDBPool.pool_stats('adaptive')
+            self.assertEqual((1, 0, 1), (stats['in_use'], stats['idle'], stats['max_connections']))
+
+            # 连接数达到上限时等待，等待超过target_wait后上限加1，不需要等到其它连接归还
+            waiter = MySqlDBPool(name='adaptive')
+            thread = threading.Thread(target=waiter.get_connection)
+            thread.start()
+            thread.join(timeout=2)
+            self.assertFalse(thread.is_alive())
+            stats = MySqlDBPool.pool_stats('adaptive')
+            self.assertEqual((0, 2, 2), (stats['waiters'], stats['in_use'], stats['max_connections']))
+            self.assertEqual(2, stats['checkouts'])
+            self.assertGreater(stats['wait_max'], 0.05)
+            self.assertLess(stats['wait_max'], 1)
+            self.assertEqual(2, sum(count for _, count in stats['wait_histogram']))
+            self.assertEqual([0, 0], [c['reuse'] for c in stats['connections']])
+            busy.recycle_connection()
+            waiter.recycle_connection()
+
+            # quiet_period内没有等待超时后收缩，没有线程等待时watcher线程退出
+            time.sleep(0.3)
+            self.assertIsNone(MySqlDBPool._metrics['adaptive'].watcher)
+            with MySqlDBPool(name='adaptive') as _:
+                pass
+            stats = MySqlDBPool.pool_stats('adaptive')
+            self.assertEqual((0, 1, 1), (stats['in_use'], stats['idle'], stats['max_connections']))
+        finally:
+            MySqlDBPool.close_pool('adaptive')
 
 
 if __name__ == '__main__':
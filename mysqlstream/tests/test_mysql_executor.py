@@ -3,8 +3,10 @@ import json
 import unittest
 from datetime import datetime, timezone, timedelta
 from mysqlstream.tests.test_config import TestConfig
-from mysqlstream.mysql_executor import MysqlExecutor
+from mysqlstream.mysql_executor import MysqlExecutor, BatchStatementError
 from mysqlstream.mysql_db_pool import MySqlDBPool
+from mysqlstream.query_cache import QueryCache
+from mysqlstream.instrumentation import DigestStats, add_listener, remove_listener, digest
 
 
 class TestMysqlExecutor(unittest.TestCase):
@@ -159,12 +161,258 @@ class TestMysqlExecutor(unittest.TestCase):
         right_sql = "select * from user where uid='1 and 1=1'"
         self.assertEqual(sql, right_sql)
 
+    def test_3(self):
+        """
+        流式查询
+        """
+        ids = list(range(100, 110))
+        insert_sql = "insert into {table} (id,name,age,urls) value (%s,%s,%s,%s)".format(table=self.table)
+        MysqlExecutor.transaction_execute([insert_sql for i in ids],
+                                          [[i, 'name', 1, json.dumps({})] for i in ids])
+
+        stream_sql = "select * from {table} where id>=%s order by id".format(table=self.table)
+        rows = list(MysqlExecutor.query_stream(stream_sql, [100]))
+        self.assertEqual(ids, [row['id'] for row in rows])
+
+        batches = list(MysqlExecutor.query_stream(stream_sql, [100], batch_size=4))
+        self.assertEqual([4, 4, 2], [len(rows) for rows in batches])
+
+        # 提前结束时连接被归还
+        for row in MysqlExecutor.query_stream(stream_sql, [100]):
+            self.assertEqual(row['id'], ids[0])
+            break
+        self.assertEqual(MySqlDBPool._pool._connections, 0)
+        self.assertTrue(any(con._closed for con in MySqlDBPool._pool._idle_cache))  # 没有读完剩余的结果
+        self.assertEqual(107, MysqlExecutor.query_one_row(stream_sql, [107])['id'])
+
+        with MysqlExecutor.scope():  # 固定的连接读完剩余的结果后继续使用
+            for row in MysqlExecutor.query_stream(stream_sql, [100]):
+                break
+            self.assertEqual(107, MysqlExecutor.query_one_row(stream_sql, [107])['id'])
+
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        MysqlExecutor.execute(delete_sql, [100])
+
+    def test_4(self):
+        """
+        批量执行
+        """
+        ids = list(range(200, 230))
+        insert_sql = "insert into {table} (id,name,age,urls) value (%s,%s,%s,%s)".format(table=self.table)
+        rows = [[i, 'name', i, json.dumps({"url": "http://'x'.com"})] for i in ids]
+        affected_list, first_id = MysqlExecutor.execute_many(insert_sql, rows)
+        self.assertEqual([len(ids)], affected_list)
+        self.assertEqual(ids[0], first_id)
+
+        # 超过max_allowed_packet时分块执行
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        MysqlExecutor.execute(delete_sql, [200])
+        max_allowed_packet = MysqlExecutor._max_allowed_packet
+        MysqlExecutor._max_allowed_packet = {name: 1024 + 500 for name in MySqlDBPool._pools}
+        try:
+            affected_list, first_id = MysqlExecutor.execute_many(insert_sql, rows)
+        finally:
+            MysqlExecutor._max_allowed_packet = max_allowed_packet
+        self.assertTrue(len(affected_list) > 1)
+        self.assertEqual(len(ids), sum(affected_list))
+        self.assertEqual(ids[0], first_id)
+
+        sql_all = "select * from {table} where id>=%s order by id".format(table=self.table)
+        rows = MysqlExecutor.query_multi_rows(sql_all, [200])
+        self.assertEqual(ids, [row['age'] for row in rows])
+
+        # 非insert语句逐行执行
+        update_sql = "update {table} set age=%s where id=%s".format(table=self.table)
+        affected_list, _ = MysqlExecutor.execute_many(update_sql, [[1, i] for i in ids])
+        self.assertEqual([1] * len(ids), affected_list)
+
+        # values(...)之外有占位符时逐行执行，%%按照mogrify()的规则还原成%
+        upsert_sql = ("insert into {table} (id,name,age,urls) values (%s,%s,%s,'50%%') "
+                      "on duplicate key update age=%s").format(table=self.table)
+        affected_list, _ = MysqlExecutor.execute_many(upsert_sql, [[i, 'name', i, 2] for i in ids[:3]])
+        self.assertEqual(3, len(affected_list))
+        suffix_sql = ("insert into {table} (id,name,age,urls) values (%s,%s,%s,%s) "
+                      "on duplicate key update urls='100%%'").format(table=self.table)
+        affected_list, _ = MysqlExecutor.execute_many(suffix_sql, [[i, 'name', i, '{}'] for i in ids[:3]])
+        self.assertEqual(1, len(affected_list))
+        rows = MysqlExecutor.query_multi_rows(sql_all, [200])
+        self.assertEqual([2, 2, 2], [row['age'] for row in rows[:3]])
+        self.assertEqual(['100%'] * 3, [row['urls'] for row in rows[:3]])
+
+        MysqlExecutor.execute(delete_sql, [200])
+
+    def test_5(self):
+        """
+        按列查询
+        """
+        ids = list(range(300, 310))
+        insert_sql = "insert into {table} (id,name,age,urls) value (%s,%s,%s,%s)".format(table=self.table)
+        MysqlExecutor.execute_many(insert_sql, [[i, f'name{i}', i * 2, json.dumps({})] for i in ids])
+
+        sql = "select id,name,age from {table} where id>=%s order by id".format(table=self.table)
+        columns = MysqlExecutor.query_columnar(sql, [300])
+        self.assertEqual(ids, list(columns['id']))
+        self.assertEqual([i * 2 for i in ids], list(columns['age']))
+        self.assertEqual([f'name{i}' for i in ids], columns['name'])
+
+        chunks = list(MysqlExecutor.query_columnar_stream(sql, [300], chunk_size=4))
+        self.assertEqual([4, 4, 2], [len(c['id']) for c in chunks])
+
+        # 提前结束时关闭连接，不读取剩余的结果
+        for chunk in MysqlExecutor.query_columnar_stream(sql, [300], chunk_size=4):
+            break
+        self.assertEqual(MySqlDBPool._pool._connections, 0)
+        self.assertTrue(any(con._closed for con in MySqlDBPool._pool._idle_cache))
+        self.assertEqual(ids, list(MysqlExecutor.query_columnar(sql, [300])['id']))
+
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        MysqlExecutor.execute(delete_sql, [300])
+
+    def test_6(self):
+        """
+        查询结果的缓存
+        """
+        query_cache = QueryCache(max_size=100, ttl=60)
+        MysqlExecutor.set_query_cache(query_cache)
+        try:
+            insert_sql = "insert into {table} (id,name,age) value(%s,%s,%s)".format(table=self.table)
+            MysqlExecutor.execute(insert_sql, [400, 'name400', 1])
+            sql = "select id,age from {table} where id=%s".format(table=self.table)
+            self.assertEqual(1, MysqlExecutor.query_one_row(sql, [400])['age'])
+            self.assertEqual(1, MysqlExecutor.query_one_row(sql, [400])['age'])
+            self.assertEqual(1, query_cache.stats()['hits'])
+
+            update_sql = "update {table} set age=%s where id=%s".format(table=self.table)
+            MysqlExecutor.execute(update_sql, [2, 400])
+            self.assertEqual(2, MysqlExecutor.query_one_row(sql, [400])['age'])
+
+            MysqlExecutor.transaction_execute([update_sql], [[3, 400]])
+            self.assertEqual(3, MysqlExecutor.query_one_row(sql, [400])['age'])
+
+            with MySqlDBPool.use_primary():
+                MysqlExecutor.query_one_row(sql, [400])
+            self.assertEqual(1, query_cache.stats()['hits'])
+        finally:
+            MysqlExecutor.set_query_cache(None)
+            MysqlExecutor.execute('delete from {table} where id=%s'.format(table=self.table), [400])
+
+    def test_7(self):
+        """
+        语句的耗时统计
+        """
+        stats = DigestStats()
+        events = []
+        add_listener(stats)
+        add_listener(events.append)
+        try:
+            insert_sql = "insert into {table} (id,name,age) value(%s,%s,%s)".format(table=self.table)
+            for i in (500, 501):
+                MysqlExecutor.execute(insert_sql, [i, f'name{i}', i])
+            sql = "select * from {table} where id>=%s".format(table=self.table)
+            MysqlExecutor.query_multi_rows(sql, [500])
+            delete_sql = 'delete from {table} where id=%s'.format(table=self.table)
+            MysqlExecutor.transaction_execute([delete_sql, delete_sql], [[500], [501]])
+        finally:
+            remove_listener(stats)
+            remove_listener(events.append)
+
+        self.assertEqual(['execute', 'execute', 'query', 'transaction'], [e.kind for e in events])
+        self.assertEqual(2, events[2].rows)
+        self.assertEqual(2, events[3].rows)
+        self.assertTrue(all(e.total >= e.checkout + e.execute + e.fetch + e.commit for e in events))
+        report = {item['digest']: item for item in stats.report()}
+        self.assertEqual(2, report[digest(insert_sql)]['count'])
+        self.assertEqual(2, report[digest(sql)]['total_rows'])
+
+    def test_8(self):
+        """
+        scope()中使用同一个连接
+        """
+        insert_sql = "insert into {table} (id,name,age) value(%s,%s,%s)".format(table=self.table)
+        select_sql = "select id from {table} where id>=%s order by id".format(table=self.table)
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        checkouts = MySqlDBPool.pool_stats()['checkouts']
+        with MysqlExecutor.scope() as connection:
+            MysqlExecutor.execute(insert_sql, [600, 'name600', 1])
+            self.assertEqual([{'id': 600}], MysqlExecutor.query_multi_rows(select_sql, [600]))
+            with MysqlExecutor.scope() as inner:
+                self.assertIs(connection, inner)
+                MysqlExecutor.transaction_execute([delete_sql], [[600]])
+            self.assertEqual(1, MySqlDBPool.pool_stats()['in_use'])
+
+            exe = MysqlExecutor()
+            exe.start_transaction()
+            exe.no_commit_execute(insert_sql, [601, 'name601', 1])
+            MysqlExecutor.execute(insert_sql, [602, 'name602', 1])  # 在exe的事务中执行
+            MysqlExecutor.execute_many(insert_sql, [[603, 'name603', 1]])
+            self.assertEqual(3, len(MysqlExecutor.query_multi_rows(select_sql, [600])))
+            exe.rollback()
+            self.assertEqual(0, len(MysqlExecutor.query_multi_rows(select_sql, [600])))
+
+            exe.start_transaction()
+            MysqlExecutor.execute(insert_sql, [604, 'name604', 1])
+            exe.commit()
+            exe.close()
+        self.assertEqual(checkouts + 1, MySqlDBPool.pool_stats()['checkouts'])
+        self.assertEqual(0, MySqlDBPool.pool_stats()['in_use'])
+        self.assertIsNone(MySqlDBPool.pinned())
+        self.assertEqual([{'id': 604}], MysqlExecutor.query_multi_rows(select_sql, [600]))
+        MysqlExecutor.execute(delete_sql, [600])
+
+    def test_9(self):
+        """
+        多语句包的批量执行和查询
+        """
+        insert_sql = "insert into {table} (id,name,age) value(%s,%s,%s)".format(table=self.table)
+        select_sql = "select id,name from {table} where id>=%s order by id".format(table=self.table)
+        count_sql = "select count(id) as total from {table} where id>=%s".format(table=self.table)
+        delete_sql = 'delete from {table} where id>=%s'.format(table=self.table)
+        with self.assertRaises(Exception):
+            MysqlExecutor.query_batch([(select_sql, [700])])
+
+        MySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool(), multi_statements=True)
+        try:
+            events = []
+            add_listener(events.append)
+            try:
+                MysqlExecutor.transaction_execute([insert_sql] * 3, [[700, 'a;b', 1], [701, "'", 1], [702, '%s', 1]],
+                                                  pipeline=True)
+                rows, count = MysqlExecutor.query_batch([(select_sql, [700]), (count_sql, [700])])
+            finally:
+                remove_listener(events.append)
+            self.assertEqual(['transaction', 'query_batch'], [e.kind for e in events])
+            self.assertEqual(3, events[0].rows)
+            self.assertEqual(['a;b', "'", '%s'], [row['name'] for row in rows])
+            self.assertEqual([{'total': 3}], list(count))
+
+            with self.assertRaises(BatchStatementError) as cm:
+                MysqlExecutor.transaction_execute([delete_sql, insert_sql, insert_sql],
+                                                  [[700], [703, 'name703', 1], [703, 'name703', 1]], pipeline=True)
+            self.assertEqual(2, cm.exception.index)
+            self.assertEqual(3, len(MysqlExecutor.query_multi_rows(select_sql, [700])))  # 已回滚
+
+            with self.assertRaises(BatchStatementError) as cm:
+                MysqlExecutor.query_batch([(select_sql, [700]), ('select * from mysqlstream.t_unknown', None),
+                                           (count_sql, [700])])
+            self.assertEqual(1, cm.exception.index)
+            self.assertEqual(1, len(cm.exception.results))
+            MysqlExecutor.execute(delete_sql, [700])
+        finally:
+            MySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool())
+
 
 if __name__ == '__main__':
     def suite():
         s = unittest.TestSuite()
         s.addTest(TestMysqlExecutor.test_1)
         s.addTest(TestMysqlExecutor.test_2)
+        s.addTest(TestMysqlExecutor.test_3)
+        s.addTest(TestMysqlExecutor.test_4)
+        s.addTest(TestMysqlExecutor.test_5)
+        s.addTest(TestMysqlExecutor.test_6)
+        s.addTest(TestMysqlExecutor.test_7)
+        s.addTest(TestMysqlExecutor.test_8)
+        s.addTest(TestMysqlExecutor.test_9)
         return s
 
     runner = unittest.TextTestRunner()
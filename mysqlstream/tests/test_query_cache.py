@@ -0,0 +1,92 @@
+# brief: query_cache的测试用例
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from mysqlstream.query_cache import QueryCache, read_tables, written_tables, normalize_sql
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_1(self):
+        self.assertEqual({'t_user', 'orders'},
+                         read_tables('select * from mysqlstream.`t_user` u join orders o on o.uid=u.id'))
+        self.assertEqual({'a', 'b'}, read_tables('select * from a x, b as y where x.id=y.id'))
+        self.assertEqual({'t_user'}, written_tables('insert into mysqlstream.t_user (id) value(%s)'))
+        self.assertEqual({'t', 's'}, written_tables('replace into t select * from s'))
+        self.assertEqual(set(), written_tables('set names utf8mb4'))
+        self.assertIsNone(written_tables('call refresh_all()'))
+        self.assertEqual("select a from t where b='x  y'", normalize_sql("select  a\n from t where b='x  y'"))
+
+        self.assertTrue(QueryCache.cacheable('select * from t_user'))
+        self.assertFalse(QueryCache.cacheable('select * from t_user for update'))
+        self.assertFalse(QueryCache.cacheable('select @@max_allowed_packet'))
+
+    def test_2(self):
+        cache = QueryCache()
+        sql = 'select * from t_user where id=%s'
+        key = cache.key_of(sql, [1])
+        self.assertEqual(key, cache.key_of('select *  from t_user\nwhere id=%s', (1,)))
+
+        rows = [{'id': 1}]
+        self.assertEqual(rows, cache.get_or_load(key, sql, lambda: rows))
+        result = cache.get_or_load(key, sql, lambda: None)
+        self.assertEqual(rows, result)
+        result[0]['id'] = 2  # 修改结果不影响缓存
+        self.assertEqual(rows, cache.get_or_load(key, sql, lambda: None))
+
+        cache.invalidate_sql('update orders set amount=1')
+        self.assertEqual(rows, cache.get_or_load(key, sql, lambda: None))
+        cache.invalidate_sql('update mysqlstream.t_user set age=1')
+        self.assertEqual([], cache.get_or_load(key, sql, lambda: []))
+        cache.invalidate_sql('call refresh_all()')
+        self.assertEqual(0, len(cache))
+
+    def test_3(self):
+        """
+        并发的相同查询只查询一次
+        """
+        cache = QueryCache()
+        sql = 'select * from t_user'
+        key = cache.key_of(sql, None)
+        calls = []
+        started = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return [(1,)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            first = executor.submit(cache.get_or_load, key, sql, loader)
+            started.wait()
+            others = [executor.submit(cache.get_or_load, key, sql, loader) for _ in range(3)]
+            results = [f.result() for f in [first] + others]
+        self.assertEqual([[(1,)]] * 4, results)
+        self.assertEqual(1, len(calls))
+
+    def test_4(self):
+        """
+        查询期间有写操作时不缓存，超出字节数时淘汰
+        """
+        cache = QueryCache()
+        sql = 'select * from t_user'
+        key = cache.key_of(sql, None)
+
+        def loader():
+            cache.invalidate_tables(['mysqlstream.t_user'])
+            return [(1,)]
+
+        cache.get_or_load(key, sql, loader)
+        self.assertEqual(0, len(cache))
+
+        cache = QueryCache(max_bytes=1000)
+        for i in range(20):
+            cache.get_or_load(cache.key_of(sql, [i]), sql, lambda: [(i, 'x' * 50)])
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+        self.assertGreater(cache.stats()['evictions'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# brief: session的测试用例
+import unittest
+from mysqlstream.tests.test_config import TestConfig
+from mysqlstream.tests.test_models import User
+from mysqlstream.instrumentation import add_listener, remove_listener
+from mysqlstream.mysql_db_pool import MySqlDBPool
+from mysqlstream.mysql_executor import MysqlExecutor
+from mysqlstream.session import Session
+
+
+class TestSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        MySqlDBPool.init_pool(1, 4, **TestConfig.cfg_for_mysql_db_pool())
+
+    def setUp(self) -> None:
+        for user in User().query_all():
+            User(id=user.id).delete()
+
+    def test_1(self):
+        events = []
+        add_listener(events.append)
+        try:
+            with Session(chunk_size=2) as session:
+                session.save_many([User(id=i, name=f'name{i}', age=i, urls={'i': i}) for i in range(1, 6)])
+                self.assertEqual(5, len(session))
+            self.assertEqual(0, len(session))
+            self.assertEqual(['checkout', 'no_commit_execute_many', 'commit'], [e.kind for e in events])
+
+            users = User().query_all(order_by='id')
+            del events[:]
+            with Session(chunk_size=2) as session:
+                for user in users[:3]:
+                    user.age = 10
+                    session.update(user)
+                users[3].name = 'new_name4'
+                users[3].urls['b'] = 2
+                session.update(users[3])
+                session.update(users[4])  # 没有修改
+                session.delete(User(id=5))
+                session.delete(User(id=5))
+            kinds = [e.kind for e in events]
+        finally:
+            remove_listener(events.append)
+        # age分为2个分块，name和urls一组，delete一条
+        self.assertEqual(['checkout'] + ['no_commit_execute'] * 4 + ['commit'], kinds)
+        self.assertEqual([], users[0]._changed_columns())
+
+        users = User().query_all(order_by='id')
+        self.assertEqual([1, 2, 3, 4], [u.id for u in users])
+        self.assertEqual([10, 10, 10, 4], [u.age for u in users])
+        self.assertEqual(('new_name4', {'i': 4, 'b': 2}), (users[3].name, users[3].urls))
+
+    def test_2(self):
+        """
+        出错时回滚所有的操作
+        """
+        User(id=1, name='name1', age=1, urls={}).save()
+        with self.assertRaises(Exception):
+            with Session() as session:
+                session.delete(User(id=1))
+                session.save(User(id=2, name='name2', age=2, urls={}))
+                session.save(User(id=2, name='name2', age=2, urls={}))  # 主键重复
+        self.assertEqual([1], [u.id for u in User().query_all()])
+        self.assertEqual(0, MySqlDBPool.pool_stats()['in_use'])
+
+        with self.assertRaises(ValueError):
+            with Session() as session:
+                session.save(User(id=3, name='name3', age=3, urls={}))
+                raise ValueError('discard')
+        self.assertEqual([1], [u.id for u in User().query_all()])
+        User(id=1).delete()
+
+    def test_3(self):
+        """
+        scope()的事务中使用Session时，Session使用保存点，由外层的事务提交或回滚
+        """
+        with MysqlExecutor.scope():
+            exe = MysqlExecutor()
+            exe.start_transaction()
+            User(id=1, name='name1', age=1, urls={}).save()
+            with Session() as session:
+                session.save(User(id=2, name='name2', age=2, urls={}))
+            with self.assertRaises(Exception):
+                with Session() as session:
+                    session.delete(User(id=2))
+                    session.save(User(id=1, name='name1', age=1, urls={}))  # 主键重复，回滚到保存点
+            self.assertEqual([1, 2], [u.id for u in User().query_all(order_by='id')])
+            exe.rollback()  # 外层的事务回滚时Session的写入也被回滚
+            exe.close()
+        self.assertEqual([], User().query_all())
+        self.assertEqual(0, MySqlDBPool.pool_stats()['in_use'])
+
+
+if __name__ == '__main__':
+    unittest.main()
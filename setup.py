@@ -10,8 +10,15 @@ setup(
     url="https://github.com/streamDream/mysql-stream",
     keywords=['mysql', 'client', 'orm'],
     classifiers=[],
+    python_requires='>=3.7',
     install_requires=[
         'dbutils',
         'PyMySQL',
-    ]
+    ],
+    extras_require={
+        'async': ['aiomysql'],
+        'numpy': ['numpy'],
+        'orjson': ['orjson'],
+        'msgpack': ['msgpack'],
+    }
 )